@@ -17,11 +17,22 @@ SRC_DIR = PROJECT_ROOT / "src"
 OPENDOTA_API_KEY = os.environ.get('OPENDOTA_API_KEY', None)
 API_DELAY = float(os.environ.get('API_DELAY', '2.0'))  # Rate limiting delay
 MIN_RANK = int(os.environ.get('MIN_RANK', '5'))  # 5=Ancient, 6=Divine, 7=Immortal
+API_CONCURRENCY = int(os.environ.get('API_CONCURRENCY', '4'))  # Match detail requests in flight
+API_RATE_LIMIT = float(os.environ['API_RATE_LIMIT']) if os.environ.get('API_RATE_LIMIT') else None  # Starting requests/second
+API_MAX_RATE = float(os.environ['API_MAX_RATE']) if os.environ.get('API_MAX_RATE') else None  # Ceiling for the adaptive rate
+API_MAX_RETRIES = int(os.environ.get('API_MAX_RETRIES', '5'))  # Retries on 429/5xx and connection errors
+API_POOL_SIZE = int(os.environ['API_POOL_SIZE']) if os.environ.get('API_POOL_SIZE') else None  # Keep-alive connections (default: API_CONCURRENCY)
+API_CONNECT_TIMEOUT = float(os.environ.get('API_CONNECT_TIMEOUT', '5.0'))
+API_READ_TIMEOUT = float(os.environ.get('API_READ_TIMEOUT', '30.0'))
 
 # Data collection settings
 DEFAULT_NUM_MATCHES = int(os.environ.get('NUM_MATCHES', '500'))
 MIN_ITEMS_PER_PLAYER = int(os.environ.get('MIN_ITEMS', '3'))
 MIN_GPM_THRESHOLD = int(os.environ.get('MIN_GPM', '400'))
+DEDUP_THRESHOLD = float(os.environ.get('DEDUP_THRESHOLD', '0.8'))  # Jaccard similarity for near-duplicate pairs
+AGGREGATE_BUILDS = os.environ.get('AGGREGATE_BUILDS', 'false').lower() == 'true'  # One build example per hero/matchup
+BUILD_MIN_GAMES = int(os.environ.get('BUILD_MIN_GAMES', '10'))  # Games a hero needs for an aggregated build example
+MATCHUP_MIN_GAMES = int(os.environ.get('MATCHUP_MIN_GAMES', '20'))  # Games a hero-vs-enemy matchup needs
 
 # Model training configuration
 MODEL_NAME = os.environ.get('MODEL_NAME', "mistralai/Mistral-Nemo-Instruct-2407")
@@ -31,17 +42,48 @@ BATCH_SIZE = int(os.environ.get('BATCH_SIZE', '4'))
 GRADIENT_ACCUMULATION_STEPS = int(os.environ.get('GRADIENT_ACCUMULATION_STEPS', '4'))
 NUM_EPOCHS = int(os.environ.get('NUM_EPOCHS', '6'))
 WARMUP_STEPS = int(os.environ.get('WARMUP_STEPS', '100'))
+PACKING = os.environ.get('PACKING', 'false').lower() == 'true'  # Pack short examples into MAX_LENGTH rows
+GROUP_BY_LENGTH = os.environ.get('GROUP_BY_LENGTH', 'false').lower() == 'true'  # Batch examples of similar length
+COMPLETION_ONLY_LOSS = os.environ.get('COMPLETION_ONLY_LOSS', 'false').lower() == 'true'  # Loss on responses only
+CHAT_TEMPLATE_FILE = MODELS_DIR / "mistral-nemo-dota2" / "chat_template.jinja"  # Shared by training and inference
+THROUGHPUT_METRICS = os.environ.get('THROUGHPUT_METRICS', 'true').lower() == 'true'  # Per-step throughput.jsonl/.csv
+SAVE_STEPS = int(os.environ.get('SAVE_STEPS', '100'))  # Checkpoint every N optimizer steps
+SAVE_TOTAL_LIMIT = int(os.environ.get('SAVE_TOTAL_LIMIT', '2'))  # Checkpoints kept in the output directory
+SAVE_EVERY_MINUTES = float(os.environ.get('SAVE_EVERY_MINUTES', '0'))  # Also checkpoint on a timer (0 = off)
 
 # LoRA configuration for efficient fine-tuning (increased for stronger adaptation)
-LORA_R = 64
-LORA_ALPHA = 128
-LORA_DROPOUT = 0.1
+LORA_R = int(os.environ.get('LORA_R', '64'))
+LORA_ALPHA = int(os.environ.get('LORA_ALPHA', '128'))
+LORA_DROPOUT = float(os.environ.get('LORA_DROPOUT', '0.1'))
 LORA_TARGET_MODULES = os.environ.get('LORA_TARGET_MODULES', 'c_attn,c_proj,c_fc').split(',')
 
+# Inference prompts
+SYSTEM_PROMPT = os.environ.get('SYSTEM_PROMPT', '')  # Optional instructions placed before every question
+PREFIX_CACHE = os.environ.get('PREFIX_CACHE', 'true').lower() == 'true'  # Reuse the shared prompt prefix's KV cache
+CHAT_MAX_CONTEXT = int(os.environ.get('CHAT_MAX_CONTEXT', '4096'))  # Interactive conversation tokens kept, incl. the answer
+
+# Inference server (scripts/run_inference.py --serve)
+INFERENCE_HOST = os.environ.get('INFERENCE_HOST', '127.0.0.1')
+INFERENCE_PORT = int(os.environ.get('INFERENCE_PORT', '8000'))
+INFERENCE_MAX_BATCH_SIZE = int(os.environ.get('INFERENCE_MAX_BATCH_SIZE', '16'))  # Requests decoded together
+INFERENCE_MAX_NEW_TOKENS = int(os.environ.get('INFERENCE_MAX_NEW_TOKENS', '1024'))  # Cap on a request's max_new_tokens
+RESPONSE_CACHE = os.environ.get('RESPONSE_CACHE', 'true').lower() == 'true'  # Reuse answers to repeated questions
+RESPONSE_CACHE_SIZE = int(os.environ.get('RESPONSE_CACHE_SIZE', '1024'))
+RESPONSE_CACHE_TTL = int(os.environ.get('RESPONSE_CACHE_TTL', '86400'))  # Seconds; 0 keeps answers forever
+RESPONSE_CACHE_EMBEDDING_MODEL = os.environ.get('RESPONSE_CACHE_EMBEDDING_MODEL', '')  # Enables similar-question hits
+RESPONSE_CACHE_SIMILARITY = float(os.environ.get('RESPONSE_CACHE_SIMILARITY', '0.92'))
+
 # Training data files
 TRAINING_DATA_FILE = DATA_DIR / "final_ultimate_coach.jsonl"
+DATASET_CACHE_DIR = Path(os.environ.get('DATASET_CACHE_DIR', DATA_DIR / "tokenized"))  # Pre-tokenized datasets
 HEROES_DATA_FILE = DATA_DIR / "heroes.json"
 ITEMS_DATA_FILE = DATA_DIR / "items.json"
+CONSTANTS_MAX_AGE_DAYS = float(os.environ.get('CONSTANTS_MAX_AGE_DAYS', '7'))  # Revalidate heroes/items after this
+CRAWL_CURSOR_FILE = DATA_DIR / "crawl_cursor.json"
+MATCH_CACHE_FILE = Path(os.environ.get('MATCH_CACHE_FILE', DATA_DIR / "match_cache.sqlite"))
+SHARD_DIR = Path(os.environ.get('SHARD_DIR', DATA_DIR / "shards"))
+# Match IDs covered by a sharded crawl, counting down from the newest match
+SHARD_ID_SPAN = int(os.environ.get('SHARD_ID_SPAN', '5000000'))
 
 # Ensure directories exist
 DATA_DIR.mkdir(exist_ok=True)
@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+"""
+CPU smoke benchmark of the training pipeline with a tiny random model
+Usage: python scripts/benchmark_training.py [--data PATH] [--samples N] [--steps N] [--json PATH]
+"""
+
+import argparse
+import json
+import sys
+from pathlib import Path
+
+# Add project root to path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+import torch
+from src.model_training import DotaModelTrainer
+from src.training_benchmark import BENCHMARK_LORA_MODULES, print_benchmark_report, run_training_benchmark
+import config
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the training data path and steps on CPU")
+    parser.add_argument("--data", type=str, default=str(config.TRAINING_DATA_FILE),
+                       help="Training data file to sample from")
+    parser.add_argument("--tokenizer", type=str, default=str(config.MODELS_DIR / "mistral-nemo-dota2"),
+                       help="Tokenizer to benchmark with (the saved adapter directory needs no download)")
+    parser.add_argument("--samples", type=int, default=256,
+                       help="Examples sampled from --data")
+    parser.add_argument("--steps", type=int, default=20,
+                       help="Training steps to run")
+    parser.add_argument("--batch-size", type=int, default=config.BATCH_SIZE,
+                       help="Per-device batch size")
+    parser.add_argument("--packing", action=argparse.BooleanOptionalAction, default=config.PACKING,
+                       help="Pack the sampled examples into MAX_LENGTH rows")
+    parser.add_argument("--group-by-length", action=argparse.BooleanOptionalAction, default=config.GROUP_BY_LENGTH,
+                       help="Batch examples of similar token length together")
+    parser.add_argument("--completion-only", action=argparse.BooleanOptionalAction, default=config.COMPLETION_ONLY_LOSS,
+                       help="Tokenize with the chat template and response-only labels")
+    parser.add_argument("--hidden-size", type=int, default=128,
+                       help="Width of the random benchmark model")
+    parser.add_argument("--layers", type=int, default=2,
+                       help="Decoder layers of the random benchmark model")
+    parser.add_argument("--threads", type=int, default=None,
+                       help="Torch CPU threads (pin this for comparable CI numbers)")
+    parser.add_argument("--seed", type=int, default=0,
+                       help="Seed for sampling, model initialization and training")
+    parser.add_argument("--work-dir", type=str, default=None,
+                       help="Keep the sample, tokenized cache and throughput.jsonl here (default: temporary)")
+    parser.add_argument("--json", type=str, default=None,
+                       help="Also write the report as JSON (for comparing CI runs)")
+    
+    args = parser.parse_args()
+    
+    if not Path(args.data).exists():
+        print(f"Error: Training data not found at {args.data}")
+        return 1
+    if args.threads:
+        torch.set_num_threads(args.threads)
+    
+    trainer = DotaModelTrainer(model_name=args.tokenizer, completion_only=args.completion_only)
+    trainer.setup_benchmark_model(hidden_size=args.hidden_size, num_layers=args.layers)
+    trainer.setup_lora(target_modules=BENCHMARK_LORA_MODULES)
+    
+    report = run_training_benchmark(trainer, args.data, num_samples=args.samples, steps=args.steps,
+                                    batch_size=args.batch_size, packing=args.packing,
+                                    group_by_length=args.group_by_length, seed=args.seed,
+                                    work_dir=args.work_dir)
+    print_benchmark_report(report)
+    
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+        print(f"Report written to {args.json}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,10 +1,11 @@
 #!/usr/bin/env python3
 """
 Script to collect Dota 2 training data from OpenDota API
-Usage: python scripts/collect_data.py [--matches NUM] [--api-key KEY]
+Usage: python scripts/collect_data.py [--matches NUM] [--api-key KEY] [--from-cache] [--workers N]
 """
 
 import argparse
+import json
 import sys
 from pathlib import Path
 
@@ -12,6 +13,11 @@ from pathlib import Path
 sys.path.insert(0, str(Path(__file__).parent.parent))
 
 from src.data_collection import OpenDotaCollector, TrainingDataGenerator
+from src.game_constants import GameConstantsCache
+from src.match_cache import MatchCache
+from src.match_crawler import MatchCrawler
+from src.meta_aggregate import MetaAggregate
+from src.sharded_collection import load_plan, merge_shards, plan_shards, run_shard, run_shards, save_plan
 import config
 
 def main():
@@ -20,49 +26,238 @@ def main():
                        help="Number of matches to process")
     parser.add_argument("--api-key", type=str, default=config.OPENDOTA_API_KEY,
                        help="OpenDota API key")
-    parser.add_argument("--output", type=str, default=str(config.TRAINING_DATA_FILE),
-                       help="Output file path")
+    parser.add_argument("--output", type=str, default=None,
+                       help=f"Output file path (default: {config.TRAINING_DATA_FILE})")
     parser.add_argument("--delay", type=float, default=config.API_DELAY,
                        help="Delay between API requests")
+    parser.add_argument("--concurrency", type=int, default=config.API_CONCURRENCY,
+                       help="Number of match detail requests kept in flight")
+    parser.add_argument("--rate-limit", type=float, default=config.API_RATE_LIMIT,
+                       help="Starting requests per second (default: 1/delay)")
+    parser.add_argument("--max-rate", type=float, default=config.API_MAX_RATE,
+                       help="Ceiling for the adaptive request rate (default: starting rate, higher with an API key)")
+    parser.add_argument("--max-retries", type=int, default=config.API_MAX_RETRIES,
+                       help="Retries for rate-limited (429) and server-error responses")
+    parser.add_argument("--pool-size", type=int, default=config.API_POOL_SIZE,
+                       help="Keep-alive HTTP connections to keep open (default: --concurrency)")
+    parser.add_argument("--timeout", type=float, nargs=2, metavar=("CONNECT", "READ"),
+                       default=[config.API_CONNECT_TIMEOUT, config.API_READ_TIMEOUT],
+                       help="Connect and read timeouts in seconds")
+    parser.add_argument("--cache", type=str, default=str(config.MATCH_CACHE_FILE),
+                       help="Path to the local match cache")
+    parser.add_argument("--no-cache", action="store_true",
+                       help="Always fetch match details from the API")
+    parser.add_argument("--from-cache", action="store_true",
+                       help="Rebuild training data from cached matches only (no match API calls)")
+    parser.add_argument("--patch", type=int, default=None,
+                       help="With --from-cache, only use matches from this patch ID")
+    parser.add_argument("--batch-size", type=int, default=1000,
+                       help="With --from-cache, matches analyzed per vectorized batch")
+    parser.add_argument("--min-rank", type=int, default=config.MIN_RANK,
+                       help="Minimum skill rank (5=Ancient, 6=Divine, 7=Immortal)")
+    parser.add_argument("--cursor", type=str, default=str(config.CRAWL_CURSOR_FILE),
+                       help="Resume cursor file for the publicMatches crawl")
+    parser.add_argument("--fresh", action="store_true",
+                       help="Restart the crawl from the newest matches (already seen matches are still skipped)")
+    parser.add_argument("--overwrite", action="store_true",
+                       help="Start a new output file instead of appending to an earlier (possibly interrupted) run")
+    parser.add_argument("--fsync-every", type=int, default=50,
+                       help="Checkpoint the output to disk every N matches (0 = only at the end)")
+    parser.add_argument("--merge-meta", type=str, nargs="+", default=None,
+                       help="Merge saved *.meta.npz aggregates and write only meta examples to --output "
+                            "(required here, since the file is overwritten)")
+    parser.add_argument("--aggregate-builds", action=argparse.BooleanOptionalAction, default=config.AGGREGATE_BUILDS,
+                       help="Write one build example per hero and matchup instead of one per player per match")
+    parser.add_argument("--workers", type=int, default=None,
+                       help="Collect with N worker processes over disjoint match-ID shards, then merge into --output")
+    parser.add_argument("--api-keys", type=str, default=None,
+                       help="Comma-separated API keys assigned to shards round-robin (default: --api-key)")
+    parser.add_argument("--shard", type=int, default=None,
+                       help="Run (or resume) only this shard of the saved plan")
+    parser.add_argument("--merge-only", action="store_true",
+                       help="Merge existing shard outputs into --output without collecting")
+    parser.add_argument("--shard-dir", type=str, default=str(config.SHARD_DIR),
+                       help="Directory for shard outputs, cursors and the shard plan")
+    parser.add_argument("--start-match-id", type=int, default=None,
+                       help="Upper (exclusive) match ID of a new shard plan (default: newest public match)")
+    parser.add_argument("--id-span", type=int, default=config.SHARD_ID_SPAN,
+                       help="Match IDs covered by a new shard plan, counting down from --start-match-id")
     
     args = parser.parse_args()
+    if args.fsync_every < 0:
+        parser.error("--fsync-every must be 0 or more")
+    
+    # Regenerate meta examples from saved aggregates (no match data, API or network needed)
+    if args.merge_meta:
+        if args.output is None:
+            parser.error("--merge-meta overwrites --output with meta examples only; pass --output explicitly")
+        return merge_meta(args.merge_meta, args.output)
+    args.output = args.output or str(config.TRAINING_DATA_FILE)
     
     print("=== Dota 2 LLM Data Collection ===")
     print(f"Target matches: {args.matches}")
     print(f"API Key: {'Yes' if args.api_key else 'No (Free tier)'}")
     print(f"Output file: {args.output}")
     
-    # Initialize collector
-    collector = OpenDotaCollector(api_key=args.api_key, delay=args.delay)
+    # Open the local match cache
+    cache = None
+    if not args.no_cache:
+        cache = MatchCache(args.cache)
+        print(f"Match cache: {args.cache} ({len(cache)} matches)")
     
-    # Test API connection
-    print("\nTesting API connection...")
-    test_heroes = collector.get_heroes()
-    if not test_heroes:
-        print("Failed to connect to OpenDota API")
-        return 1
-    print(f"✓ Connected successfully, found {len(test_heroes)} heroes")
+    # Initialize collector
+    collector = OpenDotaCollector(api_key=args.api_key, delay=args.delay,
+                                  max_concurrency=args.concurrency, rate_limit=args.rate_limit,
+                                  cache=cache, max_rate=args.max_rate, max_retries=args.max_retries,
+                                  pool_size=args.pool_size, connect_timeout=args.timeout[0],
+                                  read_timeout=args.timeout[1])
     
-    # Initialize data generator
+    # Initialize data generator (game constants come from disk unless stale)
     generator = TrainingDataGenerator(collector)
+    if not generator.heroes:
+        print("Failed to load game constants from cache or OpenDota API")
+        return 1
     
-    # Collect training data
-    print(f"\nStarting data collection...")
-    training_data = generator.collect_training_data(args.matches)
+    # Sharded multi-process collection
+    if args.workers or args.shard is not None or args.merge_only:
+        return run_sharded(args, collector, generator, cache)
     
-    if training_data:
-        # Save the data
-        generator.save_training_data(training_data, args.output)
+    # Collect training data, streaming it to disk as matches are analyzed
+    if args.from_cache:
+        if cache is None:
+            print("--from-cache cannot be combined with --no-cache")
+            return 1
+        print(f"\nRebuilding training data from the match cache...")
+        matches = cache.iter_matches(patch=args.patch)
+        crawler = None
+        resume = False
+        batch_size = args.batch_size
+    else:
+        crawler = MatchCrawler(collector, cursor_path=args.cursor, min_rank=args.min_rank)
+        if args.fresh:
+            crawler.reset()
+        
+        resume = not args.overwrite
+        
+        # The meta aggregate is saved with every checkpoint, so it counts the matches an
+        # interrupted run already has on disk; only the rest are fetched again
+        aggregate_path = Path(args.output).with_name(Path(args.output).name + '.meta.npz')
+        collected = MetaAggregate.load(aggregate_path).num_matches if resume and aggregate_path.exists() else 0
+        remaining = max(0, args.matches - collected)
+        if collected:
+            print(f"Resuming {args.output}: {collected} matches already collected, {remaining} still to collect")
         
+        print(f"\nStarting data collection...")
+        matches = generator.iter_match_details(remaining, crawler=crawler)
+        batch_size = 1
+    
+    total_examples = generator.stream_training_data(matches, args.output, resume=resume,
+                                                    fsync_every=args.fsync_every,
+                                                    batch_size=batch_size,
+                                                    aggregate_builds=args.aggregate_builds,
+                                                    crawler=crawler)
+    
+    if total_examples:
         # Show sample data
         print(f"\nSample training examples:")
-        for i, example in enumerate(training_data[:3]):
-            print(f"\n--- Example {i+1} ---")
-            print(f"Q: {example['instruction']}")
-            print(f"A: {example['output'][:100]}...")
+        with open(args.output, 'r', encoding='utf-8') as f:
+            for i, line in zip(range(3), f):
+                example = json.loads(line)
+                print(f"\n--- Example {i+1} ---")
+                print(f"Q: {example['instruction']}")
+                print(f"A: {example['output'][:100]}...")
+    
+    print_latency(collector)
+    
+    print(f"\n=== Data Collection Complete ===")
+    print(f"Generated {total_examples} training examples")
+    return 0
+
+def merge_meta(aggregate_paths, output_path):
+    """Write meta examples for merged aggregates using only the constants cached on disk"""
+    constants = GameConstantsCache(None, config.HEROES_DATA_FILE, config.ITEMS_DATA_FILE)
+    generator = TrainingDataGenerator(None, constants=constants)
+    if not generator.heroes:
+        print("No cached game constants; heroes will be named by ID")
+    
+    aggregate = MetaAggregate.load_merged(aggregate_paths)
+    aggregate.save(Path(output_path).with_name(Path(output_path).name + '.meta.npz'))
+    print(f"\nMerged {len(aggregate_paths)} aggregates covering {aggregate.num_matches} matches")
+    meta_examples = generator.write_meta_examples(aggregate, output_path)
+    print(f"\n=== Data Collection Complete ===")
+    print(f"Generated {len(meta_examples)} training examples")
+    return 0
+
+def print_latency(collector):
+    """Show where request time went"""
+    latency = collector.latency_summary()
+    if latency['requests']:
+        print(f"\nAPI requests: {latency['requests']} over {latency['connections_opened']} connections")
+        print(f"Wait for response (incl. connect): mean {latency['wait_ms']['mean']:.0f}ms, "
+              f"p95 {latency['wait_ms']['p95']:.0f}ms")
+        print(f"Body transfer: mean {latency['transfer_ms']['mean']:.0f}ms, "
+              f"p95 {latency['transfer_ms']['p95']:.0f}ms")
+
+def run_sharded(args, collector, generator, cache):
+    """Plan, run and merge a sharded multi-process collection"""
+    api_keys = args.api_keys.split(',') if args.api_keys else ([args.api_key] if args.api_key else None)
+    cache_path = None if cache is None else args.cache
+    
+    plan = load_plan(args.shard_dir)
+    if plan is None:
+        if args.merge_only or args.shard is not None:
+            print(f"No shard plan in {args.shard_dir}; start one with --workers N")
+            return 1
+        
+        upper_match_id = args.start_match_id
+        if upper_match_id is None:
+            newest = collector.get_recent_matches(min_rank=args.min_rank)
+            if not newest:
+                print("Could not fetch recent matches to anchor the shard plan")
+                return 1
+            upper_match_id = max(match['match_id'] for match in newest) + 1
+        
+        # Shards sharing a key split its rate; the free tier counts as one key
+        per_key_rate = args.rate_limit or (1.0 / args.delay if args.delay else None)
+        shards = plan_shards(upper_match_id, max(0, upper_match_id - args.id_span), args.workers,
+                             args.matches, api_keys=api_keys, rate_limit=per_key_rate,
+                             delay=args.delay, max_concurrency=args.concurrency,
+                             max_rate=args.max_rate, max_retries=args.max_retries,
+                             pool_size=args.pool_size, connect_timeout=args.timeout[0],
+                             read_timeout=args.timeout[1])
+        save_plan(args.shard_dir, shards, args.min_rank, aggregate_builds=args.aggregate_builds)
+        plan = load_plan(args.shard_dir)
+        print(f"Planned {len(shards)} shards over match IDs [{shards[-1]['lower_match_id']}, {upper_match_id})")
+    else:
+        print(f"Reusing shard plan in {args.shard_dir} ({len(plan['shards'])} shards)")
+    # Every shard of a plan must count builds the same way, so the plan's setting wins
+    aggregate_builds = plan.get('aggregate_builds', False)
+    if aggregate_builds != args.aggregate_builds:
+        print(f"Shard plan was started {'with' if aggregate_builds else 'without'} --aggregate-builds; "
+              f"keeping that for its shards")
+    
+    if args.shard is not None:
+        shards = [shard for shard in plan['shards'] if shard['index'] == args.shard]
+        if not shards:
+            print(f"Shard {args.shard} is not in the plan")
+            return 1
+        index, total = run_shard(shards[0], args.shard_dir, plan['min_rank'], api_keys=api_keys,
+                                 cache_path=cache_path, fsync_every=args.fsync_every,
+                                 aggregate_builds=aggregate_builds)
+        print(f"\n[shard {index}] has {total} training examples")
+        return 0
+    
+    if not args.merge_only:
+        if cache is not None:
+            cache.close()  # Workers open their own connections
+        run_shards(plan['shards'], args.shard_dir, plan['min_rank'], api_keys=api_keys,
+                   cache_path=cache_path, fsync_every=args.fsync_every, max_workers=args.workers,
+                   aggregate_builds=aggregate_builds)
+    
+    total_examples, _ = merge_shards(args.shard_dir, args.output, generator)
     
     print(f"\n=== Data Collection Complete ===")
-    print(f"Generated {len(training_data)} training examples")
+    print(f"Generated {total_examples} training examples")
     return 0
 
 if __name__ == "__main__":
@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+"""
+Script to remove exact and near-duplicate training pairs before training
+Usage: python scripts/dedup_data.py [--input PATH] [--output PATH] [--threshold 0.8]
+"""
+
+import argparse
+import json
+import sys
+import time
+from pathlib import Path
+
+# Add project root to path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from src.dedup import MinHashDeduplicator, deduplicate
+from src.streaming_writer import JsonlWriter
+import config
+
+def iter_jsonl(path):
+    """Yield records from a JSONL file one at a time"""
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+def main():
+    parser = argparse.ArgumentParser(description="Deduplicate Dota 2 training data")
+    parser.add_argument("--input", type=str, default=str(config.TRAINING_DATA_FILE),
+                       help="Training data to deduplicate")
+    parser.add_argument("--output", type=str, default=None,
+                       help="Deduplicated output (default: <input>.dedup.jsonl)")
+    parser.add_argument("--threshold", type=float, default=config.DEDUP_THRESHOLD,
+                       help="Estimated Jaccard similarity at which pairs count as near duplicates")
+    parser.add_argument("--num-perm", type=int, default=64,
+                       help="MinHash permutations per pair")
+    parser.add_argument("--bands", type=int, default=16,
+                       help="LSH bands (more bands catch more near duplicates, with more candidate checks)")
+    parser.add_argument("--keep-numbers", action="store_true",
+                       help="Treat pairs that differ only in numbers (GPM, durations, ...) as distinct")
+    parser.add_argument("--tokenizer", type=str, default=None,
+                       help="Count savings in this tokenizer's tokens instead of words (e.g. models/mistral-nemo-dota2)")
+    
+    args = parser.parse_args()
+    output = args.output or str(Path(args.input).with_suffix('.dedup.jsonl'))
+    
+    if not Path(args.input).exists():
+        print(f"Error: Training data not found at {args.input}")
+        return 1
+    
+    count_tokens = None
+    unit = "words"
+    if args.tokenizer:
+        from transformers import AutoTokenizer
+        tokenizer = AutoTokenizer.from_pretrained(args.tokenizer)
+        count_tokens = lambda text: len(tokenizer(text, add_special_tokens=False)["input_ids"])
+        unit = "tokens"
+    
+    print("=== Dota 2 Training Data Deduplication ===")
+    print(f"Input: {args.input}")
+    print(f"Output: {output}")
+    print(f"Near-duplicate threshold: {args.threshold}")
+    
+    deduplicator = MinHashDeduplicator(threshold=args.threshold, num_perm=args.num_perm, bands=args.bands,
+                                       mask_numbers=not args.keep_numbers)
+    start = time.time()
+    with JsonlWriter(output, fsync_every=10000) as writer:
+        for example in deduplicate(iter_jsonl(args.input), deduplicator, count_tokens):
+            writer.write(example)
+    elapsed = time.time() - start
+    
+    stats = deduplicator.stats
+    total_tokens = stats['tokens_kept'] + stats['tokens_removed']
+    print(f"\nProcessed {stats['seen']} pairs in {elapsed:.1f}s ({stats['seen'] / max(elapsed, 1e-9):.0f} pairs/sec)")
+    print(f"Exact duplicates removed: {stats['exact_duplicates']}")
+    print(f"Near duplicates removed: {stats['near_duplicates']}")
+    print(f"Kept {stats['kept']} pairs")
+    print(f"{unit.capitalize()}: {total_tokens} -> {stats['tokens_kept']} "
+          f"({stats['tokens_removed'] / max(total_tokens, 1):.1%} saved per epoch)")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
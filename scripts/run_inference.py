@@ -1,101 +1,88 @@
 #!/usr/bin/env python3
 """
 Script to run inference with the trained Dota 2 model
-Usage: python scripts/run_inference.py [--model PATH] [--question "Your question"]
+Usage: python scripts/run_inference.py [--model PATH] [--question "Your question"] [--serve] [--load-test URL]
 """
 
 import argparse
-import torch
-from transformers import AutoTokenizer, AutoModelForCausalLM, BitsAndBytesConfig
-from peft import PeftModel
 import sys
 from pathlib import Path
 
 # Add project root to path
 sys.path.insert(0, str(Path(__file__).parent.parent))
 import config
+from src.chat_session import ChatSession, format_timings, load_chat_template
+from src.inference import ask_question, load_trained_model, stream_question
+from src.inference_server import create_server, print_load_test, run_load_test
+from src.prefix_cache import PromptPrefixCache
+from src.response_cache import create_response_cache
 
-def load_trained_model(model_path):
-    """Load the fine-tuned model"""
-    print(f"Loading base model: {config.MODEL_NAME}")
-    
-    # Load base model and tokenizer
-    tokenizer = AutoTokenizer.from_pretrained(config.MODEL_NAME)
-    tokenizer.pad_token = tokenizer.eos_token
-    
-    # Setup quantization for faster inference
-    bnb_config = BitsAndBytesConfig(
-        load_in_4bit=True,
-        bnb_4bit_quant_type="nf4",
-        bnb_4bit_compute_dtype=torch.float16,
-        bnb_4bit_use_double_quant=True,
-    )
-    
-    base_model = AutoModelForCausalLM.from_pretrained(
-        config.MODEL_NAME,
-        quantization_config=bnb_config,
-        torch_dtype=torch.float16,
-        device_map="auto"
-    )
-    
-    print(f"Loading LoRA adapters from: {model_path}")
-    # Load LoRA adapters
-    model = PeftModel.from_pretrained(base_model, model_path)
-    
-    return model, tokenizer
-
-def ask_question(model, tokenizer, question):
-    """Ask the model a Dota 2 question"""
-    # Add context to clarify Dota 2 terminology and focus
-    if "bot lane" in question.lower():
-        question = question.replace("bot lane", "safe lane carry position")
-    elif "top lane" in question.lower():
-        question = question.replace("top lane", "offlane position") 
-    elif "mid lane" in question.lower():
-        question = question.replace("mid lane", "mid position")
-    
-    # Format question using Mistral's instruction format with implicit Dota 2 context
-    prompt = f"[INST] {question} (This is about Dota 2) [/INST]"
-    
-    # Tokenize
-    inputs = tokenizer(
-        prompt, 
-        return_tensors="pt", 
-        truncation=True,
-        max_length=1024
-    ).to(model.device)
-    
-    # Generate response
-    with torch.no_grad():
-        outputs = model.generate(
-            **inputs,
-            max_new_tokens=256,
-            temperature=0.7,
-            do_sample=True,
-            top_p=0.9,
-            pad_token_id=tokenizer.eos_token_id,
-            repetition_penalty=1.1
-        )
-    
-    # Decode response
-    response = tokenizer.decode(outputs[0], skip_special_tokens=True)
-    
-    # Extract just the model's response (after [/INST])
-    if "[/INST]" in response:
-        response = response.split("[/INST]")[-1].strip()
-    
-    return response
+LOAD_TEST_QUESTIONS = [
+    "What items should I build on Pudge?",
+    "How do I play Anti-Mage effectively?",
+    "What is the current meta for bot lane in Dota 2?",
+    "When should I buy BKB?",
+    "How do I improve my last hitting?",
+    "What items should I build on Invoker against Pudge, Anti-Mage, Crystal Maiden?",
+]
+
+def answer(model, tokenizer, question, stream, cache=None, prefix_cache=None):
+    """Print the model's answer, token by token when streaming"""
+    cached = cache.get(question) if cache is not None else None
+    if cached is not None:
+        print(f"A: {cached}")
+        return
+    if not stream:
+        response = ask_question(model, tokenizer, question, prefix_cache)
+        print(f"A: {response}")
+    else:
+        print("A: ", end="", flush=True)
+        chunks = []
+        for text in stream_question(model, tokenizer, question, prefix_cache):
+            chunks.append(text)
+            print(text, end="", flush=True)
+        print()
+        response = "".join(chunks)
+    if cache is not None:
+        cache.put(question, response)
 
 def main():
     parser = argparse.ArgumentParser(description="Run Dota 2 LLM inference")
-    parser.add_argument("--model", type=str, 
+    parser.add_argument("--model", type=str,
                        default=str(config.MODELS_DIR / "mistral-nemo-dota2"),
                        help="Path to trained model directory")
-    parser.add_argument("--question", type=str, 
+    parser.add_argument("--question", type=str,
                        help="Question to ask the model")
-    
+    parser.add_argument("--stream", action=argparse.BooleanOptionalAction, default=True,
+                       help="Print answers as they are generated")
+    parser.add_argument("--chat", action=argparse.BooleanOptionalAction, default=True,
+                       help="Interactive mode keeps the conversation so follow-up questions have context")
+    parser.add_argument("--cache", action=argparse.BooleanOptionalAction, default=config.RESPONSE_CACHE,
+                       help="Answer repeated questions from the response cache")
+    parser.add_argument("--prefix-cache", action=argparse.BooleanOptionalAction, default=config.PREFIX_CACHE,
+                       help="Compute the shared prompt prefix once and reuse its KV cache")
+    parser.add_argument("--serve", action="store_true",
+                       help="Run an HTTP server that batches concurrent requests")
+    parser.add_argument("--host", type=str, default=config.INFERENCE_HOST,
+                       help="Address for --serve")
+    parser.add_argument("--port", type=int, default=config.INFERENCE_PORT,
+                       help="Port for --serve")
+    parser.add_argument("--max-batch-size", type=int, default=config.INFERENCE_MAX_BATCH_SIZE,
+                       help="Requests decoded together by the server")
+    parser.add_argument("--load-test", type=str, default=None, metavar="URL",
+                       help="Send concurrent requests to a running server instead of loading a model")
+    parser.add_argument("--users", type=int, default=32,
+                       help="Concurrent users for --load-test")
+    parser.add_argument("--requests", type=int, default=None,
+                       help="Total requests for --load-test (default: one per user)")
+
     args = parser.parse_args()
-    
+
+    if args.load_test:
+        print_load_test(run_load_test(args.load_test.rstrip('/'), LOAD_TEST_QUESTIONS,
+                                      concurrency=args.users, num_requests=args.requests))
+        return 0
+
     # Load the trained model
     try:
         model, tokenizer = load_trained_model(args.model)
@@ -103,37 +90,73 @@ def main():
     except Exception as e:
         print(f"✗ Failed to load model: {e}")
         return 1
-    
-    if args.question:
+
+    load_chat_template(tokenizer, args.model)
+    cache = create_response_cache(args.cache)
+    # Every prompt starts with the same [INST] scaffold and system prompt
+    prefix_cache = PromptPrefixCache(model, tokenizer) if args.prefix_cache else None
+
+    if args.serve:
+        # Long-lived service; concurrent requests share batched decode steps
+        server = create_server(model, tokenizer, args.host, args.port, max_batch_size=args.max_batch_size,
+                               cache=cache, prefix_cache=prefix_cache,
+                               max_new_tokens_limit=config.INFERENCE_MAX_NEW_TOKENS)
+        print(f"\nServing on http://{args.host}:{args.port} (POST /generate, GET /stats)")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.batcher.stop()
+            server.server_close()
+    elif args.question:
         # Single question mode
         print(f"\nQ: {args.question}")
-        response = ask_question(model, tokenizer, args.question)
-        print(f"A: {response}")
+        answer(model, tokenizer, args.question, args.stream, cache, prefix_cache)
     else:
         # Interactive mode
         print("\n=== Dota 2 LLM Interactive Mode ===")
         print("Ask me anything about Dota 2! (type 'quit' to exit)")
-        
+        # Follow-ups depend on the conversation, so chat answers skip the response cache
+        session = ChatSession(model, tokenizer, prefix_cache=prefix_cache) if args.chat else None
+        if session is not None:
+            print("Follow-up questions keep the conversation (type 'reset' to start over)")
+
         while True:
             try:
                 question = input("\nQ: ").strip()
-                
+
                 if question.lower() in ['quit', 'exit', 'q']:
                     break
-                    
+
                 if not question:
                     continue
-                    
-                response = ask_question(model, tokenizer, question)
-                print(f"A: {response}")
-                
+
+                if session is None:
+                    answer(model, tokenizer, question, args.stream, cache, prefix_cache)
+                elif question.lower() == 'reset':
+                    session.reset()
+                    print("Conversation cleared")
+                else:
+                    print("A: ", end="", flush=True)
+                    for text in session.ask(question):
+                        if args.stream:
+                            print(text, end="", flush=True)
+                    print("" if args.stream else session.turns[-1][1])
+                    print(f"   [{format_timings(session.last_timings)}]")
+
             except KeyboardInterrupt:
                 break
             except Exception as e:
                 print(f"Error: {e}")
-    
+
+        if cache is not None and session is None:
+            stats = cache.stats()
+            print(f"\nResponse cache: {stats['exact_hits'] + stats['similar_hits']} hits, "
+                  f"{stats['misses']} misses ({stats['hit_rate']:.0%} hit rate)")
+
     print("\nThanks for using the Dota 2 LLM!")
     return 0
 
 if __name__ == "__main__":
-    sys.exit(main())
\ No newline at end of file
+    sys.exit(main())
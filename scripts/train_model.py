@@ -1,7 +1,7 @@
 #!/usr/bin/env python3
 """
 Script to train Mistral Nemo 7B on Dota 2 data
-Usage: python scripts/train_model.py [--data PATH] [--output PATH]
+Usage: python scripts/train_model.py [--data PATH] [--output PATH] [--resume [CHECKPOINT]] [--prepare-only]
 """
 
 import argparse
@@ -12,6 +12,7 @@ from pathlib import Path
 sys.path.insert(0, str(Path(__file__).parent.parent))
 
 from src.model_training import DotaModelTrainer
+from src.adapter_sweep import parse_sweep_spec, print_sweep_table, run_adapter_sweep
 import config
 
 def main():
@@ -24,6 +25,37 @@ def main():
                        help="Base model to fine-tune")
     parser.add_argument("--epochs", type=int, default=config.NUM_EPOCHS,
                        help="Number of training epochs")
+    parser.add_argument("--dataset-cache", type=str, default=str(config.DATASET_CACHE_DIR),
+                       help="Directory of cached tokenized datasets")
+    parser.add_argument("--no-dataset-cache", action="store_true",
+                       help="Let SFTTrainer tokenize the raw examples in memory instead")
+    parser.add_argument("--rebuild-cache", action="store_true",
+                       help="Tokenize again even if the dataset is already cached")
+    parser.add_argument("--packing", action=argparse.BooleanOptionalAction, default=config.PACKING,
+                       help="Pack short examples into MAX_LENGTH rows (needs the dataset cache)")
+    parser.add_argument("--group-by-length", action=argparse.BooleanOptionalAction, default=config.GROUP_BY_LENGTH,
+                       help="Batch examples of similar token length together (alternative to --packing)")
+    parser.add_argument("--completion-only", action=argparse.BooleanOptionalAction, default=config.COMPLETION_ONLY_LOSS,
+                       help="Use the adapter's chat template and compute loss on responses only (needs the dataset cache)")
+    parser.add_argument("--throughput-metrics", action=argparse.BooleanOptionalAction, default=config.THROUGHPUT_METRICS,
+                       help="Record per-step tokens/sec, time split, padding and memory to OUTPUT/throughput.jsonl and .csv")
+    parser.add_argument("--profile-steps", type=int, nargs=2, metavar=("START", "COUNT"), default=None,
+                       help="Capture a torch profiler trace for COUNT steps after step START")
+    parser.add_argument("--resume", type=str, nargs="?", const="latest", default=None,
+                       help="Continue from a checkpoint (default: the latest complete one in --output)")
+    parser.add_argument("--save-steps", type=int, default=config.SAVE_STEPS,
+                       help="Save a checkpoint every N optimizer steps")
+    parser.add_argument("--save-total-limit", type=int, default=config.SAVE_TOTAL_LIMIT,
+                       help="Number of checkpoints to keep")
+    parser.add_argument("--save-every-minutes", type=float, default=config.SAVE_EVERY_MINUTES,
+                       help="Also save a checkpoint whenever this many minutes passed since the last one (0 disables)")
+    parser.add_argument("--sweep", type=str, nargs="+", default=None, metavar="SPEC",
+                       help="Train one adapter per SPEC on a single loaded base model, e.g. "
+                            "'r=16,alpha=32' 'r=64,alpha=128,modules=q_proj+v_proj,lr=1e-4'")
+    parser.add_argument("--max-steps", type=int, default=-1,
+                       help="Stop each run after N optimizer steps instead of --epochs")
+    parser.add_argument("--prepare-only", action="store_true",
+                       help="Only tokenize the data into the cache (loads the tokenizer, not the model)")
     
     args = parser.parse_args()
     
@@ -44,21 +76,50 @@ def main():
         config.NUM_EPOCHS = args.epochs
     
     # Initialize trainer
-    trainer = DotaModelTrainer(model_name=args.model)
+    trainer = DotaModelTrainer(model_name=args.model, completion_only=args.completion_only)
+    
+    if args.prepare_only:
+        print("\nPreparing tokenized dataset...")
+        trainer.load_tokenized_dataset(args.data, cache_dir=args.dataset_cache, rebuild=args.rebuild_cache,
+                                       packing=args.packing)
+        return 0
     
     # Setup model and tokenizer
     print("\nSetting up model and tokenizer...")
     trainer.setup_model_and_tokenizer()
+    
+    # Sweep: the base model stays loaded and only the adapter is replaced between runs
+    if args.sweep:
+        sweep_configs = [parse_sweep_spec(spec) for spec in args.sweep]
+        dataset = trainer.load_tokenized_dataset(args.data, cache_dir=args.dataset_cache,
+                                                 rebuild=args.rebuild_cache, packing=args.packing)
+        results = run_adapter_sweep(trainer, dataset, sweep_configs, args.output, max_steps=args.max_steps,
+                                    group_by_length=args.group_by_length,
+                                    throughput_metrics=args.throughput_metrics,
+                                    save_steps=args.save_steps, save_total_limit=args.save_total_limit,
+                                    save_every_minutes=args.save_every_minutes)
+        print_sweep_table(results)
+        return 0
+    
     trainer.setup_lora()
     
     # Load and prepare data
     print("\nLoading training data...")
-    training_examples = trainer.load_training_data(args.data)
-    dataset = trainer.prepare_dataset(training_examples)
+    if args.no_dataset_cache:
+        training_examples = trainer.load_training_data(args.data)
+        dataset = trainer.prepare_dataset(training_examples)
+    else:
+        dataset = trainer.load_tokenized_dataset(args.data, cache_dir=args.dataset_cache,
+                                                 rebuild=args.rebuild_cache, packing=args.packing)
     
     # Train the model
     print("\nStarting training...")
-    trained_model = trainer.train_model(dataset, args.output)
+    trained_model = trainer.train_model(dataset, args.output, group_by_length=args.group_by_length,
+                                        throughput_metrics=args.throughput_metrics,
+                                        profile_steps=args.profile_steps,
+                                        resume_from_checkpoint=True if args.resume == "latest" else args.resume,
+                                        save_steps=args.save_steps, save_total_limit=args.save_total_limit,
+                                        save_every_minutes=args.save_every_minutes, max_steps=args.max_steps)
     
     # Test the model
     print("\nTesting trained model...")
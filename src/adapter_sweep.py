@@ -0,0 +1,144 @@
+"""
+LoRA hyperparameter sweeps on one loaded base model
+Trains several adapters one after another on the same quantized base model
+and the same cached tokenized dataset, swapping only the LoRA layers between
+runs, and compares their loss against wall-clock time.
+"""
+
+import csv
+import gc
+import json
+import time
+from pathlib import Path
+import torch
+from transformers import TrainerCallback
+
+SUMMARY_FIELDS = ['name', 'r', 'alpha', 'dropout', 'target_modules', 'learning_rate', 'trainable_params',
+                  'steps', 'final_loss', 'best_loss', 'wall_seconds', 'seconds_per_step']
+
+def parse_sweep_spec(spec):
+    """
+    Parse one sweep configuration from a command-line string
+
+    Format: comma-separated key=value pairs with keys name, r, alpha, dropout,
+    modules (joined with '+') and lr, e.g. "r=16,alpha=32,modules=q_proj+v_proj".
+    Missing keys fall back to the config.LORA_* and config.LEARNING_RATE defaults.
+    """
+    parsed = {}
+    for part in filter(None, (part.strip() for part in spec.split(','))):
+        key, _, value = part.partition('=')
+        if key == 'name':
+            parsed['name'] = value
+        elif key == 'r':
+            parsed['r'] = int(value)
+        elif key == 'alpha':
+            parsed['alpha'] = int(value)
+        elif key == 'dropout':
+            parsed['dropout'] = float(value)
+        elif key == 'modules':
+            parsed['target_modules'] = value.split('+')
+        elif key == 'lr':
+            parsed['learning_rate'] = float(value)
+        else:
+            raise ValueError(f"Unknown sweep key '{key}' in '{spec}' (use name, r, alpha, dropout, modules, lr)")
+    if 'name' not in parsed:
+        labels = {'r': 'r', 'alpha': 'a', 'dropout': 'd', 'learning_rate': 'lr'}
+        parts = [f"{label}{parsed[key]}" for key, label in labels.items() if key in parsed]
+        if 'target_modules' in parsed:
+            parts.append('+'.join(parsed['target_modules']))
+        parsed['name'] = '-'.join(parts) or 'default'
+    return parsed
+
+class LossTimeCallback(TrainerCallback):
+    def __init__(self):
+        """Record (seconds since training started, step, loss) at every logging step"""
+        self.start = None
+        self.curve = []
+
+    def on_train_begin(self, args, state, control, **kwargs):
+        self.start = time.perf_counter()
+
+    def on_log(self, args, state, control, logs=None, **kwargs):
+        if logs and 'loss' in logs and self.start is not None:
+            self.curve.append((time.perf_counter() - self.start, state.global_step, float(logs['loss'])))
+
+def run_adapter_sweep(trainer, dataset, sweep_configs, output_dir, max_steps=-1, **train_kwargs):
+    """
+    Train one adapter per configuration on the trainer's already loaded base model
+
+    Args:
+        trainer: DotaModelTrainer after setup_model_and_tokenizer()
+        dataset: Tokenized dataset shared by every run
+        sweep_configs: Dicts from parse_sweep_spec
+        output_dir: Each adapter is saved to output_dir/<name>; results go to
+            output_dir/sweep_results.json (with loss curves) and sweep_results.csv
+        max_steps: Optimizer steps per adapter (-1 trains for config.NUM_EPOCHS epochs)
+        **train_kwargs: Passed on to DotaModelTrainer.train_model
+
+    Returns:
+        List of result dicts (SUMMARY_FIELDS plus the loss curve)
+    """
+    output_dir = Path(output_dir)
+    results = []
+    for sweep_config in sweep_configs:
+        name = sweep_config['name']
+        print(f"\n=== Sweep run {len(results) + 1}/{len(sweep_configs)}: {name} ===")
+        trainer.setup_lora(target_modules=sweep_config.get('target_modules'), r=sweep_config.get('r'),
+                           alpha=sweep_config.get('alpha'), dropout=sweep_config.get('dropout'))
+        lora_config = trainer.model.peft_config['default']
+        trainable_params = sum(p.numel() for p in trainer.model.parameters() if p.requires_grad)
+
+        curve = LossTimeCallback()
+        trainer.callbacks.append(curve)
+        try:
+            start = time.perf_counter()
+            hf_trainer = trainer.train_model(dataset, output_dir / name, learning_rate=sweep_config.get('learning_rate'),
+                                             max_steps=max_steps, **train_kwargs)
+            wall_seconds = time.perf_counter() - start
+        finally:
+            trainer.callbacks.remove(curve)
+
+        steps = hf_trainer.state.global_step
+        losses = [loss for _, _, loss in curve.curve]
+        results.append({
+            'name': name,
+            'r': lora_config.r,
+            'alpha': lora_config.lora_alpha,
+            'dropout': lora_config.lora_dropout,
+            'target_modules': '+'.join(sorted(lora_config.target_modules)),
+            'learning_rate': hf_trainer.args.learning_rate,
+            'trainable_params': trainable_params,
+            'steps': steps,
+            'final_loss': losses[-1] if losses else None,
+            'best_loss': min(losses) if losses else None,
+            'wall_seconds': wall_seconds,
+            'seconds_per_step': wall_seconds / steps if steps else None,
+            'loss_curve': curve.curve,
+        })
+
+        # Release the run's optimizer state before the next adapter is created
+        del hf_trainer
+        gc.collect()
+        if torch.cuda.is_available():
+            torch.cuda.empty_cache()
+
+    output_dir.mkdir(parents=True, exist_ok=True)
+    with open(output_dir / 'sweep_results.json', 'w', encoding='utf-8') as f:
+        json.dump(results, f, indent=2)
+    with open(output_dir / 'sweep_results.csv', 'w', newline='', encoding='utf-8') as f:
+        writer = csv.DictWriter(f, fieldnames=SUMMARY_FIELDS, extrasaction='ignore')
+        writer.writeheader()
+        writer.writerows(results)
+    print(f"Sweep results written to {output_dir / 'sweep_results.json'} and sweep_results.csv")
+    return results
+
+def print_sweep_table(results):
+    """Print loss against wall time for each sweep configuration"""
+    width = max([len(result['name']) for result in results] + [6])
+    print(f"\n{'config':<{width}} {'r':>4} {'alpha':>5} {'params':>10} {'steps':>6} {'final':>8} {'best':>8} {'time':>8} {'s/step':>7}")
+    for result in results:
+        final = f"{result['final_loss']:.4f}" if result['final_loss'] is not None else '-'
+        best = f"{result['best_loss']:.4f}" if result['best_loss'] is not None else '-'
+        per_step = f"{result['seconds_per_step']:.2f}" if result['seconds_per_step'] else '-'
+        print(f"{result['name']:<{width}} {result['r']:>4} {result['alpha']:>5} {result['trainable_params']:>10,} "
+              f"{result['steps']:>6} {final:>8} {best:>8} {result['wall_seconds']:>7.0f}s {per_step:>7}")
@@ -0,0 +1,250 @@
+"""
+Hero-level item build statistics aggregated across matches
+Counts item frequency, wins and purchase timings per hero and per hero-vs-enemy
+matchup in sparse count tables (sorted int64 keys plus value columns), so one
+rich example per hero or matchup can replace hundreds of per-match examples.
+Aggregates from separate runs merge by concatenating and re-reducing keys.
+"""
+
+import os
+from pathlib import Path
+import numpy as np
+import pandas as pd
+try:
+    from .match_table import build_player_table
+except ImportError:
+    from src.match_table import build_player_table
+
+# Key layout: hero and enemy IDs fit in 10 bits, item IDs in 16
+HERO_RADIX = 1 << 10
+ITEM_RADIX = 1 << 16
+CORE_ITEM_COLUMNS = [f'item_{i}' for i in range(6)]
+
+class SparseCounts:
+    def __init__(self, value_names, compact_every=200000):
+        """
+        Sparse table of summed value columns keyed by int64
+
+        Args:
+            value_names: Names of the value columns (e.g. ['games', 'wins'])
+            compact_every: Pending rows that trigger a reduce into the sorted table
+        """
+        self.value_names = list(value_names)
+        self.keys = np.empty(0, dtype=np.int64)
+        self.values = np.empty((0, len(self.value_names)), dtype=np.float64)
+        self.compact_every = compact_every
+        self._pending_keys = []
+        self._pending_values = []
+        self._pending_rows = 0
+
+    def add(self, keys, values):
+        """Add value rows for (possibly repeated) keys"""
+        if len(keys) == 0:
+            return
+        self._pending_keys.append(np.asarray(keys, dtype=np.int64))
+        self._pending_values.append(np.asarray(values, dtype=np.float64).reshape(len(keys), -1))
+        self._pending_rows += len(keys)
+        if self._pending_rows >= self.compact_every:
+            self.compact()
+
+    def compact(self):
+        """Reduce pending rows into the sorted key table"""
+        if not self._pending_rows:
+            return self
+        keys = np.concatenate([self.keys] + self._pending_keys)
+        values = np.concatenate([self.values] + self._pending_values)
+        self.keys, inverse = np.unique(keys, return_inverse=True)
+        self.values = np.stack([np.bincount(inverse, weights=values[:, column], minlength=len(self.keys))
+                                for column in range(values.shape[1])], axis=1)
+        self._pending_keys, self._pending_values, self._pending_rows = [], [], 0
+        return self
+
+    def merge(self, other):
+        """Add another table's counts into this one"""
+        other.compact()
+        self.add(other.keys, other.values)
+        return self.compact()
+
+    def column(self, name):
+        self.compact()
+        return self.values[:, self.value_names.index(name)]
+
+    def range(self, low, high):
+        """Keys and values with low <= key < high"""
+        self.compact()
+        start, end = np.searchsorted(self.keys, [low, high])
+        return self.keys[start:end], self.values[start:end]
+
+class HeroBuildAggregate:
+    def __init__(self):
+        """Create an empty build aggregate"""
+        self.heroes = SparseCounts(['games', 'wins', 'win_gpm_total'])
+        self.hero_items = SparseCounts(['games', 'wins', 'timed', 'time_total'])
+        self.matchups = SparseCounts(['games', 'wins'])
+        self.matchup_items = SparseCounts(['games', 'wins'])
+        self.num_matches = 0
+
+    def update(self, matches, item_ids_by_key=None):
+        """
+        Add a batch of match payloads
+
+        Args:
+            matches: List of match payloads
+            item_ids_by_key: Item internal name -> item ID, used to read purchase_log timings
+        """
+        matches = [m for m in matches if m and 'players' in m]
+        table = build_player_table(matches)
+        if table.empty:
+            return
+        self.num_matches += len(matches)
+
+        hero = table['hero_id'].to_numpy()
+        win = table['win'].to_numpy().astype(np.float64)
+        gpm = table['gold_per_min'].to_numpy().astype(np.float64)
+        has_hero = hero > 0
+        self.heroes.add(hero[has_hero], np.stack([np.ones(has_hero.sum()), win[has_hero],
+                                                  (win * gpm)[has_hero]], axis=1))
+
+        # Distinct finished items per player (duplicates in the inventory count once)
+        items = np.sort(table[CORE_ITEM_COLUMNS].to_numpy(), axis=1)
+        valid = items > 0
+        valid[:, 1:] &= items[:, 1:] != items[:, :-1]
+        valid &= has_hero[:, None]
+        rows, slots = np.nonzero(valid)
+        item_ids = items[rows, slots]
+
+        # First purchase time of each finished item, from purchase_log when the match is parsed
+        times = self._purchase_times(matches, rows, item_ids, item_ids_by_key)
+        timed = ~np.isnan(times)
+        self.hero_items.add(hero[rows] * ITEM_RADIX + item_ids,
+                            np.stack([np.ones(len(rows)), win[rows], timed, np.where(timed, times, 0.0)], axis=1))
+
+        # Every player paired with the five heroes on the other team
+        players = pd.DataFrame({'row': np.arange(len(table)), 'match_index': table['match_index'].to_numpy(),
+                                'team': table['team'].to_numpy(), 'hero': hero})
+        players = players[has_hero]
+        pairs = players.merge(players[['match_index', 'team', 'hero']], on='match_index', suffixes=('', '_enemy'))
+        pairs = pairs[pairs['team'] != pairs['team_enemy']]
+        pair_rows = pairs['row'].to_numpy()
+        pair_keys = pairs['hero'].to_numpy() * HERO_RADIX + pairs['hero_enemy'].to_numpy()
+        self.matchups.add(pair_keys, np.stack([np.ones(len(pair_rows)), win[pair_rows]], axis=1))
+
+        pair_valid = valid[pair_rows]
+        pair_index, pair_slots = np.nonzero(pair_valid)
+        self.matchup_items.add(pair_keys[pair_index] * ITEM_RADIX + items[pair_rows[pair_index], pair_slots],
+                               np.stack([np.ones(len(pair_index)), win[pair_rows[pair_index]]], axis=1))
+
+    @staticmethod
+    def _purchase_times(matches, rows, item_ids, item_ids_by_key):
+        """First purchase time (seconds) for each (player row, item) pair, NaN when unknown"""
+        times = np.full(len(rows), np.nan)
+        if not item_ids_by_key:
+            return times
+
+        first_purchase = []
+        for match_data in matches:
+            for player in match_data['players']:
+                purchases = {}
+                for purchase in player.get('purchase_log') or []:
+                    item_id = item_ids_by_key.get(purchase.get('key'))
+                    if item_id is not None and item_id not in purchases:
+                        purchases[item_id] = purchase.get('time', 0)
+                first_purchase.append(purchases)
+
+        for index, (row, item_id) in enumerate(zip(rows.tolist(), item_ids.tolist())):
+            purchase_time = first_purchase[row].get(item_id)
+            if purchase_time is not None:
+                times[index] = purchase_time
+        return times
+
+    def merge(self, other):
+        """Add another aggregate's counts into this one"""
+        self.heroes.merge(other.heroes)
+        self.hero_items.merge(other.hero_items)
+        self.matchups.merge(other.matchups)
+        self.matchup_items.merge(other.matchup_items)
+        self.num_matches += other.num_matches
+        return self
+
+    def hero_summary(self, hero_id):
+        """(games, wins, win_gpm_total) for a hero"""
+        _, values = self.heroes.range(hero_id, hero_id + 1)
+        return tuple(values[0]) if len(values) else (0.0, 0.0, 0.0)
+
+    def hero_item_table(self, hero_id):
+        """Item IDs and [games, wins, timed, time_total] rows for a hero"""
+        keys, values = self.hero_items.range(hero_id * ITEM_RADIX, (hero_id + 1) * ITEM_RADIX)
+        return keys % ITEM_RADIX, values
+
+    def matchup_list(self, min_games=1):
+        """(hero_id, enemy_id, games, wins) for matchups with at least min_games"""
+        self.matchups.compact()
+        games = self.matchups.column('games')
+        wins = self.matchups.column('wins')
+        keep = games >= min_games
+        keys = self.matchups.keys[keep]
+        return list(zip((keys // HERO_RADIX).tolist(), (keys % HERO_RADIX).tolist(),
+                        games[keep].tolist(), wins[keep].tolist()))
+
+    def matchup_item_table(self, hero_id, enemy_id):
+        """Item IDs and [games, wins] rows for a hero against an enemy"""
+        base = (hero_id * HERO_RADIX + enemy_id) * ITEM_RADIX
+        keys, values = self.matchup_items.range(base, base + ITEM_RADIX)
+        return keys % ITEM_RADIX, values
+
+    def hero_ids(self):
+        self.heroes.compact()
+        return self.heroes.keys.tolist()
+
+    def save(self, path):
+        """Atomically write the aggregate to an .npz file"""
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        arrays = {'num_matches': np.array([self.num_matches], dtype=np.int64)}
+        for name in ('heroes', 'hero_items', 'matchups', 'matchup_items'):
+            counts = getattr(self, name).compact()
+            arrays[f'{name}_keys'] = counts.keys
+            arrays[f'{name}_values'] = counts.values
+        tmp_path = path.with_name(path.name + '.tmp')
+        with open(tmp_path, 'wb') as f:
+            np.savez(f, **arrays)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        """Read an aggregate written by save()"""
+        aggregate = cls()
+        with np.load(path) as data:
+            aggregate.num_matches = int(data['num_matches'][0])
+            for name in ('heroes', 'hero_items', 'matchups', 'matchup_items'):
+                counts = getattr(aggregate, name)
+                counts.keys = data[f'{name}_keys'].copy()
+                counts.values = data[f'{name}_values'].copy()
+        return aggregate
+
+    @classmethod
+    def load_merged(cls, paths):
+        """Load and merge several saved aggregates"""
+        aggregate = cls()
+        for path in paths:
+            aggregate.merge(cls.load(path))
+        return aggregate
+
+def rank_build_items(item_ids, games, wins, hero_games, hero_win_rate, min_share=0.05, prior_games=10):
+    """
+    Order items by win-rate-weighted popularity
+
+    Each item's share of games is weighted by its smoothed win rate relative to
+    the hero's overall win rate, so common items that lose are pushed down and
+    rare items need several games before their win rate counts.
+
+    Returns:
+        (item_ids, scores, smoothed_win_rates) sorted best first, items in under
+        min_share of games (or fewer than 2) dropped
+    """
+    keep = (games >= max(2, min_share * hero_games))
+    item_ids, games, wins = item_ids[keep], games[keep], wins[keep]
+    smoothed = (wins + prior_games * hero_win_rate) / (games + prior_games)
+    scores = (games / hero_games) * (smoothed / max(hero_win_rate, 1e-9))
+    order = np.argsort(-scores, kind='stable')
+    return item_ids[order], scores[order], smoothed[order]
@@ -0,0 +1,158 @@
+"""
+Multi-turn conversations with the fine-tuned Dota 2 model
+A ChatSession keeps the conversation formatted with the adapter's chat
+template together with the KV cache of everything the model has already
+read. Each turn re-renders the conversation, reuses the cache for the tokens
+that did not change and prefills only the rest (normally just the new
+question), so the cost of a turn does not grow with the length of the
+conversation. When the context window fills, the oldest turns are dropped.
+"""
+
+import time
+from pathlib import Path
+import torch
+import config
+try:
+    from .inference import DEFAULT_GENERATION, iter_text, rewrite_lane_terms, start_generation
+    from .kv_cache import cache_length, cache_tensors, keep_first, to_dynamic_cache
+except ImportError:
+    from src.inference import DEFAULT_GENERATION, iter_text, rewrite_lane_terms, start_generation
+    from src.kv_cache import cache_length, cache_tensors, keep_first, to_dynamic_cache
+
+def load_chat_template(tokenizer, model_path):
+    """Use the chat_template.jinja saved with the adapter, if there is one"""
+    template_path = Path(model_path) / "chat_template.jinja"
+    if template_path.exists():
+        tokenizer.chat_template = template_path.read_text()
+    return tokenizer
+
+class ChatSession:
+    def __init__(self, model, tokenizer, system_prompt=None, max_context=None, prefix_cache=None):
+        """
+        Initialize an empty conversation
+
+        Args:
+            model: Model from load_trained_model
+            tokenizer: Matching tokenizer with a chat template (see load_chat_template)
+            system_prompt: System message (default: config.SYSTEM_PROMPT)
+            max_context: Tokens of conversation plus answer kept at most (default: config.CHAT_MAX_CONTEXT)
+            prefix_cache: Optional PromptPrefixCache used as the starting cache of a fresh conversation
+        """
+        self.model = model
+        self.tokenizer = tokenizer
+        self.system_prompt = config.SYSTEM_PROMPT if system_prompt is None else system_prompt
+        self.max_context = max_context or config.CHAT_MAX_CONTEXT
+        self.prefix_cache = prefix_cache
+        self.last_timings = None
+        self.reset()
+
+    def reset(self):
+        """Forget the conversation"""
+        self.turns = []  # (question, answer) pairs
+        self.dropped_turns = 0
+        self._reset_cache()
+
+    def _reset_cache(self):
+        if self.prefix_cache is not None:
+            self.cached_ids, self.cache = list(self.prefix_cache.prefix_ids), self.prefix_cache.tensors
+        else:
+            self.cached_ids, self.cache = [], []
+
+    def _messages(self, question):
+        messages = [{"role": "system", "content": self.system_prompt}] if self.system_prompt else []
+        for previous_question, answer in self.turns:
+            messages.append({"role": "user", "content": previous_question})
+            messages.append({"role": "assistant", "content": answer})
+        messages.append({"role": "user", "content": question})
+        return messages
+
+    def _encode(self, question):
+        """Token IDs of the conversation ending in question, dropping the oldest turns to fit"""
+        max_new_tokens = DEFAULT_GENERATION['max_new_tokens']
+        while True:
+            text = self.tokenizer.apply_chat_template(self._messages(question), tokenize=False,
+                                                      add_generation_prompt=True)
+            # The template already starts with <s>
+            prompt_ids = self.tokenizer(text, add_special_tokens=False)["input_ids"]
+            if len(prompt_ids) + max_new_tokens <= self.max_context or not self.turns:
+                return prompt_ids
+            self.turns.pop(0)
+            self.dropped_turns += 1
+
+    def ask(self, question):
+        """
+        Ask a follow-up question and yield the answer as it is generated
+
+        Afterwards last_timings holds the turn's prefill and decode timings.
+
+        Args:
+            question: Question to ask
+
+        Yields:
+            Text chunks that join to the answer
+        """
+        question = f"{rewrite_lane_terms(question)} (This is about Dota 2)"
+        self.dropped_turns = 0
+        prompt_ids = self._encode(question)
+
+        # Reuse the cache for the tokens the conversation still starts with
+        reused = 0
+        for cached_id, prompt_id in zip(self.cached_ids, prompt_ids[:-1]):
+            if cached_id != prompt_id:
+                break
+            reused += 1
+        past = to_dynamic_cache(keep_first(self.cache, reused) if reused else [])
+
+        inputs = {
+            'input_ids': torch.tensor([prompt_ids], device=self.model.device),
+            'attention_mask': torch.ones((1, len(prompt_ids)), dtype=torch.long, device=self.model.device),
+        }
+        started = time.perf_counter()
+        first_token_at = None
+        streamer = start_generation(self.model, inputs, **DEFAULT_GENERATION, past_key_values=past,
+                                    return_dict_in_generate=True, pad_token_id=self.tokenizer.eos_token_id)
+
+        def timed_tokens():
+            nonlocal first_token_at
+            for token_id in streamer:
+                if first_token_at is None:
+                    first_token_at = time.perf_counter()
+                yield token_id
+
+        chunks = []
+        try:
+            for text in iter_text(timed_tokens(), self.tokenizer):
+                chunks.append(text)
+                yield text
+        finally:
+            # An abandoned turn stops generate() and is not added to the conversation
+            streamer.cancel()
+        finished_at = time.perf_counter()
+
+        # The cache holds the prompt and every generated token except the last one
+        sequence = streamer.outputs.sequences[0].tolist()
+        self.cache = cache_tensors(past)
+        self.cached_ids = sequence[:cache_length(self.cache)]
+        self.turns.append((question, "".join(chunks).strip()))
+
+        new_tokens = len(sequence) - len(prompt_ids)
+        first_token_at = first_token_at or finished_at
+        self.last_timings = {
+            'prompt_tokens': len(prompt_ids),
+            'reused_tokens': reused,
+            'prefill_tokens': len(prompt_ids) - reused,
+            'prefill_seconds': first_token_at - started,
+            'decode_tokens': max(new_tokens - 1, 0),
+            'decode_seconds': finished_at - first_token_at,
+            'dropped_turns': self.dropped_turns,
+        }
+
+def format_timings(timings):
+    """One-line summary of ChatSession.last_timings"""
+    decode_rate = timings['decode_tokens'] / timings['decode_seconds'] if timings['decode_seconds'] else 0.0
+    line = (f"prefill {timings['prefill_tokens']} tokens ({timings['reused_tokens']} cached) "
+            f"{timings['prefill_seconds']:.2f}s | decode {timings['decode_tokens']} tokens "
+            f"{timings['decode_seconds']:.2f}s ({decode_rate:.1f} tokens/sec)")
+    if timings['dropped_turns']:
+        line += f" | dropped {timings['dropped_turns']} oldest turn(s) to fit the context"
+    return line
@@ -0,0 +1,129 @@
+"""
+Checkpoint cadence and resume support for training runs
+Adds time-based checkpoints on top of save_steps and records which dataset
+and batch layout each checkpoint was trained on. A resumed run then skips
+exactly the batches already consumed, or refuses to resume if the cached
+dataset or batch settings changed.
+"""
+
+import json
+import time
+from pathlib import Path
+from transformers import TrainerCallback
+from transformers.trainer_utils import PREFIX_CHECKPOINT_DIR
+
+DATASET_STATE_FILE = 'dataset_state.json'
+CHECKPOINT_WEIGHT_FILES = ('adapter_model.safetensors', 'adapter_model.bin', 'model.safetensors', 'pytorch_model.bin')
+# Settings that change which samples a step consumes; resuming with different values would skip the wrong ones
+BATCH_LAYOUT_FIELDS = ('per_device_train_batch_size', 'gradient_accumulation_steps', 'world_size', 'seed',
+                       'train_sampling_strategy')
+
+def is_complete_checkpoint(path):
+    """True if a checkpoint directory holds weights, optimizer state and trainer state"""
+    path = Path(path)
+    return ((path / 'trainer_state.json').exists() and (path / 'optimizer.pt').exists() and
+            any((path / name).exists() for name in CHECKPOINT_WEIGHT_FILES))
+
+def find_resume_checkpoint(output_dir):
+    """
+    Latest complete checkpoint-<step> directory in output_dir
+
+    Incomplete checkpoints (e.g. interrupted mid-save, or kept without optimizer
+    state) are skipped in favour of the next most recent one.
+
+    Returns:
+        Path of the checkpoint, or None if there is none
+    """
+    output_dir = Path(output_dir)
+    if not output_dir.is_dir():
+        return None
+    checkpoints = []
+    for path in output_dir.glob(f'{PREFIX_CHECKPOINT_DIR}-*'):
+        step = path.name.rsplit('-', 1)[-1]
+        if path.is_dir() and step.isdigit():
+            checkpoints.append((int(step), path))
+
+    for _, path in sorted(checkpoints, reverse=True):
+        if is_complete_checkpoint(path):
+            return path
+        print(f"Skipping incomplete checkpoint {path}")
+    return None
+
+def dataset_state(dataset, args):
+    """Identity of the training dataset and the batch layout used to walk it"""
+    return {
+        'dataset_fingerprint': dataset._fingerprint,
+        'num_rows': len(dataset),
+        'per_device_train_batch_size': args.per_device_train_batch_size,
+        'gradient_accumulation_steps': args.gradient_accumulation_steps,
+        'world_size': args.world_size,
+        'seed': args.seed,
+        'train_sampling_strategy': str(args.train_sampling_strategy),
+    }
+
+def check_resume_compatible(checkpoint, dataset, args):
+    """
+    Raise if a checkpoint was trained on a different dataset or batch layout
+
+    Checkpoints written before dataset states were recorded are accepted as is.
+    """
+    state_path = Path(checkpoint) / DATASET_STATE_FILE
+    if not state_path.exists():
+        print(f"No {DATASET_STATE_FILE} in {checkpoint}; assuming the same dataset and batch settings")
+        return
+    with open(state_path, 'r', encoding='utf-8') as f:
+        saved = json.load(f)
+
+    current = dataset_state(dataset, args)
+    if (saved['dataset_fingerprint'], saved['num_rows']) != (current['dataset_fingerprint'], current['num_rows']):
+        raise ValueError(f"{checkpoint} was trained on a different dataset ({saved['num_rows']} rows, "
+                         f"fingerprint {saved['dataset_fingerprint']}); resuming would skip the wrong samples")
+    changed = [field for field in BATCH_LAYOUT_FIELDS if saved.get(field) != current[field]]
+    if changed:
+        raise ValueError(f"{checkpoint} used different batch settings ({', '.join(changed)}); "
+                         f"resuming would skip the wrong samples")
+
+class DatasetStateCallback(TrainerCallback):
+    def __init__(self, dataset):
+        """
+        Record the dataset identity and samples consumed in every checkpoint
+
+        Args:
+            dataset: Training dataset passed to the trainer
+        """
+        self.dataset = dataset
+
+    def on_save(self, args, state, control, **kwargs):
+        if not state.is_world_process_zero:
+            return
+        checkpoint = Path(args.output_dir) / f'{PREFIX_CHECKPOINT_DIR}-{state.global_step}'
+        if not checkpoint.is_dir():
+            return
+        record = dataset_state(self.dataset, args)
+        record['global_step'] = state.global_step
+        record['samples_consumed'] = (state.global_step * args.per_device_train_batch_size *
+                                      args.gradient_accumulation_steps * args.world_size)
+        with open(checkpoint / DATASET_STATE_FILE, 'w', encoding='utf-8') as f:
+            json.dump(record, f, indent=2)
+
+class TimedCheckpointCallback(TrainerCallback):
+    def __init__(self, save_every_minutes):
+        """
+        Save a checkpoint whenever this much wall-clock time passed since the last one
+
+        Args:
+            save_every_minutes: Minutes between checkpoints, in addition to save_steps
+        """
+        self.interval = save_every_minutes * 60
+        self.last_save = None
+
+    def on_train_begin(self, args, state, control, **kwargs):
+        self.last_save = time.monotonic()
+
+    def on_step_end(self, args, state, control, **kwargs):
+        if self.last_save is not None and time.monotonic() - self.last_save >= self.interval:
+            control.should_save = True
+        return control
+
+    def on_save(self, args, state, control, **kwargs):
+        self.last_save = time.monotonic()
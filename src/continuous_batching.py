@@ -0,0 +1,354 @@
+"""
+Continuous batching for concurrent generation requests
+A single worker thread owns the model and decodes every active request in one
+batched forward pass per token. New requests are prefilled and merged into the
+running batch between decode steps, and finished requests leave it at once, so
+the GPU keeps working on whatever is in flight instead of one user at a time.
+"""
+
+import queue
+import threading
+import time
+from collections import deque
+import numpy as np
+import torch
+from transformers import RepetitionPenaltyLogitsProcessor, TemperatureLogitsWarper, TopPLogitsWarper
+try:
+    from .inference import DEFAULT_GENERATION
+    from .kv_cache import cache_tensors, concat_rows, select_rows, to_dynamic_cache, trim_left
+except ImportError:
+    from src.inference import DEFAULT_GENERATION
+    from src.kv_cache import cache_tensors, concat_rows, select_rows, to_dynamic_cache, trim_left
+
+class GenerationRequest:
+    def __init__(self, prompt_ids, max_new_tokens, temperature, top_p, repetition_penalty, do_sample, stream=False):
+        """
+        One prompt waiting for, or going through, generation
+
+        Args:
+            prompt_ids: Token IDs of the formatted prompt
+            max_new_tokens: Tokens to generate at most
+            temperature, top_p, repetition_penalty, do_sample: Sampling settings (as in model.generate)
+            stream: Also hand each token to the caller as it is sampled (see stream_tokens)
+        """
+        self.prompt_ids = list(prompt_ids)
+        self.max_new_tokens = max_new_tokens
+        self.temperature = temperature
+        self.top_p = top_p
+        self.repetition_penalty = repetition_penalty
+        self.do_sample = do_sample
+        self.generated_ids = []
+        self.text = None
+        self.error = None
+        self.cancelled = False
+        self.done = threading.Event()
+        self.tokens = queue.Queue() if stream else None
+        self.submitted_at = time.perf_counter()
+        self.admitted_at = None
+        self.first_token_at = None
+        self.finished_at = None
+
+    def wait(self, timeout=None):
+        """Block until generation finishes and return the decoded answer"""
+        if not self.done.wait(timeout):
+            raise TimeoutError("Generation did not finish in time")
+        if self.error is not None:
+            raise RuntimeError(f"Generation failed: {self.error}")
+        return self.text
+
+    def cancel(self):
+        """Stop generating for this request (the caller went away); it leaves the batch at the next step"""
+        self.cancelled = True
+
+    def stream_tokens(self, timeout=None):
+        """Yield token IDs as the batcher samples them (request must be submitted with stream=True)"""
+        while True:
+            try:
+                token_id = self.tokens.get(timeout=timeout)
+            except queue.Empty:
+                raise TimeoutError("No token generated in time")
+            if token_id is None:
+                break
+            yield token_id
+        if self.error is not None:
+            raise RuntimeError(f"Generation failed: {self.error}")
+
+    def latency(self):
+        """Queue wait, time to first token and total latency in seconds"""
+        finished_at = self.finished_at or time.perf_counter()
+        total = finished_at - self.submitted_at
+        return {
+            'queue_wait': (self.admitted_at or finished_at) - self.submitted_at,
+            'time_to_first_token': (self.first_token_at or finished_at) - self.submitted_at,
+            'total': total,
+            'new_tokens': len(self.generated_ids),
+            'tokens_per_sec': len(self.generated_ids) / total if total else 0.0,
+        }
+
+class ContinuousBatcher:
+    def __init__(self, model, tokenizer, max_batch_size=16, latency_window=1000, prefix_cache=None):
+        """
+        Initialize the batcher (call start() to launch the worker thread)
+
+        Args:
+            model: Causal LM (e.g. from load_trained_model)
+            tokenizer: Matching tokenizer
+            max_batch_size: Requests decoded together at most; others wait in the queue
+            latency_window: Finished requests kept for latency percentiles
+            prefix_cache: Optional PromptPrefixCache; prompts only prefill the tokens after it
+        """
+        self.model = model
+        self.tokenizer = tokenizer
+        self.max_batch_size = max_batch_size
+        self.device = model.device
+        self.pad_token_id = tokenizer.pad_token_id if tokenizer.pad_token_id is not None else tokenizer.eos_token_id
+        self.eos_token_id = tokenizer.eos_token_id
+        self.prefix_cache = prefix_cache
+
+        self.waiting = queue.Queue()
+        self.thread = None
+        self.running = False
+        self._reset_batch()
+
+        self.stats_lock = threading.Lock()
+        self.started_at = time.perf_counter()
+        self.completed = 0
+        self.failed = 0
+        self.cancelled = 0
+        self.generated_tokens = 0
+        self.decode_steps = 0
+        self.decoded_rows = 0
+        self.prefill_tokens = 0
+        self.prefix_tokens_reused = 0
+        self.recent = deque(maxlen=latency_window)
+
+    def _reset_batch(self):
+        self.active = []
+        self.cache = []
+        self.attention_mask = None
+        self.positions = None
+        self.next_tokens = None
+
+    def submit(self, prompt_ids, max_new_tokens=None, temperature=None, top_p=None, repetition_penalty=None,
+               do_sample=None, stream=False):
+        """Queue a prompt for generation; unset sampling settings use DEFAULT_GENERATION"""
+        request = GenerationRequest(
+            prompt_ids,
+            max_new_tokens=max_new_tokens or DEFAULT_GENERATION['max_new_tokens'],
+            temperature=DEFAULT_GENERATION['temperature'] if temperature is None else temperature,
+            top_p=DEFAULT_GENERATION['top_p'] if top_p is None else top_p,
+            repetition_penalty=DEFAULT_GENERATION['repetition_penalty'] if repetition_penalty is None else repetition_penalty,
+            do_sample=DEFAULT_GENERATION['do_sample'] if do_sample is None else do_sample,
+            stream=stream,
+        )
+        self.waiting.put(request)
+        return request
+
+    def start(self):
+        """Start the worker thread"""
+        self.running = True
+        self.thread = threading.Thread(target=self._run, name="continuous-batcher", daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        """Stop the worker thread after the current step"""
+        self.running = False
+        if self.thread is not None:
+            self.thread.join()
+
+    def stats(self):
+        """Queue depth, batch occupancy, throughput and latency percentiles"""
+        with self.stats_lock:
+            recent = list(self.recent)
+            elapsed = time.perf_counter() - self.started_at
+            stats = {
+                'queue_depth': self.waiting.qsize(),
+                'active_requests': len(self.active),
+                'max_batch_size': self.max_batch_size,
+                'completed_requests': self.completed,
+                'failed_requests': self.failed,
+                'cancelled_requests': self.cancelled,
+                'generated_tokens': self.generated_tokens,
+                'tokens_per_sec': self.generated_tokens / elapsed if elapsed else 0.0,
+                'mean_batch_size': self.decoded_rows / self.decode_steps if self.decode_steps else 0.0,
+                'prefill_tokens': self.prefill_tokens,
+                'prefix_tokens_reused': self.prefix_tokens_reused,
+            }
+        for name in ('queue_wait', 'time_to_first_token', 'total'):
+            values = np.array([latency[name] for latency in recent]) if recent else np.zeros(1)
+            stats[f'{name}_p50'] = float(np.percentile(values, 50))
+            stats[f'{name}_p95'] = float(np.percentile(values, 95))
+        return stats
+
+    def _run(self):
+        while self.running:
+            admitted = self._admit()
+            try:
+                with torch.no_grad():
+                    if admitted:
+                        self._prefill(admitted)
+                    if self.active:
+                        self._decode_step()
+            except Exception as e:
+                # Fail everything in flight but keep serving new requests
+                print(f"Batch generation failed: {e}")
+                for request in self.active + [r for r in admitted if r not in self.active]:
+                    request.error = str(e)
+                    self._complete(request)
+                self._reset_batch()
+
+    def _admit(self):
+        """Take as many waiting requests as the batch has room for"""
+        admitted = []
+        free = self.max_batch_size - len(self.active)
+        # Block briefly when idle so the loop does not spin
+        if not self.active and free > 0:
+            try:
+                admitted.append(self.waiting.get(timeout=0.05))
+            except queue.Empty:
+                return admitted
+        while len(admitted) < free:
+            try:
+                admitted.append(self.waiting.get_nowait())
+            except queue.Empty:
+                break
+        now = time.perf_counter()
+        for request in admitted:
+            request.admitted_at = now
+        # Requests cancelled while queued are never prefilled
+        for request in [r for r in admitted if r.cancelled]:
+            request.text = ""
+            self._complete(request)
+        return [request for request in admitted if not request.cancelled]
+
+    def _prefill(self, requests):
+        """Run the new prompts together and merge their caches into the running batch"""
+        # Tokens every new prompt shares with the cached prefix start from its cache instead
+        shared = min(self.prefix_cache.match(request.prompt_ids) for request in requests) if self.prefix_cache is not None else 0
+        past = self.prefix_cache.cache_for(shared, len(requests)) if shared else []
+
+        # Left pad the rest of each prompt; with a prefix the padding sits between it and the prompt
+        suffixes = [request.prompt_ids[shared:] for request in requests]
+        length = max(len(suffix) for suffix in suffixes)
+        input_ids = torch.full((len(requests), length), self.pad_token_id, dtype=torch.long)
+        suffix_mask = torch.zeros((len(requests), length), dtype=torch.long)
+        for row, suffix in enumerate(suffixes):
+            input_ids[row, length - len(suffix):] = torch.tensor(suffix)
+            suffix_mask[row, length - len(suffix):] = 1
+        input_ids, suffix_mask = input_ids.to(self.device), suffix_mask.to(self.device)
+        attention_mask = torch.cat([suffix_mask.new_ones((len(requests), shared)), suffix_mask], dim=1)
+        position_ids = (shared + suffix_mask.cumsum(-1) - 1).clamp(min=0)
+
+        outputs = self.model(input_ids=input_ids, attention_mask=attention_mask, position_ids=position_ids,
+                             past_key_values=to_dynamic_cache(past), use_cache=True, logits_to_keep=1)
+        tokens = self._sample(outputs.logits[:, -1, :], requests)
+        with self.stats_lock:
+            self.prefill_tokens += sum(len(suffix) for suffix in suffixes)
+            self.prefix_tokens_reused += shared * len(requests)
+
+        self.cache, old_padding, new_padding = concat_rows(self.cache, cache_tensors(outputs.past_key_values))
+        if self.attention_mask is None:
+            self.attention_mask = attention_mask
+            self.positions = attention_mask.sum(-1)
+            self.next_tokens = tokens
+        else:
+            old_mask = torch.nn.functional.pad(self.attention_mask, (old_padding, 0))
+            new_mask = torch.nn.functional.pad(attention_mask, (new_padding, 0))
+            self.attention_mask = torch.cat([old_mask, new_mask])
+            self.positions = torch.cat([self.positions, attention_mask.sum(-1)])
+            self.next_tokens = torch.cat([self.next_tokens, tokens])
+        self.active.extend(requests)
+        self._record_tokens(requests, tokens)
+
+    def _decode_step(self):
+        """Feed every active request its latest token and sample the next one"""
+        attention_mask = torch.cat([self.attention_mask, self.attention_mask.new_ones((len(self.active), 1))], dim=1)
+        outputs = self.model(input_ids=self.next_tokens[:, None], attention_mask=attention_mask,
+                             position_ids=self.positions[:, None], past_key_values=to_dynamic_cache(self.cache),
+                             use_cache=True)
+        self.cache = cache_tensors(outputs.past_key_values)
+        self.attention_mask = attention_mask
+        self.positions = self.positions + 1
+        self.next_tokens = self._sample(outputs.logits[:, -1, :], self.active)
+        with self.stats_lock:
+            self.decode_steps += 1
+            self.decoded_rows += len(self.active)
+        self._record_tokens(self.active, self.next_tokens)
+
+    def _sample(self, logits, requests):
+        """Next token per row with that request's repetition penalty, temperature and top-p"""
+        logits = logits.float()
+        tokens = torch.empty(len(requests), dtype=torch.long, device=logits.device)
+
+        # Rows with the same settings (usually all of them) are processed together
+        groups = {}
+        for row, request in enumerate(requests):
+            settings = (request.repetition_penalty, request.do_sample and request.temperature > 0,
+                        request.temperature, request.top_p)
+            groups.setdefault(settings, []).append(row)
+
+        for (repetition_penalty, do_sample, temperature, top_p), rows in groups.items():
+            # Penalize every token seen so far; short rows are padded with a token they already contain
+            histories = [requests[row].prompt_ids + requests[row].generated_ids for row in rows]
+            width = max(len(history) for history in histories)
+            seen = torch.tensor([history + [history[0]] * (width - len(history)) for history in histories],
+                                device=logits.device)
+            index = torch.tensor(rows, device=logits.device)
+            scores = logits.index_select(0, index)
+            if repetition_penalty != 1.0:
+                scores = RepetitionPenaltyLogitsProcessor(repetition_penalty)(seen, scores)
+            if do_sample:
+                scores = TemperatureLogitsWarper(temperature)(seen, scores)
+                if top_p < 1.0:
+                    scores = TopPLogitsWarper(top_p)(seen, scores)
+                tokens[index] = torch.multinomial(torch.softmax(scores, dim=-1), 1)[:, 0]
+            else:
+                tokens[index] = scores.argmax(dim=-1)
+        return tokens
+
+    def _record_tokens(self, requests, tokens):
+        """Append sampled tokens and retire requests that are done"""
+        now = time.perf_counter()
+        for request, token in zip(requests, tokens.tolist()):
+            if request.first_token_at is None:
+                request.first_token_at = now
+            request.generated_ids.append(token)
+            if request.tokens is not None:
+                request.tokens.put(token)
+            if (request.cancelled or token == self.eos_token_id
+                    or len(request.generated_ids) >= request.max_new_tokens):
+                request.text = self.tokenizer.decode(request.generated_ids, skip_special_tokens=True).strip()
+                self._complete(request)
+        with self.stats_lock:
+            self.generated_tokens += len(requests)
+
+        if any(request.done.is_set() for request in self.active):
+            rows = [row for row, request in enumerate(self.active) if not request.done.is_set()]
+            self.active = [self.active[row] for row in rows]
+            if not rows:
+                self._reset_batch()
+                return
+            index = torch.tensor(rows, device=self.attention_mask.device)
+            self.cache = select_rows(self.cache, rows)
+            self.attention_mask = self.attention_mask.index_select(0, index)
+            self.positions = self.positions.index_select(0, index)
+            self.next_tokens = self.next_tokens.index_select(0, index)
+            # Left padding that no remaining row needs any more
+            unused = int((self.attention_mask.sum(0) == 0).long().cumprod(0).sum())
+            self.cache = trim_left(self.cache, unused)
+            self.attention_mask = self.attention_mask[:, unused:]
+
+    def _complete(self, request):
+        request.finished_at = time.perf_counter()
+        with self.stats_lock:
+            if request.error is not None:
+                self.failed += 1
+            elif request.cancelled:
+                self.cancelled += 1
+            else:
+                self.completed += 1
+                self.recent.append(request.latency())
+        request.done.set()
+        if request.tokens is not None:
+            request.tokens.put(None)
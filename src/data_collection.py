@@ -2,67 +2,401 @@
 
 import requests
 import json
+import random
 import time
+import threading
+import numpy as np
 import pandas as pd
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 from datetime import datetime, timedelta
 import os
 from pathlib import Path
+import config
 try:
     from .coaching_knowledge import get_comprehensive_coaching_knowledge
+    from .match_crawler import MatchCrawler
+    from .streaming_writer import JsonlWriter
+    from .meta_aggregate import MetaAggregate
+    from .build_aggregate import HeroBuildAggregate, rank_build_items
+    from .match_table import ITEM_COLUMNS, build_player_table
+    from .game_constants import GameConstantsCache
 except ImportError:
     from src.coaching_knowledge import get_comprehensive_coaching_knowledge
+    from src.match_crawler import MatchCrawler
+    from src.streaming_writer import JsonlWriter
+    from src.meta_aggregate import MetaAggregate
+    from src.build_aggregate import HeroBuildAggregate, rank_build_items
+    from src.match_table import ITEM_COLUMNS, build_player_table
+    from src.game_constants import GameConstantsCache
+
+PAID_TIER_MAX_RATE = 20.0  # Upper bound only; the rate-limit headers set the real pace
+
+# urllib3 only decodes brotli when a brotli package is installed
+try:
+    import brotli  # noqa: F401
+    ACCEPT_ENCODING = 'gzip, deflate, br'
+except ImportError:
+    try:
+        import brotlicffi  # noqa: F401
+        ACCEPT_ENCODING = 'gzip, deflate, br'
+    except ImportError:
+        ACCEPT_ENCODING = 'gzip, deflate'
+
+class TokenBucket:
+    def __init__(self, rate, capacity=1):
+        """
+        Thread-safe token bucket shared by all in-flight requests
+        
+        Args:
+            rate: Tokens added per second (sustained requests/second)
+            capacity: Maximum burst size
+        """
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.last_refill = time.monotonic()
+        self.paused_until = 0
+        self.lock = threading.Lock()
+    
+    def acquire(self):
+        """Block until a token is available, then consume it"""
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.last_refill) * self.rate)
+                self.last_refill = now
+                
+                if now < self.paused_until:
+                    wait_time = self.paused_until - now
+                elif self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                else:
+                    wait_time = (1 - self.tokens) / self.rate
+            time.sleep(wait_time)
+    
+    def pause(self, seconds):
+        """Hold back every caller for the given number of seconds"""
+        with self.lock:
+            self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+            self.tokens = 0
+
+class AdaptiveRateLimiter(TokenBucket):
+    def __init__(self, rate, max_rate=None, min_rate=0.1, capacity=1, increase_step=0.1):
+        """
+        Token bucket whose rate follows the API's rate-limit headers and throttling
+        
+        Increases additively after successful requests (up to max_rate and the pace
+        the remaining per-minute quota allows) and halves on 429/5xx responses.
+        
+        Args:
+            rate: Starting requests/second
+            max_rate: Ceiling for the rate (defaults to the starting rate)
+            min_rate: Floor for the rate when backing off
+            capacity: Maximum burst size
+            increase_step: Requests/second added after each successful request
+        """
+        super().__init__(rate, capacity)
+        self.max_rate = max_rate or rate
+        self.min_rate = min(min_rate, rate)
+        self.increase_step = increase_step
+        self.remaining_minute = None
+        self.remaining_day = None
+    
+    def record_response(self, response):
+        """Adjust the rate from a response's status code and rate-limit headers"""
+        remaining_minute = _int_header(response.headers, 'X-Rate-Limit-Remaining-Minute')
+        remaining_day = _int_header(response.headers, 'X-Rate-Limit-Remaining-Day')
+        
+        with self.lock:
+            if remaining_minute is not None:
+                self.remaining_minute = remaining_minute
+            if remaining_day is not None:
+                self.remaining_day = remaining_day
+            
+            if response.status_code == 429 or response.status_code >= 500:
+                self.rate = max(self.min_rate, self.rate / 2)
+                return
+            
+            rate = min(self.max_rate, self.rate + self.increase_step)
+            if remaining_minute is not None:
+                # Spread what is left of the per-minute quota over a full minute
+                rate = min(rate, max(self.min_rate, remaining_minute / 60.0))
+            self.rate = rate
+    
+    @property
+    def quota_exhausted(self):
+        """True once the API reports no calls left for today"""
+        return self.remaining_day is not None and self.remaining_day <= 0
+
+def _int_header(headers, name):
+    """Parse an integer response header, returning None if missing or malformed"""
+    try:
+        return int(float(headers[name]))
+    except (KeyError, TypeError, ValueError):
+        return None
+
+class RequestLatency:
+    def __init__(self, max_samples=10000):
+        """
+        Thread-safe record of per-request latency
+        
+        Each sample splits wall time into the wait for response headers (which
+        includes connect + TLS when no pooled connection was free) and the body
+        transfer.
+        """
+        self.wait_times = deque(maxlen=max_samples)
+        self.transfer_times = deque(maxlen=max_samples)
+        self.lock = threading.Lock()
+    
+    def record(self, wait_time, transfer_time):
+        with self.lock:
+            self.wait_times.append(wait_time)
+            self.transfer_times.append(transfer_time)
+    
+    def summary(self):
+        """Mean / p50 / p95 wait and transfer times in milliseconds"""
+        with self.lock:
+            wait_times = np.array(self.wait_times) * 1000
+            transfer_times = np.array(self.transfer_times) * 1000
+        
+        if not len(wait_times):
+            return {'requests': 0}
+        
+        result = {'requests': len(wait_times)}
+        for name, values in (('wait_ms', wait_times), ('transfer_ms', transfer_times)):
+            result[name] = {
+                'mean': float(values.mean()),
+                'p50': float(np.percentile(values, 50)),
+                'p95': float(np.percentile(values, 95)),
+            }
+        return result
 
 class OpenDotaCollector:
-    def __init__(self, api_key=None, delay=1.5):
+    def __init__(self, api_key=None, delay=1.5, max_concurrency=1, rate_limit=None, cache=None,
+                 max_rate=None, max_retries=5, backoff_base=1.0, backoff_cap=60.0,
+                 pool_size=None, connect_timeout=5.0, read_timeout=30.0):
         """
         Initialize OpenDota data collector
         
         Args:
             api_key: OpenDota API key (None for free tier)
-            delay: Delay between requests (seconds)
+            delay: Delay between requests (seconds), used when rate_limit is not set
+            max_concurrency: Number of match detail requests kept in flight at once
+            rate_limit: Starting requests per second (defaults to 1/delay)
+            cache: Optional MatchCache checked before fetching match details
+            max_rate: Ceiling the adaptive rate may climb to (defaults to rate_limit
+                without an API key, PAID_TIER_MAX_RATE with one)
+            max_retries: Retries for 429/5xx responses and connection errors
+            backoff_base: First retry backoff in seconds (doubles per attempt, with jitter)
+            backoff_cap: Longest single backoff in seconds
+            pool_size: Keep-alive connections kept open (defaults to max_concurrency)
+            connect_timeout: Seconds to wait for a connection
+            read_timeout: Seconds to wait for response data
         """
         self.api_key = api_key
         self.delay = delay
+        self.cache = cache
+        self.max_concurrency = max(1, max_concurrency)
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_cap = backoff_cap
         self.base_url = "https://api.opendota.com/api"
         
+        # One limiter shared by every worker thread keeps us within the tier limit
+        if rate_limit is None and delay > 0:
+            rate_limit = 1.0 / delay
+        if max_rate is None:
+            max_rate = max(PAID_TIER_MAX_RATE, rate_limit or 0) if api_key else rate_limit
+        self.rate_limiter = None
+        if rate_limit:
+            self.rate_limiter = AdaptiveRateLimiter(rate_limit, max_rate=max_rate,
+                                                    capacity=self.max_concurrency)
+        
         # Setup headers
         self.headers = {'Content-Type': 'application/json'}
         if api_key:
             self.headers['Authorization'] = f'Bearer {api_key}'
+        
+        # Pooled keep-alive session so match fetches reuse TCP+TLS connections
+        self.timeout = (connect_timeout, read_timeout)
+        self.pool_size = pool_size or self.max_concurrency
+        self.session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_size,
+                                                pool_block=True, max_retries=0)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        self.session.headers.update(self.headers)
+        self.session.headers['Accept-Encoding'] = ACCEPT_ENCODING
+        self.latency = RequestLatency()
     
     def make_request(self, endpoint):
-        """Make API request with rate limiting"""
-        url = f"{self.base_url}{endpoint}"
+        """Make an API GET request with adaptive rate limiting and retries"""
+        response = self.send_request(endpoint)
+        if response is None:
+            return None
+        return self.decode_json(response)
+    
+    def make_conditional_request(self, endpoint, etag=None):
+        """
+        GET an endpoint, letting the API answer 304 Not Modified if our copy is current
         
+        Returns:
+            (data, etag, not_modified); data is None when not modified or on failure
+        """
+        response = self.send_request(endpoint, {'If-None-Match': etag} if etag else None)
+        if response is None:
+            return None, etag, False
+        if response.status_code == 304:
+            return None, etag, True
+        data = self.decode_json(response)
+        if data is None:
+            return None, etag, False
+        return data, response.headers.get('ETag'), False
+    
+    def decode_json(self, response):
+        """Parse a response body, or None if it is not valid JSON (e.g. a proxy error page or cut-off body)"""
         try:
-            response = requests.get(url, headers=self.headers)
+            return response.json()
+        except ValueError as e:
+            print(f"Invalid JSON from {response.url}: {e}")
+            return None
+    
+    def send_request(self, endpoint, extra_headers=None):
+        """
+        Send a GET with adaptive rate limiting and retries
+        
+        Returns:
+            The 200 (or 304) response, or None if the request ultimately failed
+        """
+        url = f"{self.base_url}{endpoint}"
+        
+        for attempt in range(self.max_retries + 1):
+            if self.rate_limiter:
+                if self.rate_limiter.quota_exhausted:
+                    print(f"Daily API quota exhausted, skipping {url}")
+                    return None
+                self.rate_limiter.acquire()  # Rate limiting
             
-            if response.status_code == 200:
-                time.sleep(self.delay)  # Rate limiting
-                return response.json()
+            retry_after = None
+            try:
+                # stream=True returns once headers arrive, so body transfer is timed separately
+                start = time.perf_counter()
+                response = self.session.get(url, headers=extra_headers, timeout=self.timeout, stream=True)
+                headers_received = time.perf_counter()
+                response.content
+                self.latency.record(headers_received - start, time.perf_counter() - headers_received)
+            except requests.RequestException as e:
+                error = f"Request failed: {e}"
             else:
-                print(f"Error {response.status_code}: {url}")
-                return None
+                if self.rate_limiter:
+                    self.rate_limiter.record_response(response)
                 
-        except Exception as e:
-            print(f"Request failed: {e}")
-            return None
+                if response.status_code in (200, 304):
+                    return response
+                
+                error = f"Error {response.status_code}: {url}"
+                if response.status_code != 429 and response.status_code < 500:
+                    print(error)  # Not retryable (e.g. 404 for unknown matches)
+                    return None
+                retry_after = _int_header(response.headers, 'Retry-After')
+            
+            if attempt == self.max_retries:
+                break
+            
+            # Honour Retry-After for every worker; otherwise exponential backoff with full jitter
+            if retry_after is not None:
+                print(f"{error} - retrying in {retry_after}s ({attempt + 1}/{self.max_retries})")
+                if self.rate_limiter:
+                    self.rate_limiter.pause(retry_after)
+                else:
+                    time.sleep(retry_after)
+            else:
+                backoff = random.uniform(0, min(self.backoff_cap, self.backoff_base * 2 ** attempt))
+                print(f"{error} - retrying in {backoff:.1f}s ({attempt + 1}/{self.max_retries})")
+                time.sleep(backoff)
+        
+        print(f"{error} - giving up after {self.max_retries} retries")
+        return None
+    
+    def connections_opened(self):
+        """Number of TCP connections opened so far (each one paid a TCP+TLS handshake)"""
+        pools = self.session.get_adapter(self.base_url).poolmanager.pools
+        return sum(pools[key].num_connections for key in pools.keys())
+    
+    def latency_summary(self):
+        """Per-request latency split plus connection reuse for this collector"""
+        summary = self.latency.summary()
+        summary['connections_opened'] = self.connections_opened()
+        return summary
     
-    def get_recent_matches(self, limit=100, min_rank=5):
+    def get_recent_matches(self, limit=100, min_rank=5, less_than_match_id=None):
         """
         Get recent public matches
         
         Args:
-            limit: Number of matches to fetch
+            limit: Maximum number of matches to return (the API pages ~100 at a time)
             min_rank: Minimum skill level (5 = Ancient, 6 = Divine, 7 = Immortal)
+            less_than_match_id: Only return matches older than this ID (for paging)
         """
         endpoint = f"/publicMatches?min_rank={min_rank}"
-        return self.make_request(endpoint)
+        if less_than_match_id:
+            endpoint += f"&less_than_match_id={less_than_match_id}"
+        
+        matches = self.make_request(endpoint)
+        if matches:
+            matches = matches[:limit]
+        return matches
     
     def get_match_details(self, match_id):
-        """Get detailed match information"""
+        """Get detailed match information (from the local cache when available)"""
+        if self.cache is not None:
+            match_data = self.cache.get(match_id)
+            if match_data is not None:
+                return match_data
+        
         endpoint = f"/matches/{match_id}"
-        return self.make_request(endpoint)
+        match_data = self.make_request(endpoint)
+        
+        if match_data and self.cache is not None:
+            self.cache.put(match_data)
+        return match_data
+    
+    def fetch_match_details_concurrent(self, match_ids, max_concurrency=None):
+        """
+        Fetch match details with several requests in flight at once
+        
+        Yields (match_id, match_details) tuples in completion order, so callers
+        can process finished matches while later requests are still pending.
+        match_details is None for failed requests.
+        
+        Args:
+            match_ids: Iterable of match IDs to fetch
+            max_concurrency: Requests kept in flight (defaults to self.max_concurrency)
+        """
+        max_concurrency = max_concurrency or self.max_concurrency
+        match_ids = iter(match_ids)
+        
+        with ThreadPoolExecutor(max_workers=max_concurrency) as executor:
+            pending = {}
+            
+            def submit_next():
+                for match_id in match_ids:
+                    pending[executor.submit(self.get_match_details, match_id)] = match_id
+                    return True
+                return False
+            
+            for _ in range(max_concurrency):
+                if not submit_next():
+                    break
+            
+            while pending:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    match_id = pending.pop(future)
+                    submit_next()
+                    yield match_id, future.result()
     
     def get_heroes(self):
         """Get hero data"""
@@ -74,32 +408,67 @@ class OpenDotaCollector:
         endpoint = "/constants/items"
         return self.make_request(endpoint)
 
+def item_build_example(hero_name, enemy_heroes, duration_minutes, build_items):
+    """
+    Item build training pair for one successful player
+
+    Args:
+        hero_name: Player's hero
+        enemy_heroes: Comma-separated names of (up to three) enemy heroes
+        duration_minutes: Match length in minutes
+        build_items: Comma-separated names of the player's (up to six) items
+    """
+    return {
+        "instruction": f"What items should I build on {hero_name} against {enemy_heroes}?",
+        "output": f"Based on a successful {duration_minutes}-minute match, consider building: {build_items}. This build was effective against mobile cores and provided good survivability and utility for team fights."
+    }
+
+def performance_example(hero_name, gpm, key_items, duration_minutes):
+    """
+    "How do I play" training pair for one successful, well-farmed player
+
+    Args:
+        hero_name: Player's hero
+        gpm: Player's gold per minute
+        key_items: Comma-separated names of the player's first (up to four) items
+        duration_minutes: Match length in minutes
+    """
+    return {
+        "instruction": f"How do I play {hero_name} effectively?",
+        "output": f"Focus on your core items and positioning. In successful matches, {hero_name} averages {gpm} GPM and maintains a positive KDA. Key items include {key_items}. Prioritize team fights after getting your core items around {duration_minutes//2} minutes."
+    }
+
 class TrainingDataGenerator:
-    def __init__(self, collector):
+    def __init__(self, collector, constants=None):
+        """
+        Args:
+            collector: OpenDotaCollector used for match and constants requests
+            constants: GameConstantsCache (defaults to one backed by config.HEROES_DATA_FILE
+                and config.ITEMS_DATA_FILE)
+        """
         self.collector = collector
+        self.constants = constants or GameConstantsCache(
+            collector, config.HEROES_DATA_FILE, config.ITEMS_DATA_FILE,
+            max_age_days=config.CONSTANTS_MAX_AGE_DAYS
+        )
         self.heroes = {}
         self.items = {}
         self.load_game_data()
     
     def load_game_data(self):
-        """Load hero and item data for reference"""
+        """Load hero and item data for reference (from disk unless stale)"""
         print("Loading game constants...")
-        
-        # Load heroes
-        heroes_data = self.collector.get_heroes()
-        if heroes_data:
-            self.heroes = {hero['id']: hero for hero in heroes_data}
-            print(f"Loaded {len(self.heroes)} heroes")
-        
-        # Load items and create ID-based lookup
-        items_data = self.collector.get_items()
-        if items_data:
-            # Convert from name-based dict to ID-based dict
-            self.items = {}
-            for item_name, item_data in items_data.items():
-                if 'id' in item_data:
-                    self.items[item_data['id']] = item_data
-            print(f"Loaded {len(self.items)} items")
+        self.constants.load()
+        self.heroes = self.constants.heroes
+        self.items = self.constants.items
+        print(f"Loaded {len(self.heroes)} heroes")
+        print(f"Loaded {len(self.items)} items")
+    
+    def note_match_patch(self, match_data):
+        """Refresh the game constants if this match is from a newer patch"""
+        if self.constants.note_patch(match_data.get('patch')):
+            self.heroes = self.constants.heroes
+            self.items = self.constants.items
     
     def get_hero_name(self, hero_id):
         """Get hero name from ID"""
@@ -172,66 +541,99 @@ class TrainingDataGenerator:
                     if (j < 5) != is_radiant:  # Opposite team
                         enemy_heroes.append(self.get_hero_name(enemy.get('hero_id')))
                 
-                item_build_qa = {
-                    "instruction": f"What items should I build on {hero_name} against {', '.join(enemy_heroes[:3])}?",
-                    "output": f"Based on a successful {duration_minutes}-minute match, consider building: {', '.join(items[:6])}. This build was effective against mobile cores and provided good survivability and utility for team fights."
-                }
-                training_pairs.append(item_build_qa)
+                training_pairs.append(item_build_example(
+                    hero_name, ', '.join(enemy_heroes[:3]), duration_minutes, ', '.join(items[:6])))
                 
                 # Performance question
                 if gpm > 400:  # Decent farm
-                    performance_qa = {
-                        "instruction": f"How do I play {hero_name} effectively?",
-                        "output": f"Focus on your core items and positioning. In successful matches, {hero_name} averages {gpm} GPM and maintains a positive KDA. Key items include {', '.join(items[:4])}. Prioritize team fights after getting your core items around {duration_minutes//2} minutes."
-                    }
-                    training_pairs.append(performance_qa)
+                    training_pairs.append(performance_example(
+                        hero_name, gpm, ', '.join(items[:4]), duration_minutes))
         
         return training_pairs
     
-    def generate_meta_analysis(self, all_matches_data):
-        """Generate meta analysis training examples based on collected matches"""
-        meta_examples = []
+    def analyze_matches_batch(self, matches):
+        """
+        Extract training examples from a batch of matches
+        
+        Produces the same examples, in the same order, as calling
+        analyze_match_for_training on each match, but filters and maps IDs to
+        names with vectorized operations over a columnar player table.
+        """
+        table = build_player_table(matches)
+        if table.empty:
+            return []
         
-        # Analyze hero popularity, win rates, and game patterns
-        hero_picks = {}
-        hero_wins = {}
-        role_items = {"carry": {}, "support": {}, "mid": {}, "offlane": {}}
-        game_durations = []
-        first_blood_times = []
-        popular_item_combos = {}
+        hero_names = self.constants.hero_names
+        item_names = self.constants.item_names
         
-        for match_data in all_matches_data:
-            if not match_data or 'players' not in match_data:
-                continue
-                
-            duration = match_data.get('duration', 0)
-            game_durations.append(duration)
+        item_ids = table[ITEM_COLUMNS].to_numpy()
+        has_item = item_ids != 0
+        kills, deaths, assists = (table[c].to_numpy() for c in ('kills', 'deaths', 'assists'))
+        
+        # Only successful players with a real build become examples
+        eligible = ((table['hero_id'].to_numpy() > 0) & (has_item.sum(axis=1) >= 3) &
+                    table['win'].to_numpy() & (kills + assists > deaths))
+        
+        # First three heroes per (match, team), joined once per team instead of per player
+        hero_name = hero_names(table['hero_id'].to_numpy())
+        team_key = table['match_index'].to_numpy() * 2 + table['team'].to_numpy()
+        first_three = table.groupby(team_key).cumcount().to_numpy() < 3
+        team_heroes = {}
+        for key, name in zip(team_key[first_three].tolist(), hero_name[first_three]):
+            team_heroes.setdefault(key, []).append(name)
+        team_heroes = {key: ', '.join(names) for key, names in team_heroes.items()}
+        
+        enemy_keys = (team_key[eligible] ^ 1).tolist()  # Flip the team bit
+        enemies = [team_heroes.get(key, '') for key in enemy_keys]
+        
+        # Shift each row's items left past empty slots, then join the first 6 / first 4
+        row_has_item = has_item[eligible]
+        order = np.argsort(~row_has_item, axis=1, kind='stable')
+        counts = row_has_item.sum(axis=1)
+        names = item_names(np.take_along_axis(item_ids[eligible], order, axis=1).ravel())
+        names = names.reshape(-1, len(ITEM_COLUMNS))
+        
+        def join_items(limit):
+            joined = names[:, 0].copy()
+            for column in range(1, limit):
+                joined = np.where(counts > column, joined + ', ' + names[:, column], joined)
+            return joined
+        
+        build_items = join_items(6)
+        key_items = join_items(4)
+        
+        training_pairs = []
+        for hero, enemy_list, build, key, minutes, gpm in zip(
+                hero_name[eligible], enemies, build_items, key_items,
+                table['duration_minutes'].to_numpy()[eligible].tolist(),
+                table['gold_per_min'].to_numpy()[eligible].tolist()):
             
-            radiant_win = match_data.get('radiant_win', False)
-            first_blood_time = match_data.get('first_blood_time', 0)
-            if first_blood_time > 0:
-                first_blood_times.append(first_blood_time)
-                
-            for i, player in enumerate(match_data['players']):
-                hero_id = player.get('hero_id')
-                if not hero_id:
-                    continue
-                    
-                hero_name = self.get_hero_name(hero_id)
-                hero_picks[hero_name] = hero_picks.get(hero_name, 0) + 1
-                
-                # Track win rates
-                is_radiant = i < 5
-                won = (is_radiant and radiant_win) or (not is_radiant and not radiant_win)
-                if hero_name not in hero_wins:
-                    hero_wins[hero_name] = {'wins': 0, 'games': 0}
-                hero_wins[hero_name]['games'] += 1
-                if won:
-                    hero_wins[hero_name]['wins'] += 1
+            training_pairs.append(item_build_example(hero, enemy_list, minutes, build))
+            
+            if gpm > 400:
+                training_pairs.append(performance_example(hero, gpm, key, minutes))
+        
+        return training_pairs
+    
+    def generate_meta_analysis(self, aggregate):
+        """
+        Generate meta analysis training examples based on collected matches
+        
+        Args:
+            aggregate: MetaAggregate accumulated while collecting (an iterable of
+                match payloads is also accepted and aggregated on the fly)
+        """
+        meta_examples = []
+        
+        if not isinstance(aggregate, MetaAggregate):
+            matches, aggregate = aggregate, MetaAggregate()
+            for match_data in matches:
+                aggregate.update(match_data)
         
         # Generate meta training examples
-        if hero_picks:
-            top_heroes = sorted(hero_picks.items(), key=lambda x: x[1], reverse=True)[:10]
+        if aggregate.hero_picks.any():
+            top_heroes = [(self.get_hero_name(hero_id), int(aggregate.hero_picks[hero_id]))
+                          for hero_id in aggregate.top_heroes(10)]
             
             meta_qa = {
                 "instruction": "What is the current meta in Dota 2? Which heroes are popular right now?",
@@ -256,8 +658,8 @@ class TrainingDataGenerator:
             meta_examples.append(bot_lane_qa)
             
             # Game timing and strategy examples
-            if game_durations:
-                avg_duration = sum(game_durations) / len(game_durations)
+            if aggregate.average_duration:
+                avg_duration = aggregate.average_duration
                 timing_qa = {
                     "instruction": "What is the average game length in current Dota 2 meta? When should I focus on objectives?",
                     "output": f"Based on recent high-skill matches from the current patch (January 2025), games average {avg_duration//60:.0f} minutes. This is fresh data from live matches, not outdated statistics. Focus on taking towers and Roshan around 20-25 minutes when cores have key items. Late game teamfights become critical after 35+ minutes."
@@ -316,79 +718,271 @@ class TrainingDataGenerator:
         
         return meta_examples
     
-    def collect_training_data(self, num_matches=1000):
-        """Collect training data from multiple matches"""
-        training_data = []
-        processed_matches = 0
-        failed_requests = 0
-        all_matches = []
+    def format_build(self, item_ids, timings):
+        """Join item names, with the average purchase minute where it is known"""
+        parts = []
+        for item_id in item_ids:
+            name = self.get_item_name(item_id)
+            parts.append(f"{name} (~{timings[item_id] / 60:.0f} min)" if item_id in timings else name)
+        return ', '.join(parts)
+    
+    def generate_build_examples(self, build_aggregate, min_games=None, min_matchup_games=None, max_items=6):
+        """
+        Generate one item build example per hero and per hero-vs-enemy matchup
         
-        print(f"Starting data collection for {num_matches} matches...")
+        Items are ranked by how often they were built weighted by their smoothed
+        win rate, then listed in average purchase order when timings are known.
         
-        # OpenDota API returns ~100 matches per request, so make multiple requests
-        batches_needed = (num_matches // 100) + 1
-        print(f"Making {batches_needed} API calls to get {num_matches} matches...")
+        Args:
+            build_aggregate: HeroBuildAggregate accumulated while collecting
+            min_games: Games a hero needs for its own examples (default config.BUILD_MIN_GAMES)
+            min_matchup_games: Games a matchup needs for an example (default config.MATCHUP_MIN_GAMES)
+            max_items: Items listed per build
+        """
+        min_games = config.BUILD_MIN_GAMES if min_games is None else min_games
+        min_matchup_games = config.MATCHUP_MIN_GAMES if min_matchup_games is None else min_matchup_games
+        examples = []
+        hero_builds = {}
+        hero_timings = {}
         
-        for batch in range(batches_needed):
-            print(f"Fetching batch {batch + 1}/{batches_needed}...")
-            recent_matches = self.collector.get_recent_matches(limit=100)
-            
-            if not recent_matches:
-                print(f"Failed to get matches for batch {batch + 1}")
+        for hero_id in build_aggregate.hero_ids():
+            games, wins, win_gpm_total = build_aggregate.hero_summary(hero_id)
+            item_ids, values = build_aggregate.hero_item_table(hero_id)
+            timed = values[:, 2] > 0
+            timings = dict(zip(item_ids[timed].tolist(), (values[timed, 3] / values[timed, 2]).tolist()))
+            hero_timings[hero_id] = timings
+            if games < min_games:
                 continue
-                
-            all_matches.extend(recent_matches)
-            print(f"Got {len(recent_matches)} matches in batch {batch + 1}")
             
-            # Stop if we have enough matches
-            if len(all_matches) >= num_matches:
-                break
-                
-            # Small delay between batches to avoid rate limiting
-            time.sleep(2)
-        
-        print(f"Collected {len(all_matches)} total matches from API")
-        
-        # Process the matches
-        detailed_matches = []
-        for match_info in all_matches[:num_matches]:
-            match_id = match_info.get('match_id')
-            if not match_id:
+            win_rate = wins / games
+            ranked, _, smoothed = rank_build_items(item_ids, values[:, 0], values[:, 1], games, win_rate)
+            if len(ranked) == 0:
                 continue
+            build = sorted(ranked[:max_items].tolist(), key=lambda item_id: timings.get(item_id, float('inf')))
+            hero_builds[hero_id] = build
             
-            print(f"Processing match {match_id} ({processed_matches + 1}/{num_matches})")
+            hero = self.get_hero_name(hero_id)
+            top_item = int(ranked[0])
+            top_share = values[item_ids == top_item, 0][0] / games
+            order_note = " Items are listed in their usual purchase order." if timings else ""
+            examples.append({
+                "instruction": f"What items should I build on {hero}?",
+                "output": f"Across {games:.0f} high-skill {hero} games ({win_rate:.0%} win rate), the most successful build is: {self.format_build(build, timings)}.{order_note} {self.get_item_name(top_item)} is the standout pick, built in {top_share:.0%} of games with a {smoothed[0]:.0%} win rate."
+            })
             
-            # Get detailed match data
-            match_details = self.collector.get_match_details(match_id)
+            if wins:
+                core = build[:4]
+                timing_note = ""
+                if len(core) >= 3 and core[2] in timings:
+                    timing_note = f" Core items are usually complete by around {timings[core[2]] / 60:.0f} minutes, so plan your fights around that timing."
+                examples.append({
+                    "instruction": f"How do I play {hero} effectively?",
+                    "output": f"Focus on your core items and positioning. In {wins:.0f} winning games, {hero} averaged {win_gpm_total / wins:.0f} GPM. Key items include {', '.join(self.get_item_name(item_id) for item_id in core)}.{timing_note}"
+                })
+        
+        for hero_id, enemy_id, games, wins in build_aggregate.matchup_list(min_matchup_games):
+            item_ids, values = build_aggregate.matchup_item_table(hero_id, enemy_id)
+            ranked = rank_build_items(item_ids, values[:, 0], values[:, 1], games, wins / games)[0]
+            if len(ranked) == 0:
+                continue
+            timings = hero_timings.get(hero_id, {})
+            build = sorted(ranked[:max_items].tolist(), key=lambda item_id: timings.get(item_id, float('inf')))
             
+            hero, enemy = self.get_hero_name(hero_id), self.get_hero_name(enemy_id)
+            output = f"Across {games:.0f} games against {enemy} ({wins / games:.0%} win rate), {hero} did best with: {self.format_build(build, timings)}."
+            situational = [item_id for item_id in build if item_id not in hero_builds.get(hero_id, build)]
+            if situational:
+                output += f" Compared with the usual {hero} build, prioritize {', '.join(self.get_item_name(item_id) for item_id in situational)} in this matchup."
+            examples.append({
+                "instruction": f"What items should I build on {hero} against {enemy}?",
+                "output": output
+            })
+        
+        return examples
+    
+    def iter_match_details(self, num_matches=1000, crawler=None):
+        """
+        Fetch stage of the collection pipeline: yield match payloads as they arrive
+        
+        Args:
+            num_matches: Number of new matches to fetch
+            crawler: MatchCrawler to page through publicMatches (defaults to an in-memory crawler)
+        """
+        fetched = 0
+        failed_requests = 0
+        consecutive_failures = 0
+        
+        if crawler is None:
+            crawler = MatchCrawler(self.collector)
+        
+        # Page through publicMatches lazily; details are fetched as new IDs arrive
+        match_ids = (m['match_id'] for m in crawler.crawl(num_matches))
+        
+        for match_id, match_details in self.collector.fetch_match_details_concurrent(match_ids):
             if match_details:
-                # Extract training examples
-                match_training_data = self.analyze_match_for_training(match_details)
-                training_data.extend(match_training_data)
-                detailed_matches.append(match_details)  # Save for meta analysis
-                processed_matches += 1
-                
-                if processed_matches % 50 == 0:
-                    print(f"Processed {processed_matches} matches, generated {len(training_data)} training examples")
+                fetched += 1
+                consecutive_failures = 0
+                print(f"Processing match {match_id} ({fetched}/{num_matches})")
+                yield match_details
             else:
+                # Transient errors are already retried in make_request, so only a
+                # run of failures means the API is unusable. The match is not marked
+                # seen, so a later crawl over this range retries it.
+                crawler.release(match_id)
                 failed_requests += 1
-                if failed_requests > 10:
-                    print("Too many failed requests, stopping...")
+                consecutive_failures += 1
+                if consecutive_failures > 10:
+                    print("Too many consecutive failed requests, stopping...")
                     break
         
+        print(f"Failed requests: {failed_requests}")
+    
+    def stream_training_data(self, matches, output_path, resume=False, fsync_every=100, batch_size=1,
+                             include_aggregates=True, aggregate_builds=False, crawler=None):
+        """
+        Analyze matches and append training pairs to a JSONL file as they are produced
+        
+        Meta statistics are accumulated in a MetaAggregate saved next to the output
+        (<output>.meta.npz) at every checkpoint, so meta analysis never needs the
+        full payloads. Meta examples are appended once all matches are processed;
+        a resumed run truncates them and writes a fresh set at the end.
+        
+        With aggregate_builds, matches are counted into a HeroBuildAggregate
+        (<output>.builds.npz) instead of producing per-player examples, and one
+        build example per hero and matchup is appended at the end like the meta examples.
+        
+        Args:
+            matches: Iterable of match payloads (e.g. iter_match_details() or MatchCache.iter_matches())
+            output_path: Training data JSONL file
+            resume: Continue an interrupted run instead of overwriting the file
+            fsync_every: Checkpoint the output and aggregate to disk after this many matches
+                (0 checkpoints only at the end)
+            batch_size: Analyze matches in batches of this size with analyze_matches_batch
+                (use 1 for live crawls so every match is written as soon as it arrives)
+            include_aggregates: Append the meta (and build) examples at the end (shards leave
+                this to the merge step, which generates them from the merged aggregates)
+            aggregate_builds: Replace per-match item build examples with hero-level aggregates
+            crawler: MatchCrawler the matches came from; matches are committed to it (and its
+                cursor saved) only at checkpoints, once their examples are durable
+        
+        Returns:
+            Total number of training examples in the file
+        """
+        output_path = Path(output_path)
+        aggregate_path = output_path.with_name(output_path.name + '.meta.npz')
+        builds_path = output_path.with_name(output_path.name + '.builds.npz')
+        processed_matches = 0
+        
+        with JsonlWriter(output_path, resume=resume, fsync_every=0) as writer:
+            # Aggregated runs write no examples before the final checkpoint, so the
+            # saved aggregates alone record their progress
+            resuming = resume and (writer.count or aggregate_builds)
+            aggregate = MetaAggregate()
+            if resuming and aggregate_path.exists():
+                aggregate = MetaAggregate.load(aggregate_path)
+            builds = None
+            if aggregate_builds:
+                builds = (HeroBuildAggregate.load(builds_path) if resuming and builds_path.exists()
+                          else HeroBuildAggregate())
+            
+            uncommitted = []
+            
+            def checkpoint():
+                aggregate.save(aggregate_path)
+                if builds is not None:
+                    builds.save(builds_path)
+                writer.checkpoint()
+                if crawler is not None:
+                    crawler.commit(uncommitted)
+                    crawler.save_cursor()
+                uncommitted.clear()
+            
+            batch = []
+            for match_details in matches:
+                self.note_match_patch(match_details)
+                batch.append(match_details)
+                uncommitted.append(match_details.get('match_id'))
+                aggregate.update(match_details)
+                if len(batch) < batch_size:
+                    continue
+                
+                if builds is not None:
+                    builds.update(batch, self.constants.item_ids_by_key)
+                else:
+                    examples = (self.analyze_matches_batch(batch) if batch_size > 1
+                                else self.analyze_match_for_training(match_details))
+                    for example in examples:
+                        writer.write(example)
+                
+                previous = processed_matches
+                processed_matches += len(batch)
+                batch = []
+                
+                if fsync_every and processed_matches // fsync_every > previous // fsync_every:
+                    checkpoint()
+                    print(f"Processed {processed_matches} matches, {writer.count} training examples on disk")
+            
+            if batch:
+                if builds is not None:
+                    builds.update(batch, self.constants.item_ids_by_key)
+                else:
+                    for example in self.analyze_matches_batch(batch):
+                        writer.write(example)
+                processed_matches += len(batch)
+            
+            checkpoint()
+            
+            # Aggregate examples come after the checkpoint so a resumed run replaces them
+            if builds is not None and include_aggregates:
+                print("Generating hero build examples...")
+                build_examples = self.generate_build_examples(builds)
+                for example in build_examples:
+                    writer.write(example)
+                print(f"Added {len(build_examples)} build examples from {builds.num_matches} matches")
+            
+            if include_aggregates:
+                print("Generating meta analysis examples...")
+                meta_examples = self.generate_meta_analysis(aggregate)
+                for example in meta_examples:
+                    writer.write(example)
+                print(f"Added {len(meta_examples)} meta analysis examples")
+            
+            total_examples = writer.count
+        
+        print(f"Processed: {processed_matches} matches")
+        print(f"Saved {total_examples} training examples to {output_path}")
+        return total_examples
+    
+    def collect_training_data(self, num_matches=1000, crawler=None):
+        """Collect training data from multiple matches into an in-memory list"""
+        training_data = []
+        aggregate = MetaAggregate()
+        
+        print(f"Starting data collection for {num_matches} matches...")
+        
+        for match_details in self.iter_match_details(num_matches, crawler):
+            self.note_match_patch(match_details)
+            training_data.extend(self.analyze_match_for_training(match_details))
+            aggregate.update(match_details)
+        
         # Generate meta analysis examples
         print("Generating meta analysis examples...")
-        meta_examples = self.generate_meta_analysis(detailed_matches)
+        meta_examples = self.generate_meta_analysis(aggregate)
         training_data.extend(meta_examples)
         print(f"Added {len(meta_examples)} meta analysis examples")
         
         print(f"Data collection complete!")
-        print(f"Processed: {processed_matches} matches")
+        print(f"Processed: {aggregate.num_matches} matches")
         print(f"Generated: {len(training_data)} training examples")
-        print(f"Failed requests: {failed_requests}")
         
         return training_data
     
+    def write_meta_examples(self, aggregate, output_path):
+        """Write meta examples for a (possibly merged) aggregate without touching any match data"""
+        meta_examples = self.generate_meta_analysis(aggregate)
+        self.save_training_data(meta_examples, output_path)
+        return meta_examples
+    
     def save_training_data(self, training_data, filename="dota2_training_data.jsonl"):
         """Save training data to JSONL format"""
         output_path = Path(filename)
@@ -0,0 +1,121 @@
+"""
+On-disk cache of tokenized training datasets
+Tokenizes a JSONL training file once and stores input_ids and lengths as
+Arrow files, keyed by the data file contents, the tokenizer and the maximum
+sequence length. Cached datasets are memory-mapped when loaded, so restarts
+and sweeps skip tokenization and keep little of the data in RAM.
+"""
+
+import hashlib
+import json
+import shutil
+from pathlib import Path
+from datasets import Dataset, load_from_disk
+try:
+    from .sequence_packing import pack_tokenized_dataset
+except ImportError:
+    from src.sequence_packing import pack_tokenized_dataset
+
+# Bump when the tokenization recipe changes so stale caches are rebuilt
+CACHE_VERSION = 1
+
+def file_digest(path, chunk_size=1 << 20):
+    """SHA-256 of a file's contents, read in chunks"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def tokenizer_fingerprint(tokenizer):
+    """Identify a tokenizer by its name, vocabulary and special tokens"""
+    vocab = json.dumps(sorted(tokenizer.get_vocab().items()), ensure_ascii=False)
+    return {
+        'name_or_path': str(tokenizer.name_or_path),
+        'vocab_sha256': hashlib.sha256(vocab.encode('utf-8')).hexdigest(),
+        'bos_token': tokenizer.bos_token,
+        'eos_token': tokenizer.eos_token,
+        'pad_token': tokenizer.pad_token,
+        'chat_template_sha256': hashlib.sha256((tokenizer.chat_template or '').encode('utf-8')).hexdigest(),
+    }
+
+def dataset_cache_key(data_path, tokenizer, max_length, mode='text'):
+    """
+    Cache key for a tokenized dataset
+
+    Args:
+        data_path: JSONL training data file
+        tokenizer: Tokenizer used for training
+        max_length: Truncation length (config.MAX_LENGTH)
+        mode: Name of the tokenization recipe (different recipes never share a cache)
+    """
+    key = {
+        'version': CACHE_VERSION,
+        'data_sha256': file_digest(data_path),
+        'tokenizer': tokenizer_fingerprint(tokenizer),
+        'max_length': max_length,
+        'mode': mode,
+    }
+    return hashlib.sha256(json.dumps(key, sort_keys=True).encode('utf-8')).hexdigest()[:16], key
+
+def _with_lengths(batch, tokenize_batch):
+    """Tokenize a batch and record each example's length (used for bucketing and stats)"""
+    tokenized = tokenize_batch(batch)
+    tokenized['length'] = [len(ids) for ids in tokenized['input_ids']]
+    return tokenized
+
+def load_or_build_tokenized_dataset(data_path, tokenizer, tokenize_batch, max_length, cache_dir,
+                                    mode='text', rebuild=False, num_proc=None, packed=False):
+    """
+    Load a tokenized dataset from the cache, building it first if needed
+
+    Args:
+        data_path: JSONL training data file
+        tokenizer: Tokenizer used for training (part of the cache key)
+        tokenize_batch: Function mapping a batch dict of raw columns to tokenized columns
+        max_length: Truncation length (part of the cache key)
+        cache_dir: Directory holding one subdirectory per cached dataset
+        mode: Name of the tokenization recipe (part of the cache key)
+        rebuild: Ignore an existing cache entry
+        num_proc: Worker processes for tokenization
+        packed: Pack examples into max_length rows (cached separately from the unpacked dataset)
+
+    Returns:
+        Memory-mapped Dataset with input_ids, length and any other columns tokenize_batch returns
+    """
+    key, key_info = dataset_cache_key(data_path, tokenizer, max_length, mode)
+    cache_path = Path(cache_dir) / f"{Path(data_path).stem}-{mode}-{key}"
+    if packed:
+        cache_path = cache_path.with_name(cache_path.name + '-packed')
+
+    if cache_path.exists() and not rebuild:
+        dataset = load_from_disk(str(cache_path))
+        print(f"Loaded tokenized dataset from {cache_path} ({len(dataset)} examples)")
+        return dataset
+
+    if packed:
+        unpacked = load_or_build_tokenized_dataset(data_path, tokenizer, tokenize_batch, max_length, cache_dir,
+                                                   mode=mode, rebuild=rebuild, num_proc=num_proc)
+        print(f"Packing into {max_length}-token rows (writing {cache_path})")
+        dataset = pack_tokenized_dataset(unpacked, max_length)
+    else:
+        print(f"Tokenizing {data_path} (cache miss, writing {cache_path})")
+        # from_json streams the file into Arrow instead of building a Python list
+        raw = Dataset.from_json(str(data_path))
+        dataset = raw.map(_with_lengths, fn_kwargs={'tokenize_batch': tokenize_batch}, batched=True,
+                          remove_columns=raw.column_names, num_proc=num_proc, desc="Tokenizing")
+
+    # Write to a temporary directory and rename so an interrupted build is never loaded
+    tmp_path = cache_path.with_name(cache_path.name + '.tmp')
+    if tmp_path.exists():
+        shutil.rmtree(tmp_path)
+    dataset.save_to_disk(str(tmp_path))
+    with open(tmp_path / 'cache_key.json', 'w', encoding='utf-8') as f:
+        json.dump(key_info, f, indent=2)
+    if cache_path.exists():
+        shutil.rmtree(cache_path)
+    tmp_path.rename(cache_path)
+
+    dataset = load_from_disk(str(cache_path))
+    print(f"Cached {len(dataset)} tokenized {'rows' if packed else 'examples'} ({sum(dataset['length'])} tokens)")
+    return dataset
@@ -0,0 +1,142 @@
+"""
+Exact and near-duplicate removal for generated training pairs
+Exact duplicates are caught by hashing normalized text. Near duplicates are
+caught with MinHash signatures over word shingles and LSH banding, in a single
+streaming pass that keeps only the signatures of retained pairs in memory.
+"""
+
+import hashlib
+import re
+import zlib
+import numpy as np
+
+# Mersenne prime for the universal hash family used by MinHash
+MERSENNE_PRIME = np.uint64((1 << 61) - 1)
+MAX_HASH = np.uint64((1 << 32) - 1)
+
+WHITESPACE_RE = re.compile(r'\s+')
+NUMBER_RE = re.compile(r'\d+(?:[.,]\d+)*')
+WORD_RE = re.compile(r'\w+')
+
+def normalize_text(text):
+    """Lowercase and collapse whitespace"""
+    return WHITESPACE_RE.sub(' ', text.lower()).strip()
+
+def example_text(example):
+    """Text of a training pair used for duplicate detection"""
+    return f"{example.get('instruction', '')}\n{example.get('output', '')}"
+
+class MinHashDeduplicator:
+    def __init__(self, threshold=0.8, num_perm=64, bands=16, shingle_size=3, mask_numbers=True, seed=1):
+        """
+        Initialize the deduplicator
+
+        Args:
+            threshold: Estimated Jaccard similarity at or above which a pair counts as a near duplicate
+            num_perm: MinHash permutations per signature
+            bands: LSH bands (num_perm must divide evenly); more bands find more candidates
+            shingle_size: Words per shingle
+            mask_numbers: Treat all numbers as equal, so template answers that differ only
+                in GPM, durations or counts collapse together
+            seed: Seed for the hash permutations
+        """
+        if num_perm % bands:
+            raise ValueError("num_perm must be a multiple of bands")
+
+        self.threshold = threshold
+        self.num_perm = num_perm
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.shingle_size = shingle_size
+        self.mask_numbers = mask_numbers
+
+        rng = np.random.default_rng(seed)
+        self.perm_a = rng.integers(1, MERSENNE_PRIME, size=num_perm, dtype=np.uint64)
+        self.perm_b = rng.integers(0, MERSENNE_PRIME, size=num_perm, dtype=np.uint64)
+
+        self.exact_hashes = set()
+        self.band_buckets = [dict() for _ in range(bands)]
+        self.signatures = []
+        self.stats = {'seen': 0, 'kept': 0, 'exact_duplicates': 0, 'near_duplicates': 0}
+
+    def shingles(self, text):
+        """Hashed word shingles of a normalized text"""
+        if self.mask_numbers:
+            text = NUMBER_RE.sub('0', text)
+        words = WORD_RE.findall(text)
+        if len(words) <= self.shingle_size:
+            grams = {' '.join(words)}
+        else:
+            grams = {' '.join(words[i:i + self.shingle_size]) for i in range(len(words) - self.shingle_size + 1)}
+        return np.fromiter((zlib.crc32(gram.encode('utf-8')) for gram in grams), dtype=np.uint64, count=len(grams))
+
+    def signature(self, text):
+        """MinHash signature (num_perm uint32 values) of a normalized text"""
+        shingles = self.shingles(text)
+        # (a * x + b) mod p for every permutation and shingle, then the minimum per permutation
+        hashed = (np.outer(self.perm_a, shingles) + self.perm_b[:, None]) % MERSENNE_PRIME
+        return (hashed & MAX_HASH).min(axis=1).astype(np.uint32)
+
+    def is_duplicate(self, text):
+        """
+        Check a text against everything kept so far, and keep it if it is new
+
+        Returns:
+            None if the text was kept, else 'exact' or 'near'
+        """
+        self.stats['seen'] += 1
+        normalized = normalize_text(text)
+
+        digest = hashlib.sha1(normalized.encode('utf-8')).digest()
+        if digest in self.exact_hashes:
+            self.stats['exact_duplicates'] += 1
+            return 'exact'
+
+        signature = self.signature(normalized)
+        band_keys = [signature[band * self.rows:(band + 1) * self.rows].tobytes() for band in range(self.bands)]
+
+        # Any kept text sharing a band is a candidate; confirm with the estimated Jaccard similarity
+        checked = set()
+        for band, key in enumerate(band_keys):
+            candidate = self.band_buckets[band].get(key)
+            if candidate is None or candidate in checked:
+                continue
+            checked.add(candidate)
+            if np.mean(self.signatures[candidate] == signature) >= self.threshold:
+                self.stats['near_duplicates'] += 1
+                return 'near'
+
+        index = len(self.signatures)
+        self.signatures.append(signature)
+        self.exact_hashes.add(digest)
+        for band, key in enumerate(band_keys):
+            self.band_buckets[band].setdefault(key, index)
+        self.stats['kept'] += 1
+        return None
+
+def deduplicate(examples, deduplicator=None, count_tokens=None):
+    """
+    Filter an iterable of training pairs, yielding only the first of each duplicate group
+
+    Args:
+        examples: Iterable of {'instruction': ..., 'output': ...} dicts
+        deduplicator: MinHashDeduplicator to use (default settings if None)
+        count_tokens: Optional function text -> token count for the savings report
+            (whitespace-separated words are counted otherwise)
+
+    Yields:
+        Unique examples; totals are accumulated in deduplicator.stats
+    """
+    deduplicator = deduplicator or MinHashDeduplicator()
+    count_tokens = count_tokens or (lambda text: len(text.split()))
+    deduplicator.stats.setdefault('tokens_kept', 0)
+    deduplicator.stats.setdefault('tokens_removed', 0)
+
+    for example in examples:
+        text = example_text(example)
+        tokens = count_tokens(text)
+        if deduplicator.is_duplicate(text):
+            deduplicator.stats['tokens_removed'] += tokens
+        else:
+            deduplicator.stats['tokens_kept'] += tokens
+            yield example
@@ -0,0 +1,150 @@
+"""
+On-disk cache of OpenDota game constants (heroes and items)
+Files are reused until they go stale or a newer patch shows up in match data,
+then revalidated with ETag conditional requests
+"""
+
+import json
+import os
+import tempfile
+import time
+from pathlib import Path
+try:
+    from .match_table import build_name_lookup
+except ImportError:
+    from src.match_table import build_name_lookup
+
+CONSTANTS_ENDPOINTS = {
+    'heroes': '/heroes',
+    'items': '/constants/items',
+}
+
+def write_json_atomic(path, data, **dump_kwargs):
+    """
+    Replace a JSON file in one step
+
+    The temporary file gets a unique name in the same directory, so several
+    worker processes refreshing the same constants never write into each
+    other's temporary file.
+    """
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with tempfile.NamedTemporaryFile('w', encoding='utf-8', dir=path.parent, prefix=path.name + '.',
+                                     suffix='.tmp', delete=False) as f:
+        json.dump(data, f, **dump_kwargs)
+    try:
+        os.replace(f.name, path)
+    except OSError:
+        os.unlink(f.name)
+        raise
+
+class GameConstantsCache:
+    def __init__(self, collector, heroes_path, items_path, max_age_days=7):
+        """
+        Initialize the constants cache
+
+        Args:
+            collector: OpenDotaCollector used when a refresh is needed
+            heroes_path: JSON file holding the /heroes response
+            items_path: JSON file holding the /constants/items response
+            max_age_days: Revalidate cached files older than this
+        """
+        self.collector = collector
+        self.paths = {'heroes': Path(heroes_path), 'items': Path(items_path)}
+        self.meta_path = self.paths['heroes'].with_name('constants_meta.json')
+        self.max_age = max_age_days * 24 * 3600
+        self.meta = self._load_meta()
+
+        self.heroes = {}
+        self.items = {}
+        self.item_ids_by_key = {}
+        self.hero_names = None
+        self.item_names = None
+
+    def _load_meta(self):
+        if self.meta_path.exists():
+            with open(self.meta_path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        return {'patch': None, 'endpoints': {}}
+
+    def _save_meta(self):
+        write_json_atomic(self.meta_path, self.meta, indent=2)
+
+    def _load_endpoint(self, name, force_revalidate=False):
+        """Return the constants for one endpoint, touching the network only when needed"""
+        path = self.paths[name]
+        info = self.meta['endpoints'].get(name, {})
+        cached = None
+        if path.exists():
+            with open(path, 'r', encoding='utf-8') as f:
+                cached = json.load(f)
+
+        is_fresh = time.time() - info.get('fetched_at', 0) < self.max_age
+        if cached is not None and is_fresh and not force_revalidate:
+            return cached
+
+        if self.collector is None:
+            return cached
+
+        data, etag, not_modified = self.collector.make_conditional_request(
+            CONSTANTS_ENDPOINTS[name], etag=info.get('etag') if cached is not None else None
+        )
+        if not_modified:
+            print(f"{name.capitalize()} constants unchanged (ETag match)")
+            data = cached
+        elif data is None:
+            if cached is not None:
+                print(f"Could not refresh {name} constants, using cached copy")
+            return cached
+        else:
+            write_json_atomic(path, data)
+            print(f"Downloaded {name} constants")
+
+        self.meta['endpoints'][name] = {'etag': etag, 'fetched_at': time.time()}
+        self._save_meta()
+        return data
+
+    def load(self, force_revalidate=False):
+        """Load heroes and items and build the ID -> name lookup arrays"""
+        heroes_data = self._load_endpoint('heroes', force_revalidate)
+        items_data = self._load_endpoint('items', force_revalidate)
+
+        if heroes_data:
+            self.heroes = {hero['id']: hero for hero in heroes_data}
+
+        if items_data:
+            # Convert from name-based dict to ID-based dict
+            self.items = {}
+            self.item_ids_by_key = {}
+            for item_name, item_data in items_data.items():
+                if 'id' in item_data:
+                    self.items[item_data['id']] = item_data
+                    # purchase_log entries name items by this internal key
+                    self.item_ids_by_key[item_name] = item_data['id']
+
+        self.hero_names = build_name_lookup(self.heroes, 'localized_name', 'Hero')
+        self.item_names = build_name_lookup(self.items, 'dname', 'Item')
+        return self
+
+    def note_patch(self, patch):
+        """
+        Record the patch seen in match data, revalidating the constants when it is newer
+
+        Returns:
+            True if the constants were reloaded
+        """
+        if patch is None:
+            return False
+
+        known_patch = self.meta.get('patch')
+        if known_patch is not None and patch <= known_patch:
+            return False
+
+        self.meta['patch'] = patch
+        self._save_meta()
+        if known_patch is None:
+            return False
+
+        print(f"New patch {patch} detected (was {known_patch}), revalidating game constants...")
+        self.load(force_revalidate=True)
+        return True
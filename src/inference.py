@@ -0,0 +1,281 @@
+"""
+Inference with the fine-tuned Dota 2 model
+Loads the base model with the trained LoRA adapter, formats questions with
+the prompt scaffold used at inference time, and generates answers, either all
+at once or streamed as the tokens are produced.
+"""
+
+import queue
+import threading
+import torch
+from transformers import AutoTokenizer, AutoModelForCausalLM, BitsAndBytesConfig, StoppingCriteria, StoppingCriteriaList
+from transformers.generation.streamers import BaseStreamer
+from peft import PeftModel
+import config
+
+# Sampling settings used by ask_question and the inference server
+DEFAULT_GENERATION = {
+    'max_new_tokens': 256,
+    'temperature': 0.7,
+    'top_p': 0.9,
+    'repetition_penalty': 1.1,
+    'do_sample': True,
+}
+MAX_PROMPT_LENGTH = 1024
+
+def load_trained_model(model_path):
+    """Load the fine-tuned model"""
+    print(f"Loading base model: {config.MODEL_NAME}")
+
+    # Load base model and tokenizer
+    tokenizer = AutoTokenizer.from_pretrained(config.MODEL_NAME)
+    tokenizer.pad_token = tokenizer.eos_token
+
+    # Setup quantization for faster inference
+    bnb_config = BitsAndBytesConfig(
+        load_in_4bit=True,
+        bnb_4bit_quant_type="nf4",
+        bnb_4bit_compute_dtype=torch.float16,
+        bnb_4bit_use_double_quant=True,
+    )
+
+    base_model = AutoModelForCausalLM.from_pretrained(
+        config.MODEL_NAME,
+        quantization_config=bnb_config,
+        torch_dtype=torch.float16,
+        device_map="auto"
+    )
+
+    print(f"Loading LoRA adapters from: {model_path}")
+    # Load LoRA adapters
+    model = PeftModel.from_pretrained(base_model, model_path)
+
+    return model, tokenizer
+
+def rewrite_lane_terms(question):
+    """Map League-style lane names to Dota 2 positions"""
+    if "bot lane" in question.lower():
+        question = question.replace("bot lane", "safe lane carry position")
+    elif "top lane" in question.lower():
+        question = question.replace("top lane", "offlane position")
+    elif "mid lane" in question.lower():
+        question = question.replace("mid lane", "mid position")
+    return question
+
+def prompt_prefix():
+    """Start shared by every formatted prompt: [INST] and the optional SYSTEM_PROMPT"""
+    # Mistral's chat template puts the system prompt in front of the user message, separated by a blank line
+    return f"[INST] {config.SYSTEM_PROMPT}\n\n" if config.SYSTEM_PROMPT else "[INST] "
+
+def format_prompt(question):
+    """Format a question using Mistral's instruction format with implicit Dota 2 context"""
+    return f"{prompt_prefix()}{rewrite_lane_terms(question)} (This is about Dota 2) [/INST]"
+
+def encode_prompt(tokenizer, question):
+    """Token IDs of the formatted prompt for a question"""
+    return tokenizer(format_prompt(question), truncation=True, max_length=MAX_PROMPT_LENGTH)["input_ids"]
+
+def ask_question(model, tokenizer, question, prefix_cache=None):
+    """
+    Ask the model a Dota 2 question
+
+    Args:
+        model: Model from load_trained_model
+        tokenizer: Matching tokenizer
+        question: Question to ask
+        prefix_cache: Optional PromptPrefixCache; its tokens are not prefilled again
+    """
+    prompt = format_prompt(question)
+
+    # Tokenize
+    inputs = tokenizer(
+        prompt,
+        return_tensors="pt",
+        truncation=True,
+        max_length=MAX_PROMPT_LENGTH
+    ).to(model.device)
+
+    # Generate response
+    with torch.no_grad():
+        outputs = model.generate(
+            **inputs,
+            **DEFAULT_GENERATION,
+            **(prefix_cache.generate_kwargs(inputs["input_ids"]) if prefix_cache is not None else {}),
+            pad_token_id=tokenizer.eos_token_id,
+        )
+
+    # Decode just the model's response; [INST] markers are special tokens that
+    # skip_special_tokens removes, so splitting the full text on [/INST] would
+    # leave the question in front of the answer
+    response = tokenizer.decode(outputs[0, inputs["input_ids"].shape[1]:], skip_special_tokens=True)
+
+    return response.strip()
+
+class IncrementalDecoder:
+    def __init__(self, tokenizer):
+        """
+        Turn generated token IDs into text one token at a time
+
+        Decoding each token on its own drops SentencePiece word-boundary spaces
+        and splits multi-byte characters (byte-fallback pieces such as <0xE2>)
+        into replacement characters. Instead, the new tokens are decoded together
+        with the previous ones and only the added text is returned, held back
+        while it still ends in an incomplete character.
+
+        Args:
+            tokenizer: Tokenizer the IDs came from
+        """
+        self.tokenizer = tokenizer
+        self.token_ids = []
+        self.prefix_offset = 0
+        self.read_offset = 0
+
+    def _decode(self, token_ids):
+        return self.tokenizer.decode(token_ids, skip_special_tokens=True)
+
+    def push(self, token_id):
+        """Add a token and return the text it completes (possibly empty)"""
+        self.token_ids.append(token_id)
+        prefix = self._decode(self.token_ids[self.prefix_offset:self.read_offset])
+        text = self._decode(self.token_ids[self.prefix_offset:])
+        if len(text) > len(prefix) and not text.endswith('\ufffd'):
+            self.prefix_offset, self.read_offset = self.read_offset, len(self.token_ids)
+            return text[len(prefix):]
+        return ""
+
+    def flush(self):
+        """Text still held back at the end of generation"""
+        prefix = self._decode(self.token_ids[self.prefix_offset:self.read_offset])
+        text = self._decode(self.token_ids[self.prefix_offset:])
+        self.prefix_offset = self.read_offset = len(self.token_ids)
+        return text[len(prefix):]
+
+def iter_text(token_ids, tokenizer):
+    """
+    Decode a stream of token IDs into text chunks
+
+    Args:
+        token_ids: Iterable of generated token IDs
+        tokenizer: Tokenizer the IDs came from
+
+    Yields:
+        Text chunks; leading whitespace of the answer is dropped as in ask_question
+    """
+    decoder = IncrementalDecoder(tokenizer)
+    started = False
+    for token_id in token_ids:
+        text = decoder.push(token_id)
+        if not started:
+            text = text.lstrip()
+            started = bool(text)
+        if text:
+            yield text
+    text = decoder.flush()
+    if text and not started:
+        text = text.lstrip()
+    if text:
+        yield text
+
+class TokenQueueStreamer(BaseStreamer):
+    """generate() streamer that hands new token IDs to another thread (the prompt is skipped)"""
+
+    def __init__(self):
+        self.tokens = queue.Queue()
+        self.prompt_seen = False
+        self.thread = None
+        self.outputs = None
+        self.error = None
+        self.stop = threading.Event()
+
+    def cancel(self):
+        """Stop generate() after its current step (the consumer went away)"""
+        self.stop.set()
+
+    def put(self, value):
+        if not self.prompt_seen:
+            self.prompt_seen = True
+            return
+        for token_id in value.reshape(-1).tolist():
+            self.tokens.put(token_id)
+
+    def end(self):
+        self.tokens.put(None)
+
+    def __iter__(self):
+        while (token_id := self.tokens.get()) is not None:
+            yield token_id
+        # generate() has finished once its thread exits; outputs is set from then on
+        self.thread.join()
+        if self.error is not None:
+            raise self.error
+
+class StopOnEvent(StoppingCriteria):
+    """Stopping criterion that ends every row once an event is set"""
+
+    def __init__(self, event):
+        self.event = event
+
+    def __call__(self, input_ids, scores, **kwargs):
+        return torch.full((input_ids.shape[0],), self.event.is_set(), dtype=torch.bool, device=input_ids.device)
+
+def start_generation(model, inputs, **generate_kwargs):
+    """
+    Run model.generate in a background thread
+
+    Args:
+        model: Causal LM
+        inputs: Tokenized prompt (input_ids, attention_mask)
+        **generate_kwargs: Passed on to model.generate
+
+    Returns:
+        TokenQueueStreamer; iterate it for the new token IDs, after which
+        .outputs holds what generate() returned. Call its cancel() when the
+        tokens are no longer wanted.
+    """
+    streamer = TokenQueueStreamer()
+    stopping_criteria = StoppingCriteriaList([StopOnEvent(streamer.stop)])
+
+    def generate():
+        try:
+            with torch.no_grad():
+                streamer.outputs = model.generate(**inputs, **generate_kwargs, streamer=streamer,
+                                                  stopping_criteria=stopping_criteria)
+        except Exception as e:
+            streamer.error = e
+            streamer.end()
+
+    streamer.thread = threading.Thread(target=generate, daemon=True)
+    streamer.thread.start()
+    return streamer
+
+def stream_question(model, tokenizer, question, prefix_cache=None):
+    """
+    Ask the model a Dota 2 question and yield the answer as it is generated
+
+    The first chunk arrives after the prompt's forward pass instead of after
+    all max_new_tokens decode steps.
+
+    Args:
+        model: Model from load_trained_model
+        tokenizer: Matching tokenizer
+        question: Question to ask
+        prefix_cache: Optional PromptPrefixCache; its tokens are not prefilled again
+
+    Yields:
+        Text chunks that join to the answer
+    """
+    inputs = tokenizer(
+        format_prompt(question),
+        return_tensors="pt",
+        truncation=True,
+        max_length=MAX_PROMPT_LENGTH
+    ).to(model.device)
+
+    cached_prefix = prefix_cache.generate_kwargs(inputs["input_ids"]) if prefix_cache is not None else {}
+    streamer = start_generation(model, inputs, **DEFAULT_GENERATION, **cached_prefix,
+                                pad_token_id=tokenizer.eos_token_id)
+    try:
+        yield from iter_text(streamer, tokenizer)
+    finally:
+        # Closing the generator early (e.g. Ctrl+C) stops generate() as well
+        streamer.cancel()
@@ -0,0 +1,232 @@
+"""
+HTTP service for the fine-tuned Dota 2 model
+A long-lived ThreadingHTTPServer in front of a ContinuousBatcher: every
+connection is handled on its own thread and waits on its request while the
+batcher decodes all in-flight questions together.
+
+Endpoints:
+    POST /generate  {"question": ..., optional "max_new_tokens", "temperature",
+                     "top_p", "repetition_penalty", "do_sample"} -> {"answer": ..., "latency": {...}}
+                    with "stream": true the answer is sent as server-sent events instead:
+                    data: {"text": ...} per chunk, then data: {"done": true, "latency": {...}}
+                    answers served from the response cache have "cached": true
+    GET  /stats     queue depth, batch occupancy, throughput and latency percentiles
+    GET  /health    {"status": "ok"}
+"""
+
+import json
+import math
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import numpy as np
+try:
+    from .continuous_batching import ContinuousBatcher
+    from .inference import encode_prompt, iter_text
+except ImportError:
+    from src.continuous_batching import ContinuousBatcher
+    from src.inference import encode_prompt, iter_text
+
+SAMPLING_FIELDS = ('max_new_tokens', 'temperature', 'top_p', 'repetition_penalty', 'do_sample')
+REQUEST_TIMEOUT = 600
+
+def _is_number(value):
+    return isinstance(value, (int, float)) and not isinstance(value, bool) and math.isfinite(value)
+
+def parse_settings(payload, max_new_tokens_limit):
+    """
+    Validated sampling settings from a /generate body
+
+    Bad values are rejected here because the batcher samples every request in
+    one step; a single malformed request would otherwise fail the whole batch.
+
+    Raises:
+        ValueError naming the offending field
+    """
+    settings = {field: payload[field] for field in SAMPLING_FIELDS if field in payload}
+    checks = {
+        'max_new_tokens': (lambda v: isinstance(v, int) and not isinstance(v, bool) and 1 <= v <= max_new_tokens_limit,
+                           f"an integer from 1 to {max_new_tokens_limit}"),
+        'temperature': (lambda v: _is_number(v) and v >= 0, "a number >= 0"),
+        'top_p': (lambda v: _is_number(v) and 0 < v <= 1, "a number in (0, 1]"),
+        'repetition_penalty': (lambda v: _is_number(v) and v > 0, "a number > 0"),
+        'do_sample': (lambda v: isinstance(v, bool), "true or false"),
+    }
+    for field, value in settings.items():
+        valid, expected = checks[field]
+        if not valid(value):
+            raise ValueError(f"'{field}' must be {expected}")
+    return settings
+
+class InferenceRequestHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def _send_json(self, status, payload):
+        body = json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path == '/stats':
+            stats = self.server.batcher.stats()
+            if self.server.cache is not None:
+                stats['cache'] = self.server.cache.stats()
+            self._send_json(200, stats)
+        elif self.path == '/health':
+            self._send_json(200, {'status': 'ok'})
+        else:
+            self._send_json(404, {'error': f"Unknown path {self.path}"})
+
+    def do_POST(self):
+        started = time.perf_counter()
+        if self.path != '/generate':
+            self._send_json(404, {'error': f"Unknown path {self.path}"})
+            return
+        try:
+            length = int(self.headers.get('Content-Length', 0))
+            payload = json.loads(self.rfile.read(length) or b'{}')
+            question = payload['question']
+        except (ValueError, KeyError, TypeError):
+            self._send_json(400, {'error': "Expected a JSON body with a 'question' field"})
+            return
+        if not isinstance(question, str) or not question.strip():
+            self._send_json(400, {'error': "'question' must be a non-empty string"})
+            return
+        try:
+            settings = parse_settings(payload, self.server.max_new_tokens_limit)
+        except ValueError as e:
+            self._send_json(400, {'error': str(e)})
+            return
+        stream = payload.get('stream', False) is True
+        cache = self.server.cache
+        cached = cache.get(question, settings) if cache is not None else None
+        if cached is not None:
+            elapsed = time.perf_counter() - started
+            latency = {'queue_wait': 0.0, 'time_to_first_token': elapsed, 'total': elapsed, 'new_tokens': 0,
+                       'tokens_per_sec': 0.0}
+            if stream:
+                self._start_events()
+                self._send_event({'text': cached})
+                self._send_event({'done': True, 'cached': True, 'latency': latency})
+            else:
+                self._send_json(200, {'answer': cached, 'cached': True, 'latency': latency})
+            return
+
+        request = self.server.batcher.submit(encode_prompt(self.server.tokenizer, question), stream=stream,
+                                             **settings)
+        if stream:
+            self._stream_events(request)
+        else:
+            try:
+                answer = request.wait(REQUEST_TIMEOUT)
+            except (RuntimeError, TimeoutError) as e:
+                request.cancel()
+                self._send_json(500, {'error': str(e)})
+                return
+            self._send_json(200, {'answer': answer, 'latency': request.latency()})
+        if cache is not None and request.done.is_set() and request.error is None and not request.cancelled:
+            cache.put(question, request.text, settings)
+
+    def _send_event(self, payload):
+        self.wfile.write(f"data: {json.dumps(payload)}\n\n".encode('utf-8'))
+        self.wfile.flush()
+
+    def _start_events(self):
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        # No Content-Length for a stream, so the end of the response is the end of the connection
+        self.send_header("Connection", "close")
+        self.end_headers()
+        self.close_connection = True
+
+    def _stream_events(self, request):
+        """Send the answer as server-sent events while the batcher generates it"""
+        self._start_events()
+        try:
+            for text in iter_text(request.stream_tokens(REQUEST_TIMEOUT), self.server.tokenizer):
+                self._send_event({'text': text})
+        except (RuntimeError, TimeoutError) as e:
+            request.cancel()
+            self._send_event({'error': str(e)})
+            return
+        except (BrokenPipeError, ConnectionResetError):
+            # Client went away; free its row in the batch
+            request.cancel()
+            return
+        self._send_event({'done': True, 'latency': request.latency()})
+
+    def log_message(self, format, *args):
+        # Per-request latency is in /stats; keep the console quiet under load
+        pass
+
+def create_server(model, tokenizer, host="127.0.0.1", port=8000, max_batch_size=16, cache=None,
+                  prefix_cache=None, max_new_tokens_limit=1024):
+    """
+    Create the HTTP server and start its batcher (call serve_forever() to handle requests)
+
+    Args:
+        model: Causal LM (e.g. from load_trained_model)
+        tokenizer: Matching tokenizer
+        host, port: Address to listen on
+        max_batch_size: Requests decoded together at most
+        cache: Optional ResponseCache checked before generating
+        prefix_cache: Optional PromptPrefixCache shared by every prompt's prefill
+        max_new_tokens_limit: Largest max_new_tokens a request may ask for
+    """
+    server = ThreadingHTTPServer((host, port), InferenceRequestHandler)
+    server.daemon_threads = True
+    server.tokenizer = tokenizer
+    server.cache = cache
+    server.max_new_tokens_limit = max_new_tokens_limit
+    server.batcher = ContinuousBatcher(model, tokenizer, max_batch_size=max_batch_size,
+                                       prefix_cache=prefix_cache).start()
+    return server
+
+def run_load_test(url, questions, concurrency=32, num_requests=None, **settings):
+    """
+    Send questions to a running server from concurrent simulated users
+
+    Args:
+        url: Server base URL (e.g. http://127.0.0.1:8000)
+        questions: Questions cycled through by the users
+        concurrency: Simultaneous users
+        num_requests: Total requests (default: one per user)
+        **settings: Sampling settings sent with every request
+
+    Returns:
+        Dict with requests/sec, generated tokens/sec and latency percentiles
+    """
+    num_requests = num_requests or concurrency
+
+    def send(index):
+        body = json.dumps({'question': questions[index % len(questions)], **settings}).encode('utf-8')
+        request = urllib.request.Request(f"{url}/generate", data=body, headers={"Content-Type": "application/json"})
+        with urllib.request.urlopen(request, timeout=REQUEST_TIMEOUT) as response:
+            return json.loads(response.read())['latency']
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        latencies = list(executor.map(send, range(num_requests)))
+    elapsed = time.perf_counter() - start
+
+    totals = np.array([latency['total'] for latency in latencies])
+    return {
+        'concurrency': concurrency,
+        'requests': num_requests,
+        'seconds': elapsed,
+        'requests_per_sec': num_requests / elapsed,
+        'tokens_per_sec': sum(latency['new_tokens'] for latency in latencies) / elapsed,
+        'latency_p50': float(np.percentile(totals, 50)),
+        'latency_p95': float(np.percentile(totals, 95)),
+    }
+
+def print_load_test(report):
+    """Print a report from run_load_test"""
+    print(f"{report['concurrency']} users, {report['requests']} requests in {report['seconds']:.1f}s: "
+          f"{report['requests_per_sec']:.2f} requests/sec, {report['tokens_per_sec']:.0f} tokens/sec, "
+          f"latency p50 {report['latency_p50']:.2f}s / p95 {report['latency_p95']:.2f}s")
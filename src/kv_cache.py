@@ -0,0 +1,66 @@
+"""
+Key/value cache manipulation for batched and incremental decoding
+Caches are handled as lists of per-layer (keys, values) tensors shaped
+[batch, heads, positions, head_dim] and wrapped in a DynamicCache only for the
+forward pass. Rows of different lengths are aligned by left padding, and the
+padded positions are masked out with the attention mask.
+"""
+
+import torch
+import torch.nn.functional as F
+from transformers import DynamicCache
+
+def cache_tensors(cache):
+    """Per-layer (keys, values) tensors of a DynamicCache returned by a forward pass"""
+    return [(layer.keys, layer.values) for layer in cache.layers]
+
+def to_dynamic_cache(tensors):
+    """Wrap per-layer tensors in a DynamicCache the model can extend in place"""
+    return DynamicCache(ddp_cache_data=tensors)
+
+def cache_length(tensors):
+    """Positions held by a cache (including left padding)"""
+    return tensors[0][0].shape[-2] if tensors else 0
+
+def pad_left(tensors, positions):
+    """Prepend empty positions to every row of a cache"""
+    if positions <= 0:
+        return tensors
+    return [(F.pad(keys, (0, 0, positions, 0)), F.pad(values, (0, 0, positions, 0))) for keys, values in tensors]
+
+def trim_left(tensors, positions):
+    """Drop the first positions of every row (padding no row needs any more)"""
+    if positions <= 0:
+        return tensors
+    return [(keys[:, :, positions:], values[:, :, positions:]) for keys, values in tensors]
+
+def keep_first(tensors, positions):
+    """Keep only the first positions of every row (e.g. the part of a prefix a prompt shares)"""
+    return [(keys[:, :, :positions], values[:, :, :positions]) for keys, values in tensors]
+
+def select_rows(tensors, indices):
+    """Keep only the given batch rows"""
+    index = torch.as_tensor(indices, dtype=torch.long, device=tensors[0][0].device)
+    return [(keys.index_select(0, index), values.index_select(0, index)) for keys, values in tensors]
+
+def repeat_rows(tensors, count):
+    """Copy a single-row cache into count rows (e.g. a shared prompt prefix)"""
+    return [(keys.expand(count, -1, -1, -1).contiguous(), values.expand(count, -1, -1, -1).contiguous())
+            for keys, values in tensors]
+
+def concat_rows(first, second):
+    """
+    Stack two caches along the batch, left padding the shorter one
+
+    Returns:
+        (tensors, first_padding, second_padding) with the positions added in front of each
+    """
+    if not first:
+        return second, 0, 0
+    if not second:
+        return first, 0, 0
+    length = max(cache_length(first), cache_length(second))
+    first_padding, second_padding = length - cache_length(first), length - cache_length(second)
+    first, second = pad_left(first, first_padding), pad_left(second, second_padding)
+    return ([(torch.cat([k1, k2]), torch.cat([v1, v2])) for (k1, v1), (k2, v2) in zip(first, second)],
+            first_padding, second_padding)
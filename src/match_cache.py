@@ -0,0 +1,132 @@
+"""
+Persistent on-disk cache of OpenDota match payloads
+Stores zlib-compressed JSON in SQLite, content-addressed by SHA-256 and indexed by match_id, patch and start_time
+"""
+
+import hashlib
+import json
+import sqlite3
+import threading
+import zlib
+from pathlib import Path
+
+class MatchCache:
+    def __init__(self, db_path):
+        """
+        Open (or create) a match cache
+
+        Args:
+            db_path: Path to the SQLite database file
+        """
+        self.db_path = Path(db_path)
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+
+        # Collector threads share one connection, serialized by a lock; worker
+        # processes each open their own and wait on SQLite's busy timeout
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(str(self.db_path), check_same_thread=False, timeout=60)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.executescript("""
+            CREATE TABLE IF NOT EXISTS blobs (
+                content_hash TEXT PRIMARY KEY,
+                payload BLOB NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS matches (
+                match_id INTEGER PRIMARY KEY,
+                patch INTEGER,
+                start_time INTEGER,
+                content_hash TEXT NOT NULL REFERENCES blobs(content_hash)
+            );
+            CREATE INDEX IF NOT EXISTS idx_matches_patch ON matches(patch);
+            CREATE INDEX IF NOT EXISTS idx_matches_start_time ON matches(start_time);
+        """)
+        self.conn.commit()
+
+    def __contains__(self, match_id):
+        with self.lock:
+            row = self.conn.execute("SELECT 1 FROM matches WHERE match_id = ?", (match_id,)).fetchone()
+        return row is not None
+
+    def __len__(self):
+        with self.lock:
+            return self.conn.execute("SELECT COUNT(*) FROM matches").fetchone()[0]
+
+    def get(self, match_id):
+        """Return the cached match payload, or None if not cached"""
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT b.payload FROM matches m JOIN blobs b ON b.content_hash = m.content_hash "
+                "WHERE m.match_id = ?", (match_id,)
+            ).fetchone()
+        if row is None:
+            return None
+        return json.loads(zlib.decompress(row[0]))
+
+    def put(self, match_data):
+        """Store a match payload (keyed by its match_id)"""
+        match_id = match_data.get('match_id')
+        if match_id is None:
+            return
+
+        raw = json.dumps(match_data, sort_keys=True, separators=(',', ':')).encode('utf-8')
+        content_hash = hashlib.sha256(raw).hexdigest()
+
+        with self.lock:
+            self.conn.execute(
+                "INSERT OR IGNORE INTO blobs (content_hash, payload) VALUES (?, ?)",
+                (content_hash, zlib.compress(raw, 6))
+            )
+            self.conn.execute(
+                "INSERT OR REPLACE INTO matches (match_id, patch, start_time, content_hash) VALUES (?, ?, ?, ?)",
+                (match_id, match_data.get('patch'), match_data.get('start_time'), content_hash)
+            )
+            self.conn.commit()
+
+    def match_ids(self, patch=None, since=None):
+        """
+        List cached match IDs, optionally filtered
+
+        Args:
+            patch: Only matches from this OpenDota patch ID
+            since: Only matches starting at or after this unix timestamp
+        """
+        query = "SELECT match_id FROM matches WHERE 1=1"
+        params = []
+        if patch is not None:
+            query += " AND patch = ?"
+            params.append(patch)
+        if since is not None:
+            query += " AND start_time >= ?"
+            params.append(since)
+        query += " ORDER BY match_id"
+
+        with self.lock:
+            return [row[0] for row in self.conn.execute(query, params)]
+
+    def iter_matches(self, patch=None, since=None, chunk_size=500):
+        """Yield cached match payloads in match_id order, optionally filtered by patch and start time"""
+        query = ("SELECT m.match_id, b.payload FROM matches m JOIN blobs b ON b.content_hash = m.content_hash "
+                 "WHERE m.match_id > ?")
+        params = []
+        if patch is not None:
+            query += " AND m.patch = ?"
+            params.append(patch)
+        if since is not None:
+            query += " AND m.start_time >= ?"
+            params.append(since)
+        query += " ORDER BY m.match_id LIMIT ?"
+
+        # Keyset pagination keeps the lock short while other threads use the cache
+        last_match_id = -1
+        while True:
+            with self.lock:
+                rows = self.conn.execute(query, [last_match_id] + params + [chunk_size]).fetchall()
+            if not rows:
+                break
+            for match_id, payload in rows:
+                yield json.loads(zlib.decompress(payload))
+            last_match_id = rows[-1][0]
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
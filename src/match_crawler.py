@@ -0,0 +1,170 @@
+"""
+Paginated publicMatches crawler for OpenDota
+Pages backwards with less_than_match_id, skips matches it has already seen,
+and keeps a resume cursor on disk so interrupted crawls pick up where they stopped.
+The cursor file stays small; seen match IDs go to an append-only int64 log
+next to it (<cursor>.seen), so each page writes only its new IDs.
+
+A match only counts as seen once the caller commits it (its examples are
+durable on disk). Until then the saved cursor stays at or above the page it
+came from, so matches lost in a crash, and failed fetches, are crawled again.
+"""
+
+import json
+import os
+from pathlib import Path
+import numpy as np
+
+class MatchCrawler:
+    def __init__(self, collector, cursor_path=None, min_rank=5, upper_match_id=None, lower_match_id=None):
+        """
+        Initialize the crawler
+
+        Args:
+            collector: OpenDotaCollector used to fetch publicMatches pages
+            cursor_path: JSON file holding the resume cursor; seen match IDs are logged to
+                <cursor_path>.seen (None keeps state in memory)
+            min_rank: Minimum skill level (5 = Ancient, 6 = Divine, 7 = Immortal)
+            upper_match_id: Only crawl matches below this ID (None starts from the newest)
+            lower_match_id: Stop once the crawl passes below this ID (None crawls to the end)
+        """
+        self.collector = collector
+        self.cursor_path = Path(cursor_path) if cursor_path else None
+        self.seen_path = self.cursor_path.with_name(self.cursor_path.name + '.seen') if cursor_path else None
+        self.min_rank = min_rank
+        self.upper_match_id = upper_match_id
+        self.lower_match_id = lower_match_id
+        self.less_than_match_id = upper_match_id
+        self.seen = set()
+        self.outstanding = {}  # Handed out but not yet committed: match ID -> cursor of its page
+        self.load_cursor()
+
+    def load_cursor(self):
+        """Restore the cursor and seen set from disk"""
+        if not self.cursor_path or not self.cursor_path.exists():
+            return
+
+        with open(self.cursor_path, 'r', encoding='utf-8') as f:
+            state = json.load(f)
+
+        if state.get('min_rank') == self.min_rank and state.get('less_than_match_id'):
+            self.less_than_match_id = state['less_than_match_id']
+
+        if self.seen_path.exists():
+            # A crash can leave a torn last record; drop it
+            ids = np.fromfile(self.seen_path, dtype=np.int64)
+            with open(self.seen_path, 'r+b') as f:
+                f.truncate(ids.size * ids.itemsize)
+            self.seen = set(ids.tolist())
+        if state.get('seen'):
+            # Older cursors kept the whole seen list in the JSON file; move it to the log
+            new_ids = [match_id for match_id in state['seen'] if match_id not in self.seen]
+            self.seen.update(new_ids)
+            self._append_seen(new_ids)
+            self.save_cursor()
+        print(f"Resuming crawl below match {self.less_than_match_id} ({len(self.seen)} matches already seen)")
+
+    def _append_seen(self, match_ids):
+        """Append newly seen match IDs to the on-disk log"""
+        if not self.seen_path or not match_ids:
+            return
+        self.seen_path.parent.mkdir(parents=True, exist_ok=True)
+        with open(self.seen_path, 'ab') as f:
+            np.asarray(match_ids, dtype=np.int64).tofile(f)
+            f.flush()
+            os.fsync(f.fileno())
+
+    def commit(self, match_ids):
+        """Mark handed-out matches as seen once their training examples are durable"""
+        match_ids = [match_id for match_id in match_ids if match_id is not None and match_id not in self.seen]
+        for match_id in match_ids:
+            self.outstanding.pop(match_id, None)
+        self.seen.update(match_ids)
+        self._append_seen(match_ids)
+
+    def release(self, match_id):
+        """Forget a handed-out match without marking it seen (e.g. its detail fetch failed)"""
+        self.outstanding.pop(match_id, None)
+
+    def resume_cursor(self):
+        """Cursor a restarted crawl may safely begin from: no uncommitted match lies above it"""
+        if not self.outstanding:
+            return self.less_than_match_id
+        page_cursors = list(self.outstanding.values())
+        # None means the page was fetched from the newest match (or the upper bound)
+        return None if None in page_cursors else max(page_cursors)
+
+    def save_cursor(self):
+        """Atomically write the cursor position to disk (the seen set is logged separately)"""
+        if not self.cursor_path:
+            return
+
+        self.cursor_path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.cursor_path.with_suffix(self.cursor_path.suffix + '.tmp')
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({
+                'min_rank': self.min_rank,
+                'less_than_match_id': self.resume_cursor(),
+            }, f)
+        os.replace(tmp_path, self.cursor_path)
+
+    def reset(self):
+        """Start again from the newest matches (or the upper bound), keeping the seen set"""
+        self.less_than_match_id = self.upper_match_id
+        self.save_cursor()
+
+    def crawl(self, num_matches, max_empty_pages=3):
+        """
+        Yield up to num_matches unseen match summaries, newest first
+
+        Args:
+            num_matches: Number of new matches to yield
+            max_empty_pages: Stop after this many consecutive pages without new matches
+        """
+        yielded = 0
+        empty_pages = 0
+        lower = self.lower_match_id or 0
+
+        while yielded < num_matches:
+            if self.less_than_match_id is not None and self.less_than_match_id <= lower:
+                print(f"Reached the end of match range [{lower}, {self.upper_match_id})")
+                break
+
+            page = self.collector.get_recent_matches(
+                min_rank=self.min_rank,
+                less_than_match_id=self.less_than_match_id
+            )
+            if not page:
+                print(f"No more public matches below {self.less_than_match_id}")
+                break
+
+            page_ids = [m['match_id'] for m in page if m.get('match_id')]
+            if not page_ids:
+                break
+
+            new_matches = [m for m in page if m.get('match_id') and m['match_id'] not in self.seen
+                           and m['match_id'] not in self.outstanding and m['match_id'] >= lower]
+            empty_pages = 0 if new_matches else empty_pages + 1
+
+            taken = new_matches[:num_matches - yielded]
+            untaken = new_matches[len(taken):]
+
+            # Advance the cursor before handing matches out; a partially consumed page
+            # keeps its remaining matches reachable for the next crawl. The saved cursor
+            # stays at this page until its matches are committed.
+            page_cursor = self.less_than_match_id
+            if untaken:
+                self.less_than_match_id = max(m['match_id'] for m in untaken) + 1
+            else:
+                self.less_than_match_id = max(min(page_ids), lower)
+            for match_info in taken:
+                self.outstanding[match_info['match_id']] = page_cursor
+            self.save_cursor()
+
+            for match_info in taken:
+                yielded += 1
+                yield match_info
+
+            if empty_pages >= max_empty_pages:
+                print(f"No new matches in {empty_pages} consecutive pages, stopping crawl")
+                break
@@ -0,0 +1,89 @@
+"""
+Columnar player tables for batch processing of match payloads
+Flattens a batch of matches into one row per player so filtering and
+ID -> name mapping can run as vectorized array operations
+"""
+
+import numpy as np
+import pandas as pd
+
+ITEM_COLUMNS = [f'item_{i}' for i in range(6)] + [f'backpack_{i}' for i in range(3)]
+STAT_COLUMNS = ['kills', 'deaths', 'assists', 'gold_per_min', 'xp_per_min']
+PLAYER_COLUMNS = ['hero_id'] + ITEM_COLUMNS + STAT_COLUMNS
+
+def build_player_table(matches):
+    """
+    Flatten match payloads into a columnar player table
+
+    Args:
+        matches: List of match payloads (matches without players are skipped)
+
+    Returns:
+        DataFrame with one row per player: match_index, slot, hero_id, item_0..5,
+        backpack_0..2, kills, deaths, assists, gold_per_min, xp_per_min,
+        duration_minutes, team (0 = Radiant, 1 = Dire) and win.
+        Missing hero IDs are -1, missing items and stats are 0.
+    """
+    players = []
+    match_indices = []
+    slots = []
+    for match_index, match_data in enumerate(matches):
+        if not match_data or 'players' not in match_data:
+            continue
+        match_players = match_data['players']
+        players.extend(match_players)
+        match_indices.extend([match_index] * len(match_players))
+        slots.extend(range(len(match_players)))
+
+    # from_records pulls the columns out of the player dicts in C
+    table = pd.DataFrame.from_records(players, columns=PLAYER_COLUMNS) if players else pd.DataFrame(columns=PLAYER_COLUMNS)
+    table.insert(0, 'match_index', np.array(match_indices, dtype=np.int64))
+    table.insert(1, 'slot', np.array(slots, dtype=np.int64))
+    table['hero_id'] = table['hero_id'].fillna(-1)
+    table[ITEM_COLUMNS + STAT_COLUMNS] = table[ITEM_COLUMNS + STAT_COLUMNS].fillna(0)
+    table = table.astype({column: np.int64 for column in PLAYER_COLUMNS})
+
+    # Per-match fields broadcast onto player rows
+    durations = np.array([(m or {}).get('duration', 0) or 0 for m in matches], dtype=np.int64)
+    radiant_wins = np.array([bool((m or {}).get('radiant_win', False)) for m in matches], dtype=bool)
+    match_index = table['match_index'].to_numpy()
+
+    table['duration_minutes'] = durations[match_index] // 60
+    table['team'] = (table['slot'].to_numpy() >= 5).astype(np.int8)
+    table['win'] = (table['team'].to_numpy() == 0) == radiant_wins[match_index]
+    return table
+
+def build_name_lookup(id_to_data, name_key, fallback_prefix):
+    """
+    Build an ID-indexed array of display names for vectorized lookup
+
+    Args:
+        id_to_data: Dict mapping integer IDs to constant data dicts
+        name_key: Key holding the display name (e.g. 'localized_name', 'dname')
+        fallback_prefix: Prefix for unknown IDs, matching get_hero_name/get_item_name
+
+    Returns:
+        Function mapping an int array of IDs to an object array of names
+    """
+    size = max(id_to_data, default=0) + 1
+    names = np.array([f'{fallback_prefix}_{i}' for i in range(size)], dtype=object)
+    for item_id, data in id_to_data.items():
+        names[item_id] = data.get(name_key, f'{fallback_prefix}_{item_id}')
+
+    def lookup(ids):
+        nonlocal names
+        ids = np.asarray(ids, dtype=np.int64)
+        if ids.size == 0:
+            return np.empty(0, dtype=object)
+
+        # Unknown IDs past the end get the same fallback names as get_hero_name/get_item_name
+        max_id = int(ids.max())
+        if max_id >= len(names):
+            extra = np.array([f'{fallback_prefix}_{i}' for i in range(len(names), max_id + 1)], dtype=object)
+            names = np.concatenate([names, extra])
+
+        result = names[np.maximum(ids, 0)]
+        result[ids < 0] = f'{fallback_prefix}_None'  # Missing IDs are stored as -1
+        return result
+
+    return lookup
@@ -0,0 +1,129 @@
+"""
+Mergeable meta statistics accumulated while streaming matches
+Counts live in NumPy arrays indexed by hero_id so aggregates from separate runs
+or workers combine with a single array addition
+"""
+
+import os
+from pathlib import Path
+import numpy as np
+
+MAX_DURATION_MINUTES = 120
+
+class MetaAggregate:
+    def __init__(self, num_heroes=256):
+        """
+        Create an empty aggregate
+
+        Args:
+            num_heroes: Initial size of the hero_id-indexed arrays (grows as needed)
+        """
+        self.hero_picks = np.zeros(num_heroes, dtype=np.int64)
+        self.hero_wins = np.zeros(num_heroes, dtype=np.int64)
+        self.duration_minutes = np.zeros(MAX_DURATION_MINUTES + 1, dtype=np.int64)  # Histogram, last bin is 120+
+        self.duration_total = 0
+        self.first_blood_total = 0
+        self.first_blood_count = 0
+        self.num_matches = 0
+
+    def _ensure_hero_capacity(self, hero_id):
+        if hero_id >= len(self.hero_picks):
+            size = max(hero_id + 1, 2 * len(self.hero_picks))
+            self.hero_picks = np.pad(self.hero_picks, (0, size - len(self.hero_picks)))
+            self.hero_wins = np.pad(self.hero_wins, (0, size - len(self.hero_wins)))
+
+    def update(self, match_data):
+        """Add one match payload to the aggregate"""
+        if not match_data or 'players' not in match_data:
+            return
+
+        duration = match_data.get('duration', 0)
+        radiant_win = match_data.get('radiant_win', False)
+        first_blood_time = match_data.get('first_blood_time', 0)
+
+        self.num_matches += 1
+        self.duration_total += duration
+        self.duration_minutes[min(duration // 60, MAX_DURATION_MINUTES)] += 1
+        if first_blood_time > 0:
+            self.first_blood_total += first_blood_time
+            self.first_blood_count += 1
+
+        for i, player in enumerate(match_data['players']):
+            hero_id = player.get('hero_id')
+            if not hero_id:
+                continue
+
+            self._ensure_hero_capacity(hero_id)
+            is_radiant = i < 5
+            self.hero_picks[hero_id] += 1
+            if is_radiant == bool(radiant_win):
+                self.hero_wins[hero_id] += 1
+
+    def merge(self, other):
+        """Add another aggregate's counts into this one"""
+        self._ensure_hero_capacity(len(other.hero_picks) - 1)
+        self.hero_picks[:len(other.hero_picks)] += other.hero_picks
+        self.hero_wins[:len(other.hero_wins)] += other.hero_wins
+        self.duration_minutes += other.duration_minutes
+        self.duration_total += other.duration_total
+        self.first_blood_total += other.first_blood_total
+        self.first_blood_count += other.first_blood_count
+        self.num_matches += other.num_matches
+        return self
+
+    @property
+    def average_duration(self):
+        """Average game length in seconds (0 if no matches)"""
+        return self.duration_total / self.num_matches if self.num_matches else 0
+
+    @property
+    def average_first_blood(self):
+        """Average first blood time in seconds (0 if unknown)"""
+        return self.first_blood_total / self.first_blood_count if self.first_blood_count else 0
+
+    def win_rates(self):
+        """Win rate per hero_id (NaN for unpicked heroes)"""
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return self.hero_wins / self.hero_picks
+
+    def top_heroes(self, n=10):
+        """Most picked hero IDs, most popular first"""
+        picked = np.flatnonzero(self.hero_picks)
+        order = np.argsort(-self.hero_picks[picked], kind='stable')
+        return picked[order][:n].tolist()
+
+    def save(self, path):
+        """Atomically write the aggregate to an .npz file"""
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_name(path.name + '.tmp')
+        with open(tmp_path, 'wb') as f:
+            np.savez(
+                f,
+                hero_picks=self.hero_picks,
+                hero_wins=self.hero_wins,
+                duration_minutes=self.duration_minutes,
+                scalars=np.array([self.duration_total, self.first_blood_total,
+                                  self.first_blood_count, self.num_matches], dtype=np.int64),
+            )
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        """Read an aggregate written by save()"""
+        with np.load(path) as data:
+            aggregate = cls(num_heroes=len(data['hero_picks']))
+            aggregate.hero_picks = data['hero_picks'].copy()
+            aggregate.hero_wins = data['hero_wins'].copy()
+            aggregate.duration_minutes = data['duration_minutes'].copy()
+            (aggregate.duration_total, aggregate.first_blood_total,
+             aggregate.first_blood_count, aggregate.num_matches) = (int(x) for x in data['scalars'])
+        return aggregate
+
+    @classmethod
+    def load_merged(cls, paths):
+        """Load and merge several saved aggregates"""
+        aggregate = cls()
+        for path in paths:
+            aggregate.merge(cls.load(path))
+        return aggregate
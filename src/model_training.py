@@ -2,34 +2,64 @@
 Mistral Nemo 7B fine-tuning for Dota 2 gameplay advice
 """
 
+import importlib.util
 import json
+import os
 import torch
 from pathlib import Path
 from datasets import Dataset
 from transformers import (
     AutoTokenizer, 
     AutoModelForCausalLM, 
-    TrainingArguments,
-    BitsAndBytesConfig
+    BitsAndBytesConfig,
+    MistralConfig
 )
-from peft import LoraConfig, get_peft_model, prepare_model_for_kbit_training
-from trl import SFTTrainer
+from peft import LoraConfig, PeftModel, get_peft_model, prepare_model_for_kbit_training
+from trl import SFTConfig, SFTTrainer
 import config
+try:
+    from .dataset_cache import load_or_build_tokenized_dataset
+    from .sequence_packing import bucketing_report, packing_report, print_bucketing_report, print_packing_report
+    from .training_metrics import ThroughputCallback
+    from .checkpointing import (DatasetStateCallback, TimedCheckpointCallback, check_resume_compatible,
+                                find_resume_checkpoint)
+except ImportError:
+    from src.dataset_cache import load_or_build_tokenized_dataset
+    from src.sequence_packing import bucketing_report, packing_report, print_bucketing_report, print_packing_report
+    from src.training_metrics import ThroughputCallback
+    from src.checkpointing import (DatasetStateCallback, TimedCheckpointCallback, check_resume_compatible,
+                                   find_resume_checkpoint)
 
 class DotaModelTrainer:
-    def __init__(self, model_name=config.MODEL_NAME):
+    def __init__(self, model_name=config.MODEL_NAME, completion_only=config.COMPLETION_ONLY_LOSS):
+        """
+        Args:
+            model_name: Base model to fine-tune
+            completion_only: Format with the adapter's chat template and compute loss on responses only
+        """
         self.model_name = model_name
+        self.completion_only = completion_only
         self.tokenizer = None
         self.model = None
+        # Extra TrainerCallbacks (metrics, profiling, ...) attached to every training run
+        self.callbacks = []
+        
+    def setup_tokenizer(self):
+        """Initialize the tokenizer (enough for preprocessing without loading the model)"""
+        self.tokenizer = AutoTokenizer.from_pretrained(self.model_name)
+        self.tokenizer.pad_token = self.tokenizer.eos_token
+        self.tokenizer.padding_side = "right"
+        
+        # Train with the same chat template the saved adapter ships for inference
+        if self.completion_only and Path(config.CHAT_TEMPLATE_FILE).exists():
+            self.tokenizer.chat_template = Path(config.CHAT_TEMPLATE_FILE).read_text(encoding='utf-8')
         
     def setup_model_and_tokenizer(self):
         """Initialize tokenizer and model with quantization"""
         print(f"Loading tokenizer and model: {self.model_name}")
         
         # Setup tokenizer
-        self.tokenizer = AutoTokenizer.from_pretrained(self.model_name)
-        self.tokenizer.pad_token = self.tokenizer.eos_token
-        self.tokenizer.padding_side = "right"
+        self.setup_tokenizer()
         
         # Setup quantization config for memory efficiency
         bnb_config = BitsAndBytesConfig(
@@ -51,17 +81,59 @@ class DotaModelTrainer:
         # Prepare model for k-bit training
         self.model = prepare_model_for_kbit_training(self.model)
         
-    def setup_lora(self):
-        """Setup LoRA configuration"""
+    def setup_benchmark_model(self, hidden_size=128, num_layers=2):
+        """
+        Initialize the tokenizer and a tiny randomly initialized model for CPU benchmarks
+        
+        The model uses the Mistral architecture and the real tokenizer's vocabulary,
+        without quantization or a GPU, so the data and training path can be timed anywhere.
+        
+        Args:
+            hidden_size: Model width
+            num_layers: Number of decoder layers
+        """
+        self.setup_tokenizer()
+        model_config = MistralConfig(
+            vocab_size=len(self.tokenizer),
+            hidden_size=hidden_size,
+            intermediate_size=hidden_size * 2,
+            num_hidden_layers=num_layers,
+            num_attention_heads=4,
+            num_key_value_heads=2,
+            max_position_embeddings=config.MAX_LENGTH,
+            pad_token_id=self.tokenizer.pad_token_id,
+            bos_token_id=self.tokenizer.bos_token_id,
+            eos_token_id=self.tokenizer.eos_token_id,
+        )
+        torch.manual_seed(0)
+        self.model = AutoModelForCausalLM.from_config(model_config)
+        print(f"Initialized benchmark model ({sum(p.numel() for p in self.model.parameters()) / 1e6:.1f}M parameters)")
+        
+    def setup_lora(self, target_modules=None, r=None, alpha=None, dropout=None):
+        """
+        Setup LoRA configuration
+        
+        Calling this again replaces the current adapter with a fresh one on the
+        same loaded base model, so several adapters can be trained without reloading it.
+        
+        Args:
+            target_modules: Modules to adapt (default config.LORA_TARGET_MODULES)
+            r: LoRA rank (default config.LORA_R)
+            alpha: LoRA alpha (default config.LORA_ALPHA)
+            dropout: LoRA dropout (default config.LORA_DROPOUT)
+        """
         lora_config = LoraConfig(
-            r=config.LORA_R,
-            lora_alpha=config.LORA_ALPHA,
-            target_modules=config.LORA_TARGET_MODULES,
-            lora_dropout=config.LORA_DROPOUT,
+            r=r or config.LORA_R,
+            lora_alpha=alpha or config.LORA_ALPHA,
+            target_modules=target_modules or config.LORA_TARGET_MODULES,
+            lora_dropout=config.LORA_DROPOUT if dropout is None else dropout,
             bias="none",
             task_type="CAUSAL_LM",
         )
         
+        if isinstance(self.model, PeftModel):
+            # Drop the previous adapter's layers; the base weights are untouched
+            self.model = self.model.unload()
         self.model = get_peft_model(self.model, lora_config)
         
     def load_training_data(self, data_path=config.TRAINING_DATA_FILE):
@@ -94,30 +166,161 @@ class DotaModelTrainer:
         print(f"Created dataset with {len(dataset)} examples")
         return dataset
     
-    def train_model(self, dataset, output_dir=None):
-        """Train the model using SFTTrainer"""
+    def tokenize_examples(self, batch):
+        """Format and tokenize a batch of raw examples the same way SFTTrainer would"""
+        texts = [
+            self.format_training_example({'instruction': instruction, 'output': output})["text"] + self.tokenizer.eos_token
+            for instruction, output in zip(batch['instruction'], batch['output'])
+        ]
+        tokenized = self.tokenizer(texts, truncation=True, max_length=config.MAX_LENGTH)
+        return {"input_ids": tokenized["input_ids"]}
+    
+    def tokenize_completion_examples(self, batch):
+        """
+        Tokenize a batch with the chat template, masking prompt tokens out of the loss
+        
+        Labels are -100 over the prompt (everything up to and including [/INST]), so the
+        collator needs no per-batch search for the response start.
+        """
+        input_ids = []
+        labels = []
+        for instruction, output in zip(batch['instruction'], batch['output']):
+            prompt = [{"role": "user", "content": instruction}]
+            prompt_text = self.tokenizer.apply_chat_template(prompt, tokenize=False, add_generation_prompt=True)
+            full_text = self.tokenizer.apply_chat_template(prompt + [{"role": "assistant", "content": output}],
+                                                           tokenize=False)
+            prompt_ids = self.tokenizer(prompt_text, add_special_tokens=False)["input_ids"]
+            ids = self.tokenizer(full_text, add_special_tokens=False, truncation=True,
+                                 max_length=config.MAX_LENGTH)["input_ids"]
+            
+            # The response starts where the prompt and full tokenizations diverge
+            prompt_length = 0
+            for prompt_id, full_id in zip(prompt_ids, ids):
+                if prompt_id != full_id:
+                    break
+                prompt_length += 1
+            
+            input_ids.append(ids)
+            labels.append([-100] * prompt_length + ids[prompt_length:])
+        return {"input_ids": input_ids, "labels": labels}
+    
+    def load_tokenized_dataset(self, data_path=config.TRAINING_DATA_FILE, cache_dir=config.DATASET_CACHE_DIR,
+                               rebuild=False, packing=False):
+        """
+        Load the training data tokenized, from the on-disk cache when possible
+        
+        Args:
+            data_path: JSONL training data file
+            cache_dir: Directory of cached tokenized datasets
+            rebuild: Tokenize again even if a cache entry exists
+            packing: Pack examples into config.MAX_LENGTH rows and report packing efficiency
+        """
+        if self.tokenizer is None:
+            self.setup_tokenizer()
+        
+        if self.completion_only:
+            mode, tokenize_batch = 'chat-completion', self.tokenize_completion_examples
+        else:
+            mode, tokenize_batch = 'text', self.tokenize_examples
+        
+        dataset = load_or_build_tokenized_dataset(
+            data_path, self.tokenizer, tokenize_batch, config.MAX_LENGTH, cache_dir,
+            mode=mode, rebuild=rebuild
+        )
+        if not packing:
+            print(f"Created dataset with {len(dataset)} examples")
+            print_bucketing_report(bucketing_report(dataset['length'], config.BATCH_SIZE))
+            return dataset
+        
+        packed = load_or_build_tokenized_dataset(
+            data_path, self.tokenizer, tokenize_batch, config.MAX_LENGTH, cache_dir,
+            mode=mode, rebuild=rebuild, packed=True
+        )
+        print_packing_report(packing_report(dataset['length'], packed['length'], config.MAX_LENGTH,
+                                            config.BATCH_SIZE))
+        return packed
+    
+    def add_callback(self, callback):
+        """Attach a TrainerCallback to subsequent train_model runs"""
+        self.callbacks.append(callback)
+    
+    def train_model(self, dataset, output_dir=None, group_by_length=config.GROUP_BY_LENGTH,
+                    throughput_metrics=config.THROUGHPUT_METRICS, profile_steps=None, resume_from_checkpoint=None,
+                    save_steps=config.SAVE_STEPS, save_total_limit=config.SAVE_TOTAL_LIMIT,
+                    save_every_minutes=config.SAVE_EVERY_MINUTES, learning_rate=None, max_steps=-1,
+                    training_overrides=None):
+        """
+        Train the model using SFTTrainer
+        
+        Args:
+            dataset: Dataset from prepare_dataset or load_tokenized_dataset
+            output_dir: Where checkpoints and the final adapter are saved
+            group_by_length: Batch examples of similar token length together to cut padding
+                (uses the cached dataset's length column)
+            throughput_metrics: Record per-step throughput to output_dir/throughput.jsonl and .csv
+            profile_steps: (start_step, num_steps) window to capture with the torch profiler
+            resume_from_checkpoint: Checkpoint directory to continue from, or True for the latest
+                complete checkpoint in output_dir. Adapter, optimizer, scheduler and RNG state are
+                restored and the batches already trained on are skipped.
+            save_steps: Save a checkpoint every N optimizer steps
+            save_total_limit: Checkpoints kept in output_dir (older ones are deleted)
+            save_every_minutes: Also save whenever this many minutes passed since the last checkpoint (0 disables)
+            learning_rate: Peak learning rate (default config.LEARNING_RATE)
+            max_steps: Stop after this many optimizer steps instead of config.NUM_EPOCHS epochs (-1 disables)
+            training_overrides: Extra SFTConfig fields, e.g. {'use_cpu': True, 'optim': 'adamw_torch'}
+                for a CPU run of a benchmark model
+        """
         if output_dir is None:
             output_dir = config.MODELS_DIR / "mistral-nemo-dota2"
         
+        if resume_from_checkpoint is True:
+            resume_from_checkpoint = find_resume_checkpoint(output_dir)
+            if resume_from_checkpoint is None:
+                print(f"No complete checkpoint in {output_dir}, starting from scratch")
+        
+        # Pre-tokenized datasets (from the cache) go straight to the collator; packed rows
+        # need the padding-free collator so attention restarts at every example boundary
+        pretokenized = "input_ids" in dataset.column_names
+        packed = "seq_lengths" in dataset.column_names
+        
         # Training arguments
-        training_args = TrainingArguments(
+        training_settings = dict(
             output_dir=str(output_dir),
             num_train_epochs=config.NUM_EPOCHS,
+            max_steps=max_steps,
             per_device_train_batch_size=config.BATCH_SIZE,
             gradient_accumulation_steps=config.GRADIENT_ACCUMULATION_STEPS,
-            learning_rate=config.LEARNING_RATE,
+            learning_rate=learning_rate or config.LEARNING_RATE,
             warmup_steps=config.WARMUP_STEPS,
             logging_steps=10,
-            save_steps=100,
-            save_total_limit=2,
+            save_steps=save_steps,
+            save_total_limit=save_total_limit,
             prediction_loss_only=True,
             remove_unused_columns=False,
             push_to_hub=False,
-            report_to=["wandb"] if "wandb" in locals() else [],
+            report_to=["wandb"] if os.environ.get("WANDB_PROJECT") and importlib.util.find_spec("wandb") else [],
             optim="paged_adamw_8bit",
             lr_scheduler_type="cosine",
             gradient_checkpointing=True,
+            # Packed rows are already at most MAX_LENGTH; TRL rejects a max_length it cannot
+            # enforce on a padding-free batch
+            max_length=None if packed else config.MAX_LENGTH,
+            padding_free=packed,
+            train_sampling_strategy="group_by_length" if group_by_length else "random",
+            length_column_name="length",
+            include_num_input_tokens_seen="non_padding",
+            dataset_kwargs={"skip_prepare_dataset": True} if pretokenized else None,
         )
+        training_settings.update(training_overrides or {})
+        training_args = SFTConfig(**training_settings)
+        
+        callbacks = list(self.callbacks) + [DatasetStateCallback(dataset)]
+        if save_every_minutes:
+            callbacks.append(TimedCheckpointCallback(save_every_minutes))
+        if throughput_metrics or profile_steps:
+            profile_start, num_profile_steps = profile_steps or (None, 0)
+            callbacks.append(ThroughputCallback(output_dir, profile_start=profile_start,
+                                                profile_steps=num_profile_steps))
         
         # Initialize trainer
         trainer = SFTTrainer(
@@ -125,11 +328,23 @@ class DotaModelTrainer:
             train_dataset=dataset,
             args=training_args,
             processing_class=self.tokenizer,
-            formatting_func=lambda x: x["text"],
+            formatting_func=None if pretokenized else lambda x: x["text"],
+            callbacks=callbacks,
         )
         
+        if resume_from_checkpoint:
+            check_resume_compatible(resume_from_checkpoint, dataset, training_args)
+            print(f"Resuming from {resume_from_checkpoint}")
+        
         print("Starting training...")
-        trainer.train()
+        train_result = trainer.train(resume_from_checkpoint=str(resume_from_checkpoint) if resume_from_checkpoint else None)
+        
+        # Real (non-pad) tokens per second, comparable across packing and bucketing modes
+        runtime = train_result.metrics.get('train_runtime')
+        if runtime:
+            tokens_seen = trainer.state.num_input_tokens_seen
+            print(f"Trained on {tokens_seen} real tokens in {runtime:.0f}s "
+                  f"({tokens_seen / runtime:.0f} tokens/sec, {'length-grouped' if group_by_length else 'random'} batches)")
         
         # Save the final model
         print(f"Saving model to {output_dir}")
@@ -149,13 +364,20 @@ class DotaModelTrainer:
         
         print("\n=== Testing Model ===")
         for prompt in test_prompts:
-            formatted_prompt = f"[INST] {prompt} [/INST]"
+            if self.completion_only:
+                # Same chat template the model was trained with (it already adds <s>)
+                formatted_prompt = self.tokenizer.apply_chat_template(
+                    [{"role": "user", "content": prompt}], tokenize=False, add_generation_prompt=True
+                )
+            else:
+                formatted_prompt = f"[INST] {prompt} [/INST]"
             
             inputs = self.tokenizer(
                 formatted_prompt, 
                 return_tensors="pt", 
                 truncation=True,
-                max_length=config.MAX_LENGTH
+                max_length=config.MAX_LENGTH,
+                add_special_tokens=not self.completion_only
             ).to(self.model.device)
             
             with torch.no_grad():
@@ -186,9 +408,8 @@ def main():
     trainer.setup_model_and_tokenizer()
     trainer.setup_lora()
     
-    # Load and prepare data
-    training_examples = trainer.load_training_data()
-    dataset = trainer.prepare_dataset(training_examples)
+    # Load and prepare data (tokenized once, then reused from the cache)
+    dataset = trainer.load_tokenized_dataset()
     
     # Train the model
     trained_model = trainer.train_model(dataset)
@@ -0,0 +1,57 @@
+"""
+Reuse of the key/value cache for the prompt prefix every question shares
+Each formatted prompt starts with the same [INST] scaffold and optional system
+prompt. Its keys and values are computed once per loaded model; prompts then
+only prefill the tokens after it. The "(This is about Dota 2) [/INST]" tail
+comes after the question, so it is still prefilled per prompt.
+"""
+
+import torch
+try:
+    from .inference import prompt_prefix
+    from .kv_cache import cache_tensors, keep_first, repeat_rows, to_dynamic_cache
+except ImportError:
+    from src.inference import prompt_prefix
+    from src.kv_cache import cache_tensors, keep_first, repeat_rows, to_dynamic_cache
+
+class PromptPrefixCache:
+    def __init__(self, model, tokenizer, prefix=None):
+        """
+        Run the shared prefix through the model once
+
+        Args:
+            model: Model the prompts will be generated with (including its adapter)
+            tokenizer: Matching tokenizer
+            prefix: Prefix text (default: prompt_prefix(), i.e. [INST] and SYSTEM_PROMPT)
+        """
+        self.prefix_ids = tokenizer(prefix if prefix is not None else prompt_prefix())["input_ids"]
+        with torch.no_grad():
+            outputs = model(input_ids=torch.tensor([self.prefix_ids], device=model.device), use_cache=True)
+        self.tensors = cache_tensors(outputs.past_key_values)
+
+    def match(self, prompt_ids):
+        """
+        Leading tokens of a prompt covered by the cached prefix
+
+        The prefix is tokenized on its own, so its last token can differ from
+        the prompt's tokenization (e.g. a trailing space merged into the next
+        word); only the tokens both agree on are reused. At least one prompt
+        token is left to prefill so the model produces logits.
+        """
+        length = 0
+        for prefix_id, prompt_id in zip(self.prefix_ids, prompt_ids[:-1]):
+            if prefix_id != prompt_id:
+                break
+            length += 1
+        return length
+
+    def cache_for(self, length, rows=1):
+        """Per-layer tensors of the first length prefix positions, repeated for rows prompts"""
+        return repeat_rows(keep_first(self.tensors, length), rows)
+
+    def generate_kwargs(self, input_ids):
+        """past_key_values for model.generate on a single prompt (empty when nothing is shared)"""
+        length = self.match(input_ids[0].tolist())
+        if not length:
+            return {}
+        return {'past_key_values': to_dynamic_cache(self.cache_for(length))}
@@ -0,0 +1,168 @@
+"""
+Response cache in front of generation
+Coaching questions repeat all day ("what to build on Pudge"), so answers are
+kept and served again instead of paying for another full generation.
+
+Two layers:
+    exact    - the question normalized the way the model sees it (lane terms
+               rewritten, case, punctuation and spacing ignored)
+    similar  - optional; cosine similarity of sentence embeddings above a
+               threshold (needs the sentence-transformers package)
+
+Entries expire after a TTL and the least recently used one is evicted when the
+cache is full. Requests with non-default sampling settings bypass the cache.
+"""
+
+import re
+import threading
+import time
+from collections import OrderedDict
+import numpy as np
+import config
+try:
+    from .inference import DEFAULT_GENERATION, rewrite_lane_terms
+except ImportError:
+    from src.inference import DEFAULT_GENERATION, rewrite_lane_terms
+
+def normalize_question(question):
+    """Cache key for a question: lane terms rewritten, lower case, punctuation and extra spaces removed"""
+    question = rewrite_lane_terms(question.strip().lower())
+    question = re.sub(r"[^\w\s'+-]", " ", question)
+    return " ".join(question.split())
+
+def load_embedder(model_name):
+    """
+    Sentence embedding function for the similarity layer
+
+    Args:
+        model_name: sentence-transformers model (e.g. sentence-transformers/all-MiniLM-L6-v2)
+
+    Returns:
+        Function mapping a list of strings to unit-length vectors, or None when
+        sentence-transformers is not installed
+    """
+    try:
+        from sentence_transformers import SentenceTransformer
+    except ImportError:
+        print("sentence-transformers is not installed; response cache uses exact matches only")
+        return None
+    model = SentenceTransformer(model_name)
+    return lambda texts: model.encode(texts, normalize_embeddings=True, convert_to_numpy=True)
+
+def create_response_cache(enabled=None):
+    """
+    Response cache configured from config.py (RESPONSE_CACHE_*)
+
+    Args:
+        enabled: Override RESPONSE_CACHE
+
+    Returns:
+        ResponseCache, or None when caching is disabled
+    """
+    if not (config.RESPONSE_CACHE if enabled is None else enabled):
+        return None
+    embed = load_embedder(config.RESPONSE_CACHE_EMBEDDING_MODEL) if config.RESPONSE_CACHE_EMBEDDING_MODEL else None
+    return ResponseCache(max_entries=config.RESPONSE_CACHE_SIZE, ttl_seconds=config.RESPONSE_CACHE_TTL,
+                         embed=embed, similarity_threshold=config.RESPONSE_CACHE_SIMILARITY)
+
+class ResponseCache:
+    def __init__(self, max_entries=1024, ttl_seconds=86400, embed=None, similarity_threshold=0.92):
+        """
+        Initialize the cache
+
+        Args:
+            max_entries: Answers kept at most; the least recently used is evicted first
+            ttl_seconds: Age after which an answer is generated again (0 keeps answers forever)
+            embed: Optional function from load_embedder enabling the similarity layer
+            similarity_threshold: Cosine similarity a cached question needs to be reused
+        """
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.embed = embed
+        self.similarity_threshold = similarity_threshold
+        self.entries = OrderedDict()  # key -> (answer, stored_at, embedding)
+        self.lock = threading.Lock()
+        self.exact_hits = 0
+        self.similar_hits = 0
+        self.misses = 0
+        self.bypassed = 0
+        self.evictions = 0
+
+    @staticmethod
+    def cacheable(settings):
+        """Whether a request's sampling settings match the defaults answers were cached with"""
+        return all(value is None or value == DEFAULT_GENERATION.get(name) for name, value in (settings or {}).items())
+
+    def _expired(self, stored_at, now):
+        return self.ttl_seconds > 0 and now - stored_at > self.ttl_seconds
+
+    def _embedding(self, key):
+        return self.embed([key])[0] if self.embed is not None else None
+
+    def get(self, question, settings=None):
+        """
+        Cached answer for a question, or None
+
+        Args:
+            question: Question as asked
+            settings: Sampling settings of the request (non-default settings bypass the cache)
+        """
+        if not self.cacheable(settings):
+            with self.lock:
+                self.bypassed += 1
+            return None
+        key = normalize_question(question)
+        now = time.time()
+
+        with self.lock:
+            for stale in [k for k, (_, stored_at, _) in self.entries.items() if self._expired(stored_at, now)]:
+                del self.entries[stale]
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                self.exact_hits += 1
+                return self.entries[key][0]
+            if self.embed is None or not self.entries:
+                self.misses += 1
+                return None
+
+        # Embed outside the lock; it is the slow part of a lookup
+        embedding = self._embedding(key)
+        with self.lock:
+            keys = list(self.entries)
+            if keys:
+                similarities = np.stack([self.entries[k][2] for k in keys]) @ embedding
+                best = int(similarities.argmax())
+                if similarities[best] >= self.similarity_threshold:
+                    self.entries.move_to_end(keys[best])
+                    self.similar_hits += 1
+                    return self.entries[keys[best]][0]
+            self.misses += 1
+            return None
+
+    def put(self, question, answer, settings=None):
+        """Store a generated answer (ignored for non-default sampling settings)"""
+        if not self.cacheable(settings) or not answer:
+            return
+        key = normalize_question(question)
+        embedding = self._embedding(key)
+        with self.lock:
+            self.entries[key] = (answer, time.time(), embedding)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+                self.evictions += 1
+
+    def stats(self):
+        """Hit counts and hit rate over the cacheable lookups"""
+        with self.lock:
+            lookups = self.exact_hits + self.similar_hits + self.misses
+            return {
+                'entries': len(self.entries),
+                'max_entries': self.max_entries,
+                'exact_hits': self.exact_hits,
+                'similar_hits': self.similar_hits,
+                'misses': self.misses,
+                'bypassed': self.bypassed,
+                'evictions': self.evictions,
+                'hit_rate': (self.exact_hits + self.similar_hits) / lookups if lookups else 0.0,
+            }
@@ -0,0 +1,114 @@
+"""
+Sequence packing and length bucketing for short instruction/response pairs
+Packs tokenized examples into MAX_LENGTH rows with best-fit-decreasing. Each
+row keeps per-example seq_lengths, from which the padding-free collator
+restarts position_ids. The model then attends only within each example and
+gets no loss on the first token of each example. Also estimates how much
+padding random and length-grouped batches carry.
+"""
+
+import math
+import numpy as np
+import torch
+from transformers.trainer_pt_utils import LengthGroupedSampler
+from trl import pack_dataset
+
+def pack_tokenized_dataset(dataset, max_length, batch_size=10000):
+    """
+    Pack a tokenized dataset into rows of at most max_length tokens
+
+    Args:
+        dataset: Dataset with input_ids (and optionally length) columns
+        max_length: Tokens per packed row
+        batch_size: Examples considered together when packing (larger packs tighter)
+
+    Returns:
+        Dataset with input_ids, seq_lengths and length (tokens in the row) columns
+    """
+    columns = [column for column in dataset.column_names if column not in ('input_ids', 'labels')]
+    packed = pack_dataset(dataset.remove_columns(columns), max_length, strategy="bfd",
+                          map_kwargs={'batch_size': batch_size, 'desc': "Packing"})
+    return packed.map(lambda batch: {'length': [sum(lengths) for lengths in batch['seq_lengths']]},
+                      batched=True, desc="Measuring packed rows")
+
+def padded_tokens(lengths, batch_size):
+    """Tokens processed when consecutive examples are batched and padded to the batch maximum"""
+    lengths = np.asarray(lengths, dtype=np.int64)
+    num_batches = math.ceil(len(lengths) / batch_size)
+    padded = np.zeros(num_batches * batch_size, dtype=np.int64)
+    padded[:len(lengths)] = lengths
+    batch_max = padded.reshape(num_batches, batch_size).max(axis=1)
+    # The last batch only holds the leftover examples
+    last_size = len(lengths) - (num_batches - 1) * batch_size
+    return int((batch_max * batch_size).sum() - batch_max[-1] * (batch_size - last_size)) if num_batches else 0
+
+def bucketing_report(lengths, batch_size, seed=0):
+    """
+    Compare padding in random batches with length-grouped batches
+
+    Uses the same LengthGroupedSampler the trainer uses for train_sampling_strategy="group_by_length".
+
+    Returns:
+        Dict with real tokens and the share of real (non-pad) tokens for each sampler
+    """
+    lengths = np.asarray(lengths, dtype=np.int64)
+    real_tokens = int(lengths.sum())
+    random_order = np.random.default_rng(seed).permutation(len(lengths))
+    sampler = LengthGroupedSampler(batch_size, lengths=lengths.tolist(),
+                                   generator=torch.Generator().manual_seed(seed))
+    grouped_order = np.fromiter(iter(sampler), dtype=np.int64, count=len(lengths))
+
+    random_padded = padded_tokens(lengths[random_order], batch_size)
+    grouped_padded = padded_tokens(lengths[grouped_order], batch_size)
+    return {
+        'real_tokens': real_tokens,
+        'random_efficiency': real_tokens / random_padded if random_padded else 0.0,
+        'grouped_efficiency': real_tokens / grouped_padded if grouped_padded else 0.0,
+    }
+
+def print_bucketing_report(report):
+    """Print a bucketing report from bucketing_report"""
+    speedup = report['grouped_efficiency'] / report['random_efficiency'] if report['random_efficiency'] else 0.0
+    print(f"Random batches: {report['random_efficiency']:.1%} real tokens")
+    print(f"Length-grouped batches: {report['grouped_efficiency']:.1%} real tokens "
+          f"({speedup:.2f}x less compute per real token)")
+
+def packing_report(example_lengths, packed_lengths, max_length, batch_size, seed=0):
+    """
+    Compare padded batching with packed rows
+
+    Args:
+        example_lengths: Token count of every example before packing
+        packed_lengths: Token count of every packed row
+        max_length: Tokens per packed row
+        batch_size: Per-device batch size used in training
+        seed: Shuffle seed for estimating padding in randomly drawn batches
+
+    Returns:
+        Dict with token counts, padded and packed efficiency and steps per epoch
+    """
+    example_lengths = np.asarray(example_lengths, dtype=np.int64)
+    packed_lengths = np.asarray(packed_lengths, dtype=np.int64)
+    real_tokens = int(example_lengths.sum())
+
+    # Random batches are padded to their longest member
+    shuffled = np.random.default_rng(seed).permutation(example_lengths)
+    num_batches = math.ceil(len(shuffled) / batch_size)
+    padded = padded_tokens(shuffled, batch_size)
+
+    return {
+        'examples': int(len(example_lengths)),
+        'packed_rows': int(len(packed_lengths)),
+        'real_tokens': real_tokens,
+        'padded_efficiency': real_tokens / padded if padded else 0.0,
+        'packed_fill': real_tokens / (len(packed_lengths) * max_length) if len(packed_lengths) else 0.0,
+        'steps_unpacked': num_batches,
+        'steps_packed': math.ceil(len(packed_lengths) / batch_size),
+    }
+
+def print_packing_report(report):
+    """Print a packing report from packing_report"""
+    print(f"Packed {report['examples']} examples ({report['real_tokens']} tokens) into {report['packed_rows']} rows")
+    print(f"Padded batches: {report['padded_efficiency']:.1%} real tokens, {report['steps_unpacked']} batches/epoch")
+    print(f"Packed rows: {report['packed_fill']:.1%} full, {report['steps_packed']} batches/epoch "
+          f"({report['steps_unpacked'] / max(report['steps_packed'], 1):.1f}x fewer)")
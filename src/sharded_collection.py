@@ -0,0 +1,213 @@
+"""
+Multi-process data collection over sharded match-ID ranges
+A coordinator splits a match-ID range across worker processes (optionally one
+API key each). Every shard writes its own JSONL, meta aggregate and crawl
+cursor, so any shard can be restarted on its own, and a merge step combines them.
+"""
+
+import hashlib
+import json
+import math
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+try:
+    from .build_aggregate import HeroBuildAggregate
+    from .data_collection import PAID_TIER_MAX_RATE, OpenDotaCollector, TrainingDataGenerator
+    from .match_cache import MatchCache
+    from .match_crawler import MatchCrawler
+    from .meta_aggregate import MetaAggregate
+    from .streaming_writer import JsonlWriter, iter_checkpointed
+except ImportError:
+    from src.build_aggregate import HeroBuildAggregate
+    from src.data_collection import PAID_TIER_MAX_RATE, OpenDotaCollector, TrainingDataGenerator
+    from src.match_cache import MatchCache
+    from src.match_crawler import MatchCrawler
+    from src.meta_aggregate import MetaAggregate
+    from src.streaming_writer import JsonlWriter, iter_checkpointed
+
+PLAN_FILE = "plan.json"
+
+def plan_shards(upper_match_id, lower_match_id, num_shards, num_matches, api_keys=None,
+                rate_limit=None, **collector_options):
+    """
+    Split [lower_match_id, upper_match_id) into contiguous shards
+
+    Args:
+        upper_match_id: Exclusive upper bound of the crawl
+        lower_match_id: Inclusive lower bound of the crawl
+        num_shards: Number of worker shards
+        num_matches: Total matches to collect across all shards
+        api_keys: API keys assigned to shards round-robin (None for the free tier); the
+            plan stores only each shard's key index, never the key itself
+        rate_limit: Requests/second per API key, divided between the shards sharing it
+        collector_options: Extra OpenDotaCollector arguments (delay, max_concurrency, ...); a
+            max_rate ceiling is per API key and divided between the shards sharing it like rate_limit
+
+    Returns:
+        List of shard specs (plain dicts, so they pickle to workers and save as JSON)
+    """
+    num_keys = len(api_keys) if api_keys else 1
+    collector_options = dict(collector_options)
+    max_rate = collector_options.pop('max_rate', None)
+    if max_rate is None and api_keys:
+        # Same default ceiling a single collector with this key would use
+        max_rate = max(PAID_TIER_MAX_RATE, rate_limit or 0)
+    span = upper_match_id - lower_match_id
+    per_shard = math.ceil(num_matches / num_shards)
+
+    shards = []
+    for index in range(num_shards):
+        key_index = index % num_keys
+        shards_sharing_key = len(range(key_index, num_shards, num_keys))
+        shard_rate = rate_limit / shards_sharing_key if rate_limit else None
+        shard_max_rate = max(max_rate / shards_sharing_key, shard_rate or 0) if max_rate else None
+        shards.append({
+            'index': index,
+            'upper_match_id': upper_match_id - (span * index) // num_shards,
+            'lower_match_id': upper_match_id - (span * (index + 1)) // num_shards,
+            'num_matches': per_shard,
+            'api_key_index': key_index,
+            'rate_limit': shard_rate,
+            'max_rate': shard_max_rate,
+            'collector_options': collector_options,
+        })
+    return shards
+
+def save_plan(shard_dir, shards, min_rank, aggregate_builds=False):
+    """Persist the shard plan so restarts reuse the same ranges and output format"""
+    shard_dir = Path(shard_dir)
+    shard_dir.mkdir(parents=True, exist_ok=True)
+    with open(shard_dir / PLAN_FILE, 'w', encoding='utf-8') as f:
+        json.dump({'min_rank': min_rank, 'aggregate_builds': aggregate_builds, 'shards': shards}, f, indent=2)
+
+def load_plan(shard_dir):
+    """Read a saved shard plan, or None if there is none"""
+    plan_path = Path(shard_dir) / PLAN_FILE
+    if not plan_path.exists():
+        return None
+    with open(plan_path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+def shard_paths(shard_dir, index):
+    """Output, aggregate, build aggregate and cursor paths for one shard"""
+    shard_dir = Path(shard_dir)
+    output = shard_dir / f"shard_{index:03d}.jsonl"
+    return {
+        'output': output,
+        'aggregate': output.with_name(output.name + '.meta.npz'),
+        'builds': output.with_name(output.name + '.builds.npz'),
+        'cursor': shard_dir / f"shard_{index:03d}.cursor.json",
+    }
+
+def run_shard(shard, shard_dir, min_rank, api_keys=None, cache_path=None, fsync_every=50, aggregate_builds=False):
+    """
+    Collect one shard; safe to call again to resume it after an interruption
+
+    Runs in a worker process, so everything it needs arrives as plain arguments.
+    With aggregate_builds the shard only counts builds into its .builds.npz;
+    merge_shards turns the merged counts into examples.
+
+    Returns:
+        (shard index, training examples in the shard file)
+    """
+    paths = shard_paths(shard_dir, shard['index'])
+    cache = MatchCache(cache_path) if cache_path else None
+
+    api_key = api_keys[shard['api_key_index'] % len(api_keys)] if api_keys else None
+    collector_options = dict(shard['collector_options'])
+    if 'max_rate' in shard:
+        collector_options['max_rate'] = shard['max_rate']
+    collector = OpenDotaCollector(api_key=api_key, rate_limit=shard['rate_limit'],
+                                  cache=cache, **collector_options)
+    crawler = MatchCrawler(collector, cursor_path=paths['cursor'], min_rank=min_rank,
+                           upper_match_id=shard['upper_match_id'],
+                           lower_match_id=shard['lower_match_id'])
+    generator = TrainingDataGenerator(collector)
+
+    # The meta aggregate is saved with every checkpoint of the shard's output, so it
+    # counts exactly the matches collected so far (not failed or lost ones)
+    collected = MetaAggregate.load(paths['aggregate']).num_matches if paths['aggregate'].exists() else 0
+    remaining = max(0, shard['num_matches'] - collected)
+    print(f"[shard {shard['index']}] matches [{shard['lower_match_id']}, {shard['upper_match_id']}), "
+          f"{remaining} still to collect")
+
+    matches = generator.iter_match_details(remaining, crawler=crawler)
+    total = generator.stream_training_data(matches, paths['output'], resume=True,
+                                           fsync_every=fsync_every, include_aggregates=False,
+                                           aggregate_builds=aggregate_builds, crawler=crawler)
+    return shard['index'], total
+
+def run_shards(shards, shard_dir, min_rank, api_keys=None, cache_path=None, fsync_every=50, max_workers=None,
+               aggregate_builds=False):
+    """Run shards in parallel worker processes"""
+    results = {}
+    with ProcessPoolExecutor(max_workers=max_workers or len(shards)) as executor:
+        futures = [executor.submit(run_shard, shard, str(shard_dir), min_rank, api_keys,
+                                   str(cache_path) if cache_path else None, fsync_every, aggregate_builds)
+                   for shard in shards]
+        for future in as_completed(futures):
+            try:
+                index, total = future.result()
+                results[index] = total
+                print(f"[shard {index}] finished with {total} training examples")
+            except Exception as e:
+                print(f"Shard failed: {e} (rerun it with --shard to resume)")
+    return results
+
+def merge_shards(shard_dir, output_path, generator):
+    """
+    Combine shard outputs into one training file
+
+    Only each shard's checkpointed records are read, so a shard that is still
+    running or crashed mid-write contributes exactly what its resume keeps.
+    Exact duplicate training pairs are dropped (by SHA-1 of the serialized
+    record), shard aggregates are merged, and meta examples (plus build
+    examples for a plan with aggregate_builds) are generated once from the
+    merged aggregates.
+
+    Returns:
+        (examples written, duplicates dropped)
+    """
+    plan = load_plan(shard_dir)
+    indices = [shard['index'] for shard in plan['shards']] if plan else []
+    aggregate_builds = plan.get('aggregate_builds', False) if plan else False
+
+    seen_hashes = set()
+    duplicates = 0
+    aggregate_paths = []
+    builds_paths = []
+
+    with JsonlWriter(output_path, fsync_every=1000) as writer:
+        for index in indices:
+            paths = shard_paths(shard_dir, index)
+            if not paths['output'].exists():
+                print(f"[shard {index}] has no output yet, skipping")
+                continue
+            if paths['aggregate'].exists():
+                aggregate_paths.append(paths['aggregate'])
+            if aggregate_builds and paths['builds'].exists():
+                builds_paths.append(paths['builds'])
+
+            for record in iter_checkpointed(paths['output']):
+                digest = hashlib.sha1(json.dumps(record, sort_keys=True).encode('utf-8')).digest()
+                if digest in seen_hashes:
+                    duplicates += 1
+                    continue
+                seen_hashes.add(digest)
+                writer.write(record)
+
+        output_path = Path(output_path)
+        if aggregate_builds:
+            builds = HeroBuildAggregate.load_merged(builds_paths)
+            builds.save(output_path.with_name(output_path.name + '.builds.npz'))
+            for example in generator.generate_build_examples(builds):
+                writer.write(example)
+        aggregate = MetaAggregate.load_merged(aggregate_paths)
+        aggregate.save(output_path.with_name(output_path.name + '.meta.npz'))
+        for example in generator.generate_meta_analysis(aggregate):
+            writer.write(example)
+        total = writer.count
+
+    print(f"Merged {len(indices)} shards ({aggregate.num_matches} matches) into {output_path}: "
+          f"{total} examples, {duplicates} duplicates dropped")
+    return total, duplicates
@@ -0,0 +1,157 @@
+"""
+CPU smoke benchmark of the training pipeline
+Runs a sampled slice of the real training data through the same tokenization,
+caching, packing and collation code as a full run, then trains a tiny randomly
+initialized model for a fixed number of steps. Reports tokenization time,
+collation time, steps/sec and memory, so data prep and formatting regressions
+show up without a GPU.
+"""
+
+import json
+import math
+import random
+import resource
+import tempfile
+import time
+from pathlib import Path
+from transformers import Trainer, TrainingArguments
+from trl.trainer.sft_trainer import DataCollatorForLanguageModeling
+import config
+try:
+    from .training_metrics import ThroughputCallback
+except ImportError:
+    from src.training_metrics import ThroughputCallback
+
+BENCHMARK_LORA_MODULES = ['q_proj', 'k_proj', 'v_proj', 'o_proj']
+
+def sample_examples(data_path, num_samples, seed=0):
+    """Uniform sample of num_samples lines from a JSONL file (reservoir sampling, one pass)"""
+    rng = random.Random(seed)
+    sample = []
+    with open(data_path, 'r', encoding='utf-8') as f:
+        for index, line in enumerate(f):
+            if index < num_samples:
+                sample.append(line)
+            else:
+                slot = rng.randint(0, index)
+                if slot < num_samples:
+                    sample[slot] = line
+    return [json.loads(line) for line in sample]
+
+def _peak_rss_mb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024  # KB on Linux
+
+def run_training_benchmark(trainer, data_path, num_samples=256, steps=20, batch_size=4, packing=False,
+                           group_by_length=False, seed=0, work_dir=None):
+    """
+    Benchmark tokenization, collation and training steps on CPU
+
+    Args:
+        trainer: DotaModelTrainer with setup_benchmark_model() and setup_lora() applied
+        data_path: JSONL training data file to sample from
+        num_samples: Examples in the sampled slice
+        steps: Optimizer steps to train (the first is reported separately as warm-up)
+        batch_size: Per-device batch size
+        packing: Pack the slice into config.MAX_LENGTH rows like --packing
+        group_by_length: Use length-grouped batches like --group-by-length
+        seed: Seed for sampling and training
+        work_dir: Directory for the sampled data, its tokenized cache and step metrics
+            (a temporary directory by default)
+
+    Returns:
+        Dict of timings, throughput and memory
+    """
+    temp_dir = None
+    if work_dir is None:
+        temp_dir = tempfile.TemporaryDirectory(prefix='dota2-benchmark-')
+        work_dir = temp_dir.name
+    work_dir = Path(work_dir)
+    work_dir.mkdir(parents=True, exist_ok=True)
+
+    try:
+        examples = sample_examples(data_path, num_samples, seed)
+        sample_path = work_dir / 'sample.jsonl'
+        with open(sample_path, 'w', encoding='utf-8') as f:
+            for example in examples:
+                f.write(json.dumps(example, ensure_ascii=False) + '\n')
+
+        # Tokenize (and pack) through the on-disk cache exactly as a training run would
+        start = time.perf_counter()
+        dataset = trainer.load_tokenized_dataset(sample_path, cache_dir=work_dir / 'tokenized', rebuild=True,
+                                                 packing=packing)
+        tokenize_seconds = time.perf_counter() - start
+
+        # Fetch rows from Arrow and collate them into padded (or padding-free) batches
+        packed = 'seq_lengths' in dataset.column_names
+        collator = DataCollatorForLanguageModeling(pad_token_id=trainer.tokenizer.pad_token_id, padding_free=packed)
+        columns = [column for column in dataset.column_names if column in ('input_ids', 'labels', 'seq_lengths')]
+        rows = dataset.select_columns(columns)
+        num_batches = math.ceil(len(rows) / batch_size)
+        start = time.perf_counter()
+        for batch_start in range(0, len(rows), batch_size):
+            collator([rows[index] for index in range(batch_start, min(batch_start + batch_size, len(rows)))])
+        collate_seconds = time.perf_counter() - start
+
+        # The SFT trainer's fused LM head needs a GPU kernel, so train with the base Trainer
+        # and the same collator
+        args = TrainingArguments(
+            output_dir=str(work_dir / 'run'),
+            max_steps=steps,
+            per_device_train_batch_size=batch_size,
+            learning_rate=config.LEARNING_RATE,
+            logging_steps=max(steps, 1),
+            save_strategy='no',
+            report_to=[],
+            use_cpu=True,
+            seed=seed,
+            remove_unused_columns=False,
+            train_sampling_strategy='group_by_length' if group_by_length else 'random',
+            length_column_name='length',
+            include_num_input_tokens_seen='non_padding',
+        )
+        metrics_dir = work_dir / 'run'
+        for name in ('throughput.jsonl', 'throughput.csv'):
+            (metrics_dir / name).unlink(missing_ok=True)
+        hf_trainer = Trainer(model=trainer.model, args=args, train_dataset=dataset, data_collator=collator,
+                             callbacks=[ThroughputCallback(metrics_dir)])
+        train_result = hf_trainer.train()
+
+        with open(metrics_dir / 'throughput.jsonl', 'r', encoding='utf-8') as f:
+            records = [json.loads(line) for line in f]
+        timed = records[1:] or records
+        step_seconds = sum(record['step_time'] for record in timed)
+        real_tokens = sum(record['real_tokens'] for record in timed)
+
+        return {
+            'examples': len(examples),
+            'rows': len(dataset),
+            'tokens': int(sum(dataset['length'])),
+            'packing': packed,
+            'group_by_length': group_by_length,
+            'batch_size': batch_size,
+            'tokenize_seconds': tokenize_seconds,
+            'tokenize_examples_per_sec': len(examples) / tokenize_seconds if tokenize_seconds else 0.0,
+            'collate_ms_per_batch': collate_seconds / num_batches * 1000 if num_batches else 0.0,
+            'steps': len(records),
+            'warmup_step_seconds': records[0]['step_time'] if records else 0.0,
+            'steps_per_sec': len(timed) / step_seconds if step_seconds else 0.0,
+            'real_tokens_per_sec': real_tokens / step_seconds if step_seconds else 0.0,
+            'data_time_share': sum(record['data_time'] for record in timed) / step_seconds if step_seconds else 0.0,
+            'train_loss': train_result.training_loss,
+            'peak_rss_mb': _peak_rss_mb(),
+        }
+    finally:
+        if temp_dir is not None:
+            temp_dir.cleanup()
+
+def print_benchmark_report(report):
+    """Print a report from run_training_benchmark"""
+    layout = 'packed rows' if report['packing'] else ('length-grouped batches' if report['group_by_length'] else 'random batches')
+    print(f"\n=== Training Benchmark ({layout}, batch size {report['batch_size']}) ===")
+    print(f"Sampled {report['examples']} examples -> {report['rows']} rows, {report['tokens']} tokens")
+    print(f"Tokenization: {report['tokenize_seconds']:.2f}s ({report['tokenize_examples_per_sec']:.0f} examples/sec)")
+    print(f"Collation: {report['collate_ms_per_batch']:.2f} ms/batch")
+    print(f"Training: {report['steps_per_sec']:.2f} steps/sec, {report['real_tokens_per_sec']:.0f} real tokens/sec "
+          f"after a {report['warmup_step_seconds']:.2f}s warm-up step ({report['data_time_share']:.1%} waiting on data)")
+    print(f"Final loss: {report['train_loss']:.4f}")
+    print(f"Peak memory (RSS): {report['peak_rss_mb']:.0f} MB")
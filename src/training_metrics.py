@@ -0,0 +1,206 @@
+"""
+Training throughput instrumentation
+A TrainerCallback that records per-step tokens/sec, samples/sec, a data
+loading / forward / backward / optimizer time split, padding ratio and peak
+memory to local JSONL and CSV files. It can also capture a torch profiler
+trace for a window of steps. Works offline and on CPU.
+"""
+
+import csv
+import json
+import resource
+import time
+from pathlib import Path
+import torch
+from transformers import TrainerCallback
+
+STEP_FIELDS = [
+    'step', 'step_time', 'data_time', 'forward_time', 'backward_time', 'optimizer_time',
+    'samples', 'tokens', 'real_tokens', 'padding_ratio', 'tokens_per_sec', 'real_tokens_per_sec',
+    'samples_per_sec', 'peak_memory_mb',
+]
+
+def _sync():
+    """Wait for queued GPU work so wall-clock boundaries are accurate"""
+    if torch.cuda.is_available():
+        torch.cuda.synchronize()
+
+def _peak_memory_mb():
+    """Peak GPU memory since the last reset, or the process's peak RSS on CPU"""
+    if torch.cuda.is_available():
+        return torch.cuda.max_memory_allocated() / 2**20
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024  # KB on Linux
+
+class ThroughputCallback(TrainerCallback):
+    def __init__(self, output_dir, profile_start=None, profile_steps=0):
+        """
+        Initialize the throughput recorder
+
+        Args:
+            output_dir: Directory for throughput.jsonl, throughput.csv and profiler traces
+            profile_start: Optimizer step at which to start a torch profiler trace (None disables)
+            profile_steps: Number of steps to capture in the trace
+        """
+        self.output_dir = Path(output_dir)
+        self.profile_start = profile_start
+        self.profile_steps = profile_steps
+        self.profiler = None
+        self.hooks = []
+        self.jsonl_file = None
+        self.csv_file = None
+        self.csv_writer = None
+        self.mark = None
+        self.data_time = 0.0
+        self._reset_step()
+
+    def _reset_step(self):
+        self.step_start = None
+        self.forward_start = None
+        self.forward_time = 0.0
+        self.optimizer_start = None
+        self.samples = 0
+        self.tokens = 0
+        self.real_tokens = 0
+
+    def _before_forward(self, module, args, kwargs):
+        # Only training forwards inside a step (not evaluation or generation)
+        if self.step_start is None or not torch.is_grad_enabled():
+            return
+        _sync()
+        self.forward_start = time.perf_counter()
+
+        # Count what the collator produced for this micro-batch
+        input_ids = kwargs.get('input_ids', args[0] if args else None)
+        if input_ids is None:
+            return
+        attention_mask = kwargs.get('attention_mask')
+        position_ids = kwargs.get('position_ids')
+        self.tokens += input_ids.numel()
+        if attention_mask is not None:
+            self.real_tokens += int(attention_mask.sum())
+            self.samples += input_ids.shape[0]
+        elif position_ids is not None:
+            # Padding-free (packed) batches have no pads and mark each example start with position 0
+            self.real_tokens += input_ids.numel()
+            self.samples += int((position_ids == 0).sum())
+        else:
+            self.real_tokens += input_ids.numel()
+            self.samples += input_ids.shape[0]
+
+    def _after_forward(self, module, args, kwargs, output):
+        if self.forward_start is not None:
+            _sync()
+            self.forward_time += time.perf_counter() - self.forward_start
+        self.forward_start = None
+
+    def on_train_begin(self, args, state, control, model=None, **kwargs):
+        if not state.is_world_process_zero:
+            return
+        self.output_dir.mkdir(parents=True, exist_ok=True)
+        self.jsonl_file = open(self.output_dir / 'throughput.jsonl', 'a', encoding='utf-8')
+        self.csv_file = open(self.output_dir / 'throughput.csv', 'a', newline='', encoding='utf-8')
+        self.csv_writer = csv.DictWriter(self.csv_file, fieldnames=STEP_FIELDS)
+        if self.csv_file.tell() == 0:
+            self.csv_writer.writeheader()
+
+        if model is not None:
+            self.hooks = [
+                model.register_forward_pre_hook(self._before_forward, with_kwargs=True),
+                model.register_forward_hook(self._after_forward, with_kwargs=True),
+            ]
+        _sync()
+        self.mark = time.perf_counter()
+
+    def on_step_begin(self, args, state, control, **kwargs):
+        if self.jsonl_file is None:
+            return
+        if self.profile_start is not None and state.global_step == self.profile_start and self.profile_steps:
+            self._start_profiler()
+
+        _sync()
+        self.step_start = time.perf_counter()
+        # Batches for the step are fetched between the previous step end and this step begin
+        self.data_time = self.step_start - self.mark if self.mark is not None else 0.0
+        if torch.cuda.is_available():
+            torch.cuda.reset_peak_memory_stats()
+
+    def on_pre_optimizer_step(self, args, state, control, **kwargs):
+        if self.step_start is None:
+            return
+        _sync()
+        self.optimizer_start = time.perf_counter()
+
+    def on_step_end(self, args, state, control, **kwargs):
+        if self.step_start is None:
+            return
+        _sync()
+        now = time.perf_counter()
+        optimizer_start = self.optimizer_start or now
+        compute_time = optimizer_start - self.step_start
+        step_time = now - self.step_start + self.data_time
+
+        record = {
+            'step': state.global_step,
+            'step_time': step_time,
+            'data_time': self.data_time,
+            'forward_time': self.forward_time,
+            # Loss computation, backward pass and gradient clipping
+            'backward_time': max(compute_time - self.forward_time, 0.0),
+            'optimizer_time': now - optimizer_start,
+            'samples': self.samples,
+            'tokens': self.tokens,
+            'real_tokens': self.real_tokens,
+            'padding_ratio': 1 - self.real_tokens / self.tokens if self.tokens else 0.0,
+            'tokens_per_sec': self.tokens / step_time if step_time else 0.0,
+            'real_tokens_per_sec': self.real_tokens / step_time if step_time else 0.0,
+            'samples_per_sec': self.samples / step_time if step_time else 0.0,
+            'peak_memory_mb': _peak_memory_mb(),
+        }
+        self.jsonl_file.write(json.dumps(record) + '\n')
+        self.jsonl_file.flush()
+        self.csv_writer.writerow(record)
+        self.csv_file.flush()
+
+        if self.profiler is not None:
+            self.profiler.step()
+            if state.global_step >= self.profile_start + self.profile_steps:
+                self._stop_profiler()
+
+        self._reset_step()
+        self.mark = time.perf_counter()
+
+    def on_log(self, args, state, control, **kwargs):
+        # Logging, saving and evaluation happen after step end; don't count them as data loading
+        self.mark = time.perf_counter()
+
+    on_save = on_log
+    on_evaluate = on_log
+
+    def on_train_end(self, args, state, control, **kwargs):
+        if self.profiler is not None:
+            self._stop_profiler()
+        for hook in self.hooks:
+            hook.remove()
+        self.hooks = []
+        if self.jsonl_file is not None:
+            self.jsonl_file.close()
+            self.csv_file.close()
+            self.jsonl_file = None
+            print(f"Throughput metrics written to {self.output_dir / 'throughput.jsonl'} and throughput.csv")
+
+    def _start_profiler(self):
+        activities = [torch.profiler.ProfilerActivity.CPU]
+        if torch.cuda.is_available():
+            activities.append(torch.profiler.ProfilerActivity.CUDA)
+        self.profiler = torch.profiler.profile(activities=activities, record_shapes=True, profile_memory=True)
+        self.profiler.__enter__()
+        print(f"Profiling steps {self.profile_start + 1}-{self.profile_start + self.profile_steps}")
+
+    def _stop_profiler(self):
+        self.profiler.__exit__(None, None, None)
+        trace_path = self.output_dir / f"trace_steps_{self.profile_start + 1}-{self.profile_start + self.profile_steps}.json"
+        self.profiler.export_chrome_trace(str(trace_path))
+        sort_by = "cuda_time_total" if torch.cuda.is_available() else "cpu_time_total"
+        print(self.profiler.key_averages().table(sort_by=sort_by, row_limit=15))
+        print(f"Profiler trace written to {trace_path} (open in chrome://tracing or Perfetto)")
+        self.profiler = None
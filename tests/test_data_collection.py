@@ -0,0 +1,154 @@
+"""
+Data collection tests on synthetic match payloads
+Everything runs offline: game constants come from small JSON files written to
+a temporary directory and matches are generated with a fixed seed.
+"""
+
+import json
+import random
+import numpy as np
+import pytest
+from src.data_collection import TrainingDataGenerator
+from src.game_constants import GameConstantsCache
+from src.meta_aggregate import MetaAggregate
+from src.sharded_collection import merge_shards, save_plan, shard_paths
+
+HEROES = {1: "Anti-Mage", 2: "Axe", 3: "Bane", 4: "Bloodseeker", 5: "Crystal Maiden", 6: "Drow Ranger",
+          7: "Earthshaker", 8: "Juggernaut", 9: "Mirana", 10: "Morphling", 11: "Shadow Fiend", 12: "Phantom Lancer"}
+ITEMS = {1: ("blink", "Blink Dagger"), 29: ("boots", "Boots of Speed"), 48: ("travel_boots", "Boots of Travel"),
+         63: ("power_treads", "Power Treads"), 116: ("black_king_bar", "Black King Bar"), 46: ("tpscroll", "Town Portal Scroll")}
+
+def make_matches(num_matches, seed=0, first_match_id=1000):
+    """Match payloads with random heroes, items and stats"""
+    rng = random.Random(seed)
+    matches = []
+    for offset in range(num_matches):
+        players = []
+        for slot in range(10):
+            player = {'hero_id': rng.choice(list(HEROES)), 'player_slot': slot if slot < 5 else 123 + slot,
+                      'kills': rng.randint(0, 15), 'deaths': rng.randint(0, 10), 'assists': rng.randint(0, 20),
+                      'gold_per_min': rng.randint(200, 800), 'xp_per_min': rng.randint(200, 900)}
+            for i in range(6):
+                player[f'item_{i}'] = rng.choice([0] + list(ITEMS))
+            for i in range(3):
+                player[f'backpack_{i}'] = rng.choice([0, 0, 46])
+            players.append(player)
+        matches.append({'match_id': first_match_id + offset, 'duration': rng.randint(900, 4000),
+                        'radiant_win': rng.random() < 0.5, 'first_blood_time': rng.randint(0, 300),
+                        'players': players})
+    return matches
+
+def read_jsonl(path):
+    with open(path, 'r', encoding='utf-8') as f:
+        return [json.loads(line) for line in f]
+
+@pytest.fixture
+def generator(tmp_path):
+    heroes_path, items_path = tmp_path / "heroes.json", tmp_path / "items.json"
+    heroes_path.write_text(json.dumps([{'id': hero_id, 'localized_name': name} for hero_id, name in HEROES.items()]))
+    items_path.write_text(json.dumps({key: {'id': item_id, 'dname': name} for item_id, (key, name) in ITEMS.items()}))
+    constants = GameConstantsCache(None, heroes_path, items_path)
+    return TrainingDataGenerator(None, constants=constants)
+
+class Interrupted(Exception):
+    pass
+
+def interrupt_after(matches, count):
+    """Yield matches, then fail like a crash after count of them"""
+    for index, match in enumerate(matches):
+        if index == count:
+            raise Interrupted
+        yield match
+
+def test_batch_analysis_matches_per_match(generator):
+    matches = make_matches(200)
+    per_match = [example for match in matches for example in generator.analyze_match_for_training(match)]
+    assert per_match
+    assert generator.analyze_matches_batch(matches) == per_match
+
+def test_batched_stream_matches_per_match_stream(generator, tmp_path):
+    matches = make_matches(50)
+    generator.stream_training_data(iter(matches), tmp_path / "single.jsonl")
+    # 50 is not a multiple of 7, so the last partial batch is covered too
+    generator.stream_training_data(iter(matches), tmp_path / "batched.jsonl", batch_size=7)
+    assert read_jsonl(tmp_path / "batched.jsonl") == read_jsonl(tmp_path / "single.jsonl")
+
+@pytest.mark.parametrize("batch_size", [1, 4])
+def test_resumed_stream_keeps_checkpointed_records_once(generator, tmp_path, batch_size):
+    matches = make_matches(60)
+    generator.stream_training_data(iter(matches), tmp_path / "complete.jsonl", fsync_every=10,
+                                   batch_size=batch_size)
+
+    output = tmp_path / "resumed.jsonl"
+    with pytest.raises(Interrupted):
+        generator.stream_training_data(interrupt_after(matches, 37), output, resume=True, fsync_every=10,
+                                       batch_size=batch_size)
+    # The checkpointed aggregate says where to pick up, as collect_data.py and run_shard do
+    collected = MetaAggregate.load(output.with_name(output.name + '.meta.npz')).num_matches
+    assert 0 < collected < 37
+    generator.stream_training_data(iter(matches[collected:]), output, resume=True, fsync_every=10,
+                                   batch_size=batch_size)
+
+    assert read_jsonl(output) == read_jsonl(tmp_path / "complete.jsonl")
+
+def test_sharded_build_aggregates_match_single_run(generator, tmp_path):
+    matches = make_matches(300)
+    generator.stream_training_data(iter(matches), tmp_path / "single.jsonl", aggregate_builds=True)
+
+    shard_dir = tmp_path / "shards"
+    save_plan(shard_dir, [{'index': index} for index in range(3)], min_rank=5, aggregate_builds=True)
+    for index in range(3):
+        generator.stream_training_data(iter(matches[index::3]), shard_paths(shard_dir, index)['output'],
+                                       include_aggregates=False, aggregate_builds=True)
+    merge_shards(shard_dir, tmp_path / "merged.jsonl", generator)
+
+    single = read_jsonl(tmp_path / "single.jsonl")
+    merged = read_jsonl(tmp_path / "merged.jsonl")
+    assert any(example['instruction'].startswith("What items should I build on") for example in merged)
+    assert sorted(map(json.dumps, merged)) == sorted(map(json.dumps, single))
+
+def test_merge_reads_only_checkpointed_shard_records(generator, tmp_path):
+    shard_dir = tmp_path / "shards"
+    save_plan(shard_dir, [{'index': 0}], min_rank=5)
+    output = shard_paths(shard_dir, 0)['output']
+    generator.stream_training_data(iter(make_matches(20)), output, include_aggregates=False)
+    committed = read_jsonl(output)
+
+    # A shard that crashed mid-write: records after its checkpoint and a torn last line
+    with open(output, 'a', encoding='utf-8') as f:
+        f.write(json.dumps({'instruction': "uncommitted", 'output': "x"}) + '\n')
+        f.write('{"instruction": "torn')
+    merge_shards(shard_dir, tmp_path / "merged.jsonl", generator)
+
+    merged = read_jsonl(tmp_path / "merged.jsonl")
+    assert merged[:len(committed)] == committed
+    assert not any(example['instruction'] == "uncommitted" for example in merged)
+
+def assert_same_aggregate(left, right):
+    size = max(len(left.hero_picks), len(right.hero_picks))
+    for name in ('hero_picks', 'hero_wins'):
+        left_counts, right_counts = getattr(left, name), getattr(right, name)
+        assert (np.pad(left_counts, (0, size - len(left_counts))) == np.pad(right_counts, (0, size - len(right_counts)))).all()
+    assert (left.duration_minutes == right.duration_minutes).all()
+    for name in ('duration_total', 'first_blood_total', 'first_blood_count', 'num_matches'):
+        assert getattr(left, name) == getattr(right, name)
+
+def test_merged_aggregates_equal_one_aggregate_over_all_matches(tmp_path):
+    matches = make_matches(90)
+    # A hero ID past the initial array size makes one part grow its arrays
+    matches[50]['players'][0]['hero_id'] = 300
+    matches[60]['first_blood_time'] = 0
+
+    union = MetaAggregate()
+    for match in matches:
+        union.update(match)
+
+    paths = []
+    for index, part in enumerate([matches[:20], matches[20:55], matches[55:], []]):
+        aggregate = MetaAggregate()
+        for match in part:
+            aggregate.update(match)
+        paths.append(tmp_path / f"part_{index}.meta.npz")
+        aggregate.save(paths[-1])
+
+    assert_same_aggregate(MetaAggregate.load_merged(paths), union)
@@ -0,0 +1,94 @@
+"""
+Generation tests on a tiny randomly initialized Mistral
+The batcher, prefix cache and chat session all build KV caches by hand, so
+their greedy output is checked against plain model.generate on the same
+prompts. Runs on CPU in a few seconds; only the committed tokenizer is needed.
+"""
+
+import time
+from pathlib import Path
+import pytest
+import torch
+from transformers import AutoTokenizer, MistralConfig, MistralForCausalLM
+from src import inference
+from src.chat_session import ChatSession, load_chat_template
+from src.continuous_batching import ContinuousBatcher
+from src.prefix_cache import PromptPrefixCache
+
+MODEL_DIR = Path(__file__).resolve().parent.parent / "models" / "mistral-nemo-dota2"
+QUESTIONS = [
+    "How do I play Pudge?",
+    "What items should I build on Anti-Mage against Axe?",
+    "bot lane carries?",
+    "What is stacking and why does it matter for supports in the mid game?",
+    "Hi",
+]
+MAX_NEW_TOKENS = 12
+
+@pytest.fixture(scope="module")
+def tiny_model():
+    tokenizer = AutoTokenizer.from_pretrained(MODEL_DIR)
+    tokenizer.pad_token = tokenizer.eos_token
+    load_chat_template(tokenizer, MODEL_DIR)
+    torch.manual_seed(0)
+    model = MistralForCausalLM(MistralConfig(
+        vocab_size=len(tokenizer), hidden_size=128, intermediate_size=256, num_hidden_layers=2,
+        num_attention_heads=4, num_key_value_heads=2, initializer_range=0.2,
+        bos_token_id=tokenizer.bos_token_id, eos_token_id=tokenizer.eos_token_id,
+        pad_token_id=tokenizer.pad_token_id,
+    )).eval()
+    return model, tokenizer
+
+@pytest.fixture
+def greedy(monkeypatch):
+    monkeypatch.setitem(inference.DEFAULT_GENERATION, 'do_sample', False)
+    monkeypatch.setitem(inference.DEFAULT_GENERATION, 'max_new_tokens', MAX_NEW_TOKENS)
+
+def generate_greedy(model, tokenizer, prompt_ids, max_new_tokens):
+    input_ids = torch.tensor([prompt_ids])
+    output = model.generate(input_ids, attention_mask=torch.ones_like(input_ids), max_new_tokens=max_new_tokens,
+                            do_sample=False, repetition_penalty=inference.DEFAULT_GENERATION['repetition_penalty'],
+                            pad_token_id=tokenizer.eos_token_id)
+    return output[0, len(prompt_ids):].tolist()
+
+@pytest.mark.parametrize("use_prefix_cache", [False, True])
+def test_batcher_matches_serial_generate(tiny_model, greedy, use_prefix_cache):
+    model, tokenizer = tiny_model
+    prompts = [inference.encode_prompt(tokenizer, question) for question in QUESTIONS]
+    # Different lengths make rows leave the batch while others keep decoding
+    lengths = [MAX_NEW_TOKENS - i for i in range(len(prompts))]
+    expected = [generate_greedy(model, tokenizer, prompt, length) for prompt, length in zip(prompts, lengths)]
+
+    prefix_cache = PromptPrefixCache(model, tokenizer) if use_prefix_cache else None
+    batcher = ContinuousBatcher(model, tokenizer, max_batch_size=3, prefix_cache=prefix_cache).start()
+    try:
+        requests = []
+        for i, (prompt, length) in enumerate(zip(prompts, lengths)):
+            # Staggered, so later prompts are merged into a batch that is already decoding
+            requests.append(batcher.submit(prompt, max_new_tokens=length, do_sample=False))
+            time.sleep(0.01 * i)
+        for request in requests:
+            request.wait(60)
+    finally:
+        batcher.stop()
+
+    for request, tokens in zip(requests, expected):
+        # generate() stops at EOS too, so compare up to where either stopped
+        assert request.generated_ids == tokens[:len(request.generated_ids)]
+        assert len(request.generated_ids) == len(tokens)
+    if use_prefix_cache:
+        assert batcher.stats()['prefix_tokens_reused'] > 0
+
+def test_chat_session_matches_full_prefill(tiny_model, greedy):
+    model, tokenizer = tiny_model
+    session = ChatSession(model, tokenizer, system_prompt="You are a Dota 2 coach.", max_context=4096)
+    for question in ["How do I play Pudge?", "What items after Blink?", "And against Anti-Mage?"]:
+        answer = "".join(session.ask(question))
+
+        # Same conversation rendered and prefilled from scratch
+        reference = ChatSession(model, tokenizer, system_prompt=session.system_prompt, max_context=4096)
+        reference.turns = list(session.turns[:-1])
+        prompt_ids = reference._encode(session.turns[-1][0])
+        tokens = generate_greedy(model, tokenizer, prompt_ids, MAX_NEW_TOKENS)
+        assert answer == tokenizer.decode(tokens, skip_special_tokens=True).strip()
+    assert session.last_timings['reused_tokens'] > 0
@@ -0,0 +1,48 @@
+"""
+Training path tests on a tiny randomly initialized Mistral
+Runs train_model, and so SFTConfig and SFTTrainer, for real on CPU. Only the
+committed tokenizer is needed.
+"""
+
+import json
+import random
+from pathlib import Path
+import pytest
+import transformers
+import trl
+import config
+from src.model_training import DotaModelTrainer
+
+MODEL_DIR = Path(__file__).resolve().parent.parent / "models" / "mistral-nemo-dota2"
+CPU_TRAINING = {'use_cpu': True, 'optim': 'adamw_torch', 'report_to': []}
+
+@pytest.fixture
+def training_data(tmp_path):
+    rng = random.Random(0)
+    data_path = tmp_path / "train.jsonl"
+    with open(data_path, 'w', encoding='utf-8') as f:
+        for i in range(32):
+            example = {'instruction': f"How do I play hero {i}?", 'output': " ".join(["farm"] * rng.randint(5, 40))}
+            f.write(json.dumps(example) + '\n')
+    return data_path
+
+@pytest.fixture
+def cpu_trainer(monkeypatch):
+    monkeypatch.setattr(config, 'MAX_LENGTH', 256)
+    # SFTTrainer's loss always goes through a fused Triton kernel that needs a GPU; the base
+    # Trainer loss is the same cross-entropy on the model's logits
+    monkeypatch.setattr(trl.SFTTrainer, 'compute_loss', transformers.Trainer.compute_loss)
+    trainer = DotaModelTrainer(model_name=str(MODEL_DIR), completion_only=False)
+    trainer.setup_benchmark_model(hidden_size=64, num_layers=1)
+    trainer.setup_lora(target_modules=['q_proj', 'v_proj'])
+    return trainer
+
+def test_train_model_with_packed_dataset(cpu_trainer, training_data, tmp_path):
+    dataset = cpu_trainer.load_tokenized_dataset(training_data, cache_dir=tmp_path / "cache", packing=True)
+    assert "seq_lengths" in dataset.column_names
+
+    trainer = cpu_trainer.train_model(dataset, output_dir=tmp_path / "run", max_steps=2, throughput_metrics=False,
+                                      save_every_minutes=0, training_overrides=CPU_TRAINING)
+    assert trainer.state.global_step == 2
+    assert trainer.args.padding_free and trainer.args.max_length is None
+    assert (tmp_path / "run" / "adapter_config.json").exists()